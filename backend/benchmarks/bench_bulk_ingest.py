@@ -0,0 +1,86 @@
+"""
+Пропускная способность сохранения результатов: по одной записи (save_burnout_test_result,
+отдельный INSERT и транзакция на запись, как в /api/submit_results) против пакетной загрузки
+через COPY (save_burnout_test_results_bulk, как в /api/submit_results/batch). LLM не вызывается.
+
+Тестовые записи и их вклад в ежедневные агрегаты удаляются после замера.
+Запуск из каталога backend (нужна БД из .env):
+    python -m benchmarks.bench_bulk_ingest --records 2000 --batch-size 500
+"""
+import argparse
+import random
+import time
+
+from db_utils import get_connection, save_burnout_test_result, save_burnout_test_results_bulk
+from rollups import ROLLUP_TABLE, ROLLUP_UPSERT_SQL
+
+
+def make_records(user_ids, count: int):
+    records = []
+    for _ in range(count):
+        times = [random.randint(200, 600) for _ in range(random.randint(5, 10))]
+        records.append({
+            "user_id": random.choice(user_ids),
+            "scores": {
+                "exhaustion": random.randint(0, 54),
+                "depersonalization": random.randint(0, 30),
+                "achievement": random.randint(0, 48),
+                "burnout": round(random.random(), 4),
+                "reaction_avg": sum(times) / len(times),
+            },
+            "verdict": None,
+            "reaction_times": times,
+        })
+    return records
+
+
+def cleanup(first_id: int):
+    """
+    Удаляет тесты с id > first_id и пересобирает агрегаты за затронутые дни.
+    """
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT DISTINCT test_datetime::date FROM burnout_tests WHERE id > %s", [first_id])
+        days = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM burnout_tests WHERE id > %s", [first_id])
+        cursor.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE day = ANY(%s)", [days])
+        cursor.execute("SELECT id FROM burnout_tests WHERE test_datetime::date = ANY(%s)", [days])
+        cursor.execute(ROLLUP_UPSERT_SQL, ([row[0] for row in cursor.fetchall()],))
+        connection.commit()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--records", type=int, default=2000)
+    arg_parser.add_argument("--batch-size", type=int, default=500)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    random.seed(args.seed)
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT id FROM employees")
+        user_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM burnout_tests")
+        first_id = cursor.fetchone()[0]
+    records = make_records(user_ids, args.records)
+
+    try:
+        started = time.perf_counter()
+        for record in records:
+            save_burnout_test_result(record["user_id"], record["scores"], {"score": None}, record["reaction_times"])
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for offset in range(0, len(records), args.batch_size):
+            if save_burnout_test_results_bulk(records[offset:offset + args.batch_size]) is None:
+                raise RuntimeError("пакетное сохранение не удалось")
+        bulk = time.perf_counter() - started
+    finally:
+        cleanup(first_id)
+
+    print(f"Записей: {args.records}, размер пакета: {args.batch_size}")
+    print(f"по одной: {single:7.2f} с, {args.records / single:8.0f} записей/с")
+    print(f"пакетами: {bulk:7.2f} с, {args.records / bulk:8.0f} записей/с ({single / bulk:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
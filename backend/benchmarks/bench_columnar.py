@@ -0,0 +1,168 @@
+"""
+Задержка запросов дашборда (get_burnout_timeseries): SQL (с агрегатами burnout_daily_rollups
+и без них) против снимка тестов в памяти (ColumnarSnapshot). Для каждого набора фильтров
+проверяется, что ответы совпадают.
+
+С --rows в burnout_tests предварительно добавляются синтетические тесты за последние два года
+(удаляются вместе с их вкладом в агрегаты после замера). Дополнительно выводится объем снимка
+на миллион тестов и время догрузки новых тестов и проверяется, что тест из транзакции,
+зафиксированной после тестов с большими id, попадает в снимок. Запуск из каталога backend:
+    python -m benchmarks.bench_columnar --rows 200000 --repeat 20
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import math
+import random
+import statistics
+import sys
+import time
+
+import db_utils
+from benchmarks.bench_bulk_ingest import cleanup, make_records
+from db_utils import get_burnout_timeseries, get_connection, save_burnout_test_results_bulk
+
+ALL = ['exhaustion', 'depersonalization', 'achievement', 'burnout_score', 'mean_reaction_time_ms']
+
+
+def cases(cities, departments):
+    year_ago = (datetime.date.today() - datetime.timedelta(days=365)).isoformat()
+    return {
+        "все тесты, сырые": dict(characteristic=ALL),
+        "год, неделя, mean": dict(characteristic=ALL, start_date=year_ago, bucket='week'),
+        "город, месяц, mean+count": dict(
+            characteristic=['burnout_score'], cities=cities[:2], bucket='month', aggregations=['mean', 'count']
+        ),
+        "отдел, возраст, день, std+p90": dict(
+            characteristic=['exhaustion', 'burnout_score'], departments=departments[:1],
+            min_age=25, max_age=45, bucket='day', aggregations=['std', 'p90']
+        ),
+        "год, 200 точек": dict(characteristic=['burnout_score'], start_date=year_ago, max_points=200),
+    }
+
+
+def same(left, right) -> bool:
+    if left is None or right is None or left.keys() != right.keys():
+        return False
+    for name in left:
+        if len(left[name]) != len(right[name]):
+            return False
+        for a, b in zip(left[name], right[name]):
+            if a is None or b is None:
+                if a is not b:
+                    return False
+            elif isinstance(a, float) or isinstance(b, float):
+                if not math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-9):
+                    return False
+            elif a != b:
+                return False
+    return True
+
+
+def query(params):
+    # get_burnout_timeseries печатает параметры каждого запроса
+    with contextlib.redirect_stdout(io.StringIO()):
+        return get_burnout_timeseries(**params)
+
+
+def median_ms(params, repeat: int) -> float:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        query(params)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return statistics.median(latencies)
+
+
+def insert_rows(count: int):
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT id FROM employees")
+        user_ids = [row[0] for row in cursor.fetchall()]
+    now = datetime.datetime.now()
+    for offset in range(0, count, 10000):
+        records = make_records(user_ids, min(10000, count - offset))
+        for record in records:
+            record["test_datetime"] = now - datetime.timedelta(seconds=random.randint(0, 2 * 365 * 86400))
+        if save_burnout_test_results_bulk(records) is None:
+            raise RuntimeError("не удалось добавить синтетические тесты")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--rows", type=int, default=0)
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    random.seed(args.seed)
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM burnout_tests")
+        first_id = cursor.fetchone()[0]
+        cursor.execute("SELECT DISTINCT city FROM employees WHERE city IS NOT NULL ORDER BY 1")
+        cities = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT DISTINCT department FROM employees WHERE department IS NOT NULL ORDER BY 1")
+        departments = [row[0] for row in cursor.fetchall()]
+
+    snapshot = db_utils.columnar_snapshot
+    ok = True
+    try:
+        insert_rows(args.rows)
+        snapshot.refresh_interval = 3600
+        started = time.perf_counter()
+        snapshot.refresh(full=True)
+        stats = snapshot.stats()
+        print(
+            f"снимок: {stats['rows']} тестов, {stats['bytes'] / 1024 / 1024:.1f} МБ, "
+            f"{stats['bytes_per_row']} байт/тест, {stats['mb_per_million_rows']} МБ на 1 млн тестов, "
+            f"полная загрузка {time.perf_counter() - started:.2f} с"
+        )
+
+        print(f"{'запрос':<32} {'SQL':>9} {'агрегаты':>9} {'снимок':>9}  совпадает")
+        for name, params in cases(cities, departments).items():
+            timings = {}
+            results = {}
+            for mode, use_rollups, columnar in (('sql', False, False), ('rollups', True, False), ('columnar', False, True)):
+                db_utils.USE_ROLLUPS = use_rollups
+                snapshot.enabled = columnar
+                results[mode] = query(params)
+                timings[mode] = median_ms(params, args.repeat)
+            matches = same(results['sql'], results['columnar'])
+            ok = ok and matches
+            print(
+                f"{name:<32} {timings['sql']:7.2f}мс {timings['rollups']:7.2f}мс "
+                f"{timings['columnar']:7.3f}мс  {matches}"
+            )
+
+        # Догрузка: новые тесты появляются в снимке при следующем обновлении
+        before = snapshot.stats()['rows']
+        insert_rows(100)
+        snapshot.refresh()
+        stats = snapshot.stats()
+        loaded = stats['rows'] - before
+        print(f"догрузка {loaded} новых тестов: {stats['refresh_ms_last']:.1f} мс")
+        ok = ok and loaded == 100
+
+        # Транзакция получила id раньше пачки из 2000 тестов, но фиксируется после нее
+        before = snapshot.stats()['rows']
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO burnout_tests (user_id, test_datetime, burnout_score) "
+                "SELECT MIN(id), localtimestamp, 0.5 FROM employees"
+            )
+            insert_rows(2000)
+            snapshot.refresh()
+            connection.commit()
+        snapshot.refresh()
+        late = snapshot.stats()['rows'] - before
+        print(f"тест, зафиксированный после 2000 тестов с большими id: загружено {late} из 2001")
+        ok = ok and late == 2001
+    finally:
+        cleanup(first_id)
+
+    print("ok" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
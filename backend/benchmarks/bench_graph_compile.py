@@ -0,0 +1,59 @@
+"""
+Микро-бенчмарк накладных расходов на запрос при сборке LangGraph.
+
+"До": на каждый запрос собирается и компилируется новый StateGraph,
+а в узле LLM заново создается PydanticOutputParser и его инструкции.
+"После": граф берется из кэша get_graph, инструкции посчитаны при импорте.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_graph_compile --iterations 200
+"""
+import argparse
+import statistics
+import time
+
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.output_parsers import PydanticOutputParser
+
+from graph.answer_schema import LLMResponse
+from graph.graph import create, get_graph
+
+
+def per_request_before(llm):
+    graph = create(llm)
+    PydanticOutputParser(pydantic_object=LLMResponse).get_format_instructions()
+    return graph
+
+
+def per_request_after(llm):
+    return get_graph("bench", llm)
+
+
+def measure(func, llm, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func(llm)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--iterations", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    llm = FakeListLLM(responses=['{"recommendation": "ok", "score": 0}'])
+    # Первый вызов заполняет кэш, как это делает lifespan при старте
+    get_graph("bench", llm)
+
+    for name, func in (("до (create на запрос)", per_request_before), ("после (get_graph)", per_request_after)):
+        timings = measure(func, llm, args.iterations)
+        print(
+            f"{name:<24} медиана {statistics.median(timings):8.3f} мс, "
+            f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:8.3f} мс"
+        )
+
+
+if __name__ == "__main__":
+    main()
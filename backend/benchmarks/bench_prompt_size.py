@@ -0,0 +1,102 @@
+"""
+Размер промпта submit_results до и после сжатия входных данных (graph/features.py).
+
+"До": в промпт подставляется repr сырых структур - вложенные проекты из
+generate_project_data(4, 10, 10, 15), столбцы последних тестов и полный профиль.
+"После": компактные сводки активности, истории тестов и изменений показателей.
+Данные сотрудников берутся из БД (.env, DATASOURCE_*). Токены считаются токенизатором
+--tokenizer (модель Hugging Face), иначе приближенно. Запуск из каталога backend:
+    python -m benchmarks.bench_prompt_size --users 20
+"""
+import argparse
+import random
+import statistics
+
+from db_utils import PROMPT_PROFILE_COLUMNS, get_user_burnout_stats, get_user_profile
+from graph.config import prompt_template
+from graph.features import (
+    activity_features, averages_features, compact_profile, current_test_features, estimate_tokens,
+    history_features, to_prompt
+)
+from graph.graph import format_instructions
+from graph.tasks_generation import generate_project_data
+
+SCORES = {
+    "exhaustion": 31, "depersonalization": 14, "achievement": 22,
+    "burnout": 0.62, "reaction_avg": 412, "cognitive_index": 71,
+}
+
+
+def raw_prompt(user_data, prev_results, avg_results, projects) -> str:
+    return prompt_template.format(
+        user_data=user_data,
+        prev_test_resulst=prev_results,
+        test_results=SCORES,
+        user_work_data=projects,
+        avg_results=avg_results,
+        instructions=format_instructions,
+    )
+
+
+def compact_prompt(user_data, prev_results, avg_results, projects) -> str:
+    history = history_features(prev_results)
+    averages = averages_features(avg_results)
+    return prompt_template.format(
+        user_data=to_prompt(compact_profile(user_data)),
+        prev_test_resulst=to_prompt(history),
+        test_results=to_prompt(current_test_features(SCORES, history, averages)),
+        user_work_data=to_prompt(activity_features(projects)),
+        avg_results=to_prompt(averages),
+        instructions=format_instructions,
+    )
+
+
+class TokenizerLLM:
+    """
+    Обертка, позволяющая estimate_tokens использовать токенизатор без загрузки модели.
+    """
+
+    def __init__(self, tokenizer):
+        self.pipeline = type("Pipeline", (), {"tokenizer": tokenizer})()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--users", type=int, default=20)
+    arg_parser.add_argument("--tokenizer", default=None, help="имя модели Hugging Face для подсчета токенов")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    llm = None
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        llm = TokenizerLLM(AutoTokenizer.from_pretrained(args.tokenizer))
+
+    random.seed(args.seed)
+    sizes = {"до": [], "после": []}
+    for user_id in range(1, args.users + 1):
+        user_data = get_user_profile(user_id, PROMPT_PROFILE_COLUMNS)
+        if user_data is None:
+            continue
+        prev_results, avg_results = get_user_burnout_stats(user_id)
+        projects = generate_project_data(4, 10, 10, 15)
+        for name, build in (("до", raw_prompt), ("после", compact_prompt)):
+            prompt = build(user_data, prev_results, avg_results, projects)
+            sizes[name].append((len(prompt), estimate_tokens(llm, prompt)))
+
+    counting = args.tokenizer or "оценка ~4 символа на токен"
+    print(f"Промптов: {len(sizes['до'])}, токены: {counting}")
+    for name, values in sizes.items():
+        chars = [value[0] for value in values]
+        tokens = [value[1] for value in values]
+        print(
+            f"{name:>6}: символов {statistics.mean(chars):>8.0f}, "
+            f"токенов среднее {statistics.mean(tokens):>7.0f}, максимум {max(tokens):>6}"
+        )
+    before = statistics.mean(value[1] for value in sizes["до"])
+    after = statistics.mean(value[1] for value in sizes["после"])
+    print(f"Сокращение промпта: {before / after:.1f}x ({100 * (1 - after / before):.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
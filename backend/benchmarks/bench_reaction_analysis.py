@@ -0,0 +1,81 @@
+"""
+Пересчет метрик теста реакции: векторизованный analyze по матрице попыток
+против построчного расчета на Python-списках (как при чтении real[] в список на каждую строку).
+
+Попытки генерируются синтетически: логнормальное время реакции, доля предвосхищений
+и медленных попыток, рост времени к концу теста. Запуск из каталога backend:
+    python -m benchmarks.bench_reaction_analysis --tests 200000
+"""
+import argparse
+import math
+import statistics
+import time
+
+import numpy as np
+
+from reaction_analysis import (
+    REACTION_LAPSE_MS, REACTION_MIN_MS, REACTION_OUTLIER_MAD, TRIAL_DTYPE, analyze, unpack_matrix
+)
+
+
+def generate(tests: int, rng: np.random.Generator):
+    lengths = rng.integers(5, 11, size=tests)
+    total = int(lengths.sum())
+    trial_index = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    times = rng.lognormal(math.log(300), 0.25, size=total) + trial_index * rng.normal(5, 3, size=total)
+    times[rng.random(total) < 0.02] = rng.uniform(40, 100)
+    times[rng.random(total) < 0.03] *= 3
+    return times.astype(TRIAL_DTYPE).tobytes(), lengths
+
+
+def analyze_row(times):
+    present = list(times)
+    lapses = sum(1 for t in present if t > REACTION_LAPSE_MS)
+    valid = [t for t in present if t >= REACTION_MIN_MS]
+    if not valid:
+        return None, None, None, lapses
+    median = statistics.median(valid)
+    mad = statistics.median(abs(t - median) for t in valid) * 1.4826
+    kept = [
+        (i, t) for i, t in enumerate(present)
+        if t >= REACTION_MIN_MS and not (mad > 0 and abs(t - median) > REACTION_OUTLIER_MAD * mad)
+    ]
+    values = [t for _, t in kept]
+    mean = sum(values) / len(values)
+    sd = math.sqrt(sum((t - mean) ** 2 for t in values) / len(values))
+    index_mean = sum(i for i, _ in kept) / len(kept)
+    denominator = sum((i - index_mean) ** 2 for i, _ in kept)
+    slope = sum((i - index_mean) * (t - mean) for i, t in kept) / denominator if denominator else None
+    return mean, sd, slope, lapses
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--tests", type=int, default=200000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    blob, lengths = generate(args.tests, np.random.default_rng(args.seed))
+    print(f"Тестов: {args.tests}, попыток: {int(lengths.sum())}, упаковано: {len(blob) / 1024 / 1024:.1f} МБ")
+
+    started = time.perf_counter()
+    metrics = analyze(unpack_matrix(blob, lengths))
+    vectorized = time.perf_counter() - started
+
+    started = time.perf_counter()
+    values = np.frombuffer(blob, dtype=TRIAL_DTYPE).tolist()
+    rows = []
+    offset = 0
+    for length in lengths.tolist():
+        rows.append(analyze_row(values[offset:offset + length]))
+        offset += length
+    per_row = time.perf_counter() - started
+
+    means = np.array([row[0] for row in rows], dtype=float)
+    matches = np.allclose(means, metrics['reaction_trimmed_mean_ms'], equal_nan=True, rtol=1e-6)
+    print(f"построчно:      {per_row:8.2f} с")
+    print(f"векторизованно: {vectorized:8.2f} с ({per_row / vectorized:.0f}x), результаты совпадают: {matches}")
+
+
+if __name__ == "__main__":
+    main()
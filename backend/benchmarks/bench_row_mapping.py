@@ -0,0 +1,78 @@
+"""
+Сравнение pandas.read_sql и курсорного слоя db_utils (fetch_one / fetch_columns)
+на выборках из 1, 1 000 и 1 000 000 строк.
+
+Строки генерируются на стороне PostgreSQL через generate_series, поэтому нужна
+только доступная БД из .env (DATASOURCE_*). Запуск из каталога backend:
+    python -m benchmarks.bench_row_mapping --repeat 5
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+import warnings
+
+import pandas as pd
+
+from db_utils import fetch_columns, fetch_one, get_connection
+
+QUERY = """
+SELECT
+    g AS id,
+    g % 1000 AS user_id,
+    NOW() - g * INTERVAL '1 minute' AS test_datetime,
+    (g % 54) AS exhaustion,
+    (g % 30) AS depersonalization,
+    (g % 48) AS achievement,
+    (g % 4400) / 100.0 AS burnout_score,
+    250 + (g % 500) * 1.1 AS mean_reaction_time_ms
+FROM generate_series(1, %s) AS g
+"""
+
+
+def pandas_path(connection, rows: int):
+    frame = pd.read_sql(QUERY, connection, params=[rows])
+    if rows == 1:
+        return frame.to_dict('records')[0]
+    return frame.to_dict('list')
+
+
+def cursor_path(connection, rows: int):
+    if rows == 1:
+        return fetch_one(connection, QUERY, [rows])
+    return fetch_columns(connection, QUERY, [rows])
+
+
+def measure(func, connection, rows: int, repeat: int):
+    timings = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        started = time.perf_counter()
+        func(connection, rows)
+        timings.append((time.perf_counter() - started) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return statistics.median(timings), peak / (1024 * 1024)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1, 1_000, 1_000_000])
+    args = arg_parser.parse_args()
+
+    # pandas предупреждает о DBAPI2-соединении вместо SQLAlchemy - для замера это не важно
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    print(f"{'строк':>10} | {'pandas, мс':>12} | {'курсор, мс':>12} | {'pandas, МБ':>11} | {'курсор, МБ':>11}")
+    with get_connection() as connection:
+        for rows in args.sizes:
+            repeat = 1 if rows >= 1_000_000 else args.repeat
+            pandas_ms, pandas_mb = measure(pandas_path, connection, rows, repeat)
+            cursor_ms, cursor_mb = measure(cursor_path, connection, rows, repeat)
+            print(f"{rows:>10} | {pandas_ms:>12.2f} | {cursor_ms:>12.2f} | {pandas_mb:>11.1f} | {cursor_mb:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
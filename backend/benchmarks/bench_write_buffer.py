@@ -0,0 +1,173 @@
+"""
+Задержка сохранения результата теста на пути запроса: прямая запись (save_burnout_test_result,
+транзакция на запись) против буфера отложенной записи (WriteBehindBuffer со сбросом пачками
+через save_burnout_test_results_bulk). Записи отправляются из --threads потоков одновременно.
+
+Дополнительно проверяется восстановление: записи, добавленные в буфер при недоступной БД,
+остаются в сегментах на диске и сохраняются новым экземпляром буфера после "перезапуска";
+запись, которую БД отклоняет, переносится в deadletter-файл и не мешает сохранить остальные;
+при заполненном буфере add ждет сброса (max_pending) и по истечении add_timeout выбрасывает ошибку.
+Тестовые записи и их вклад в агрегаты удаляются. Запуск из каталога backend:
+    python -m benchmarks.bench_write_buffer --records 2000 --threads 16
+"""
+import argparse
+import glob
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_bulk_ingest import cleanup, make_records
+from db_utils import get_connection, save_burnout_test_result, save_burnout_test_results_bulk
+from write_buffer import WriteBehindBuffer
+
+
+def buffered_record(record):
+    return {**record, "test_datetime": None}
+
+
+def measure(save, records, threads: int):
+    def timed(record):
+        started = time.perf_counter()
+        save(record)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(timed, records))
+    return latencies, time.perf_counter() - started
+
+
+def report(name: str, latencies, elapsed: float):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<12} p50 {statistics.median(latencies):7.2f} мс, p95 {p95:7.2f} мс, "
+        f"{len(latencies) / elapsed:7.0f} записей/с"
+    )
+
+
+def count_tests(first_id: int) -> int:
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM burnout_tests WHERE id > %s", [first_id])
+        return cursor.fetchone()[0]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--records", type=int, default=2000)
+    arg_parser.add_argument("--threads", type=int, default=16)
+    arg_parser.add_argument("--max-records", type=int, default=200)
+    arg_parser.add_argument("--max-delay-ms", type=float, default=100)
+    args = arg_parser.parse_args()
+
+    random.seed(0)
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT id FROM employees")
+        user_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM burnout_tests")
+        first_id = cursor.fetchone()[0]
+    records = make_records(user_ids, args.records)
+    spill_dir = tempfile.mkdtemp(prefix="write_buffer_")
+
+    try:
+        latencies, elapsed = measure(
+            lambda record: save_burnout_test_result(
+                record["user_id"], record["scores"], {"score": None}, record["reaction_times"]
+            ),
+            records, args.threads
+        )
+        report("напрямую", latencies, elapsed)
+
+        buffer = WriteBehindBuffer(
+            save_burnout_test_results_bulk, spill_dir,
+            max_records=args.max_records, max_delay=args.max_delay_ms / 1000
+        )
+        buffer.start()
+        latencies, elapsed = measure(lambda record: buffer.add(buffered_record(record)), records, args.threads)
+        buffer.close()
+        report("через буфер", latencies, elapsed)
+        stats = buffer.stats()
+        print(
+            f"сбросов: {stats['flushes']}, записей: {stats['flushed_records']}, "
+            f"макс. глубина: {stats['max_depth']}, сброс: {stats['flush_ms']}"
+        )
+
+        # Восстановление: БД "недоступна", процесс завершается без close
+        crashed = WriteBehindBuffer(lambda batch: None, spill_dir, max_records=10**9, max_delay=3600)
+        crashed.start()
+        for record in records[:100]:
+            crashed.add(buffered_record(record))
+        before = count_tests(first_id)
+
+        restarted = WriteBehindBuffer(save_burnout_test_results_bulk, spill_dir, max_delay=0.05)
+        restarted.start()
+        restarted.close()
+        recovered = count_tests(first_id) - before
+        print(f"восстановлено после сбоя: {restarted.stats()['recovered']}, сохранено в БД: {recovered}")
+
+        # Отклоненная запись: недопустимый verdict_source нарушает CHECK в burnout_tests
+        poisoned = [buffered_record(record) for record in records[:50]]
+        poisoned[25] = {**poisoned[25], "verdict": 1, "verdict_source": "bad"}
+        before = count_tests(first_id)
+        buffer = WriteBehindBuffer(save_burnout_test_results_bulk, spill_dir, max_records=50, max_delay=0.05)
+        buffer.start()
+        for record in poisoned:
+            buffer.add(record)
+        buffer.close()
+        saved = count_tests(first_id) - before
+        dead_lettered = buffer.stats()["dead_lettered"]
+        dead_letter_lines = sum(
+            len(open(path, encoding="utf-8").readlines())
+            for path in glob.glob(os.path.join(spill_dir, "deadletter-*.jsonl"))
+        )
+        print(f"с отклоненной записью: сохранено {saved} из 50, в deadletter: {dead_lettered} ({dead_letter_lines} в файле)")
+
+        # Обратное давление: медленный сброс, в буфере не больше max_pending записей
+        def slow_flush(batch):
+            time.sleep(0.05)
+            return []
+
+        buffer = WriteBehindBuffer(
+            slow_flush, tempfile.mkdtemp(prefix="write_buffer_"), max_records=10, max_delay=0.01, max_pending=20
+        )
+        buffer.start()
+        measure(buffer.add, [{"n": n} for n in range(200)], 8)
+        buffer.close()
+        pressure = buffer.stats()
+
+        # БД недоступна: add ждет add_timeout и сообщает об ошибке
+        stalled = WriteBehindBuffer(
+            lambda batch: None, tempfile.mkdtemp(prefix="write_buffer_"),
+            max_records=10**9, max_delay=3600, max_pending=5, add_timeout=0.2
+        )
+        stalled.start()
+        timed_out = False
+        try:
+            for n in range(6):
+                stalled.add({"n": n})
+        except TimeoutError:
+            timed_out = True
+        print(
+            f"обратное давление: макс. глубина {pressure['max_depth']} при max_pending 20, "
+            f"ожиданий {pressure['backpressure_waits']}, тайм-аут при недоступной БД: {timed_out}"
+        )
+
+        ok = (
+            stats["flushed_records"] == args.records and recovered == 100
+            and saved == 49 and dead_lettered == 1 and dead_letter_lines == 1
+            and pressure["flushed_records"] == 200 and pressure["max_depth"] <= 20
+            and pressure["backpressure_waits"] > 0 and timed_out
+        )
+    finally:
+        cleanup(first_id)
+
+    print("ok" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Проверка доставки очереди писем анализатора на локальном тестовом SMTP-сервере.
+
+Скрипт поднимает в отдельном потоке простой SMTP-сервер (без TLS и авторизации),
+ставит в email_outbox пачку тестовых писем, часть из которых сервер отклоняет,
+запускает OutboxWorker и проверяет, что письма ушли через несколько переиспользованных
+соединений, а отклоненные письма вернулись в очередь для повтора. Тестовые записи удаляются.
+
+Запуск из каталога backend (нужна БД из .env с миграцией 003_email_outbox.sql):
+    python -m benchmarks.check_outbox --emails 500
+"""
+import argparse
+import socketserver
+import sys
+import threading
+import time
+
+from db_utils import enqueue_email, get_connection
+from statistic_analyzer.outbox import OutboxWorker, SMTPSession
+
+TEST_SUBJECT = 'check_outbox'
+REJECTED_DOMAIN = 'rejected.example.com'
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """
+    Минимальный SMTP-сервер: принимает письма и отклоняет получателей из REJECTED_DOMAIN.
+    """
+
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply("250 sink")
+            elif verb == 'RCPT' and REJECTED_DOMAIN in command:
+                self.reply("550 mailbox unavailable")
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 end with .")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with server.lock:
+                    server.messages += 1
+                self.reply("250 queued")
+            elif verb == 'QUIT':
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SinkHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+
+def outbox_statuses() -> dict:
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT status, COUNT(*) FROM email_outbox WHERE subject = %s GROUP BY status",
+            [TEST_SUBJECT]
+        )
+        return dict(cursor.fetchall())
+
+
+def cleanup():
+    with get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("DELETE FROM email_outbox WHERE subject = %s", [TEST_SUBJECT])
+        connection.commit()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--emails", type=int, default=500)
+    arg_parser.add_argument("--reject-every", type=int, default=50, help="каждое N-е письмо отклоняется сервером")
+    arg_parser.add_argument("--batch-size", type=int, default=50)
+    arg_parser.add_argument("--messages-per-session", type=int, default=100)
+    args = arg_parser.parse_args()
+
+    sink = SinkServer()
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    host, port = sink.server_address
+
+    cleanup()
+    rejected = 0
+    for i in range(args.emails):
+        domain = 'example.com'
+        if args.reject_every and i % args.reject_every == 0:
+            domain = REJECTED_DOMAIN
+            rejected += 1
+        enqueue_email(None, f"user{i}@{domain}", TEST_SUBJECT, f"<p>Тестовое письмо {i}</p>")
+
+    session = SMTPSession(
+        host, port, username='analyzer@example.com', starttls=False, max_messages=args.messages_per_session
+    )
+    worker = OutboxWorker(session, batch_size=args.batch_size)
+    started = time.perf_counter()
+    try:
+        worker.drain()
+        session.close()
+        elapsed = time.perf_counter() - started
+        statuses = outbox_statuses()
+    finally:
+        cleanup()
+        sink.shutdown()
+
+    delivered = args.emails - rejected
+    print(f"Писем: {args.emails}, доставлено сервером: {sink.messages}, SMTP-соединений: {sink.connections}")
+    print(f"Время: {elapsed:.2f} с ({args.emails / elapsed:.0f} писем/с), статусы в очереди: {statuses}")
+
+    ok = (
+        sink.messages == delivered
+        and statuses.get('sent', 0) == delivered
+        and statuses.get('pending', 0) == rejected
+        and sink.connections <= -(-args.emails // args.messages_per_session) + 1
+    )
+    print("ok" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Регрессионная проверка планов горячих запросов db_utils.
+
+Скрипт создает схему plan_check со структурой таблиц из основной БД, заполняет ее
+синтетическими данными (по умолчанию 20 000 сотрудников и 1 000 000 тестов),
+применяет миграции из db/migrations, выполняет EXPLAIN для каждого горячего запроса
+и завершается с кодом 1, если запрос снова читает большую таблицу последовательным сканом.
+
+Запуск из каталога backend (нужна БД из .env, DATASOURCE_HOST для запуска вне docker):
+    python -m benchmarks.check_query_plans --employees 20000 --tests 1000000
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from db_utils import (
+    ANALYSIS_TESTS_QUERY, LOGIN_QUERY, PENDING_VERDICTS_QUERY, PROFILE_QUERY, PROFILES_QUERY,
+    _raw_timeseries_query, _rollup_timeseries_query, get_connection, user_stats_queries
+)
+from rollups import ROLLUP_TABLE
+
+SCHEMA = 'plan_check'
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / 'db' / 'migrations'
+
+ALL = ['exhaustion', 'depersonalization', 'achievement', 'burnout_score', 'mean_reaction_time_ms']
+
+
+def hot_queries():
+    """
+    (имя, запрос, параметры, таблицы, которые запрос не должен читать последовательным сканом).
+    Запросы строятся теми же константами и функциями, что и в db_utils, поэтому проверяются
+    планы именно тех запросов, которые выполняет backend.
+    """
+    last_n, averages = user_stats_queries()
+    last_n_before, averages_before = user_stats_queries(before_id=True)
+    return [
+        ("get_user_profile", PROFILE_QUERY, [123], {"employees"}),
+        ("get_users_analysis_inputs: профили", PROFILES_QUERY, [list(range(1, 501))], {"employees"}),
+        ("login_user", LOGIN_QUERY, ['user123@example.com', 'pw'], {"employees"}),
+        ("get_user_burnout_stats: последние тесты", last_n, [123, 3], {"burnout_tests"}),
+        ("get_user_burnout_stats: средние", averages, [123], {"burnout_tests"}),
+        ("get_user_burnout_stats: последние тесты до теста", last_n_before, [123, 900_000, 3], {"burnout_tests"}),
+        ("get_user_burnout_stats: средние до теста", averages_before, [123, 900_000], {"burnout_tests"}),
+        (
+            "get_users_analysis_inputs: последние тесты и средние пачки пользователей",
+            ANALYSIS_TESTS_QUERY, [list(range(1, 501)), 3], {"burnout_tests"},
+        ),
+        ("get_tests_without_verdict", PENDING_VERDICTS_QUERY, [[], 100], {"burnout_tests"}),
+        (
+            "get_burnout_timeseries: личный график",
+            *_raw_timeseries_query(
+                ALL, 123, '2025-03-01', '2025-05-31', None, None, None, None, None, None, ['mean']
+            ),
+            {"burnout_tests", "employees"},
+        ),
+        (
+            "get_burnout_timeseries: диапазон дат",
+            *_raw_timeseries_query(
+                ['burnout_score'], None, '2025-06-01', '2025-06-07', None, None, None, None, None, None, ['mean']
+            ),
+            {"burnout_tests"},
+        ),
+        (
+            "get_burnout_timeseries: отдел и месяц",
+            *_raw_timeseries_query(
+                ['burnout_score'], None, '2025-06-01', '2025-06-30', None, None, ['department_3'],
+                None, None, None, ['mean']
+            ),
+            {"burnout_tests"},
+        ),
+        (
+            "get_burnout_timeseries: город, должность, возраст и неделя",
+            *_raw_timeseries_query(
+                ['burnout_score'], None, '2025-06-01', '2025-06-07', ['city_1', 'city_2'], ['position_7'], None,
+                25, 34, None, ['mean']
+            ),
+            {"burnout_tests"},
+        ),
+        (
+            "get_burnout_timeseries: агрегаты отдела",
+            *_rollup_timeseries_query(
+                ['burnout_score'], 'day', ['mean'], '2025-06-01', '2025-06-30', None, None, ['department_3'],
+                None, None
+            ),
+            {ROLLUP_TABLE},
+        ),
+    ]
+
+
+def create_synthetic_schema(cursor, employees: int, tests: int):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"CREATE TABLE {SCHEMA}.employees (LIKE public.employees INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(f"CREATE TABLE {SCHEMA}.burnout_tests (LIKE public.burnout_tests INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(f"ALTER TABLE {SCHEMA}.employees ADD PRIMARY KEY (id)")
+    cursor.execute(f"ALTER TABLE {SCHEMA}.burnout_tests ADD PRIMARY KEY (id)")
+    cursor.execute(f"SET search_path TO {SCHEMA}")
+
+    cursor.execute(
+        """
+        INSERT INTO employees (id, email, password, city, position, department, age, role_type)
+        SELECT g, 'user' || g || '@example.com', 'pw',
+               'city_' || (g %% 40), 'position_' || (g %% 60), 'department_' || (g %% 30),
+               20 + g %% 45, CASE WHEN g %% 10 = 0 THEN 'Руководитель' ELSE 'Сотрудник' END
+        FROM generate_series(1, %s) AS g
+        """,
+        [employees],
+    )
+    cursor.execute(
+        """
+        INSERT INTO burnout_tests (
+            id, user_id, test_datetime, exhaustion, depersonalization, achievement,
+            burnout_score, mean_reaction_time_ms, llm_burnout_verdict
+        )
+        SELECT g, 1 + floor(random() * %s)::int,
+               TIMESTAMP '2025-01-01' + random() * INTERVAL '365 days',
+               floor(random() * 54)::int, floor(random() * 30)::int, floor(random() * 48)::int,
+               random() * 44, 250 + random() * 550, (random() > 0.5)::int
+        FROM generate_series(1, %s) AS g
+        """,
+        [employees, tests],
+    )
+
+
+def apply_migrations(cursor):
+    for migration in sorted(MIGRATIONS_DIR.glob('*.sql')):
+        print(f"Применяется миграция {migration.name}")
+        cursor.execute(migration.read_text(encoding='utf-8'))
+
+
+def scan_nodes(plan: dict) -> list:
+    """
+    Возвращает все узлы чтения таблиц плана: (тип узла, таблица, индекс).
+    """
+    nodes = []
+    if "Relation Name" in plan:
+        nodes.append((plan["Node Type"], plan["Relation Name"], plan.get("Index Name")))
+    for child in plan.get("Plans", []):
+        nodes.extend(scan_nodes(child))
+    return nodes
+
+
+def check_plans(cursor) -> bool:
+    ok = True
+    for name, query, params, forbidden in hot_queries():
+        cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        root = plan[0]["Plan"]
+        nodes = scan_nodes(root)
+        violations = {relation for node_type, relation, _ in nodes if node_type == "Seq Scan"} & forbidden
+        status = "FAIL" if violations else "ok"
+        scans = "; ".join(
+            f"{node_type} {relation}" + (f" ({index})" if index else "") for node_type, relation, index in nodes
+        )
+        print(f"[{status:>4}] {name}: cost {root['Total Cost']:.0f}, {scans}")
+        ok = ok and not violations
+    return ok
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--employees", type=int, default=20_000)
+    arg_parser.add_argument("--tests", type=int, default=1_000_000)
+    arg_parser.add_argument("--keep", action="store_true", help="не удалять схему plan_check после проверки")
+    args = arg_parser.parse_args()
+
+    with get_connection() as connection, connection.cursor() as cursor:
+        try:
+            print(f"Генерация данных: {args.employees} сотрудников, {args.tests} тестов")
+            create_synthetic_schema(cursor, args.employees, args.tests)
+            apply_migrations(cursor)
+            cursor.execute("ANALYZE employees")
+            cursor.execute("ANALYZE burnout_tests")
+            cursor.execute("ANALYZE burnout_daily_rollups")
+            # Таблицы только что заполнены: visibility map нужна для Index Only Scan
+            connection.commit()
+            connection.autocommit = True
+            cursor.execute("VACUUM ANALYZE burnout_tests")
+            connection.autocommit = False
+            cursor.execute(f"SET search_path TO {SCHEMA}")
+            ok = check_plans(cursor)
+        finally:
+            connection.rollback()
+            # Соединение вернется в общий пул, поэтому search_path восстанавливается
+            cursor.execute("RESET search_path")
+            if not args.keep:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+                connection.commit()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Оценка порогов триажа (graph/triage.py) на сохраненных тестах burnout_tests.
+
+Для каждого теста с вердиктом LLM (llm_burnout_verdict при verdict_source = 'llm'; вердикты,
+вынесенные самим триажем, не учитываются) правила выносят свой вердикт
+или признают случай неоднозначным. Скрипт выводит долю тестов, которые триаж решил бы
+без LLM, и согласованность его вердиктов с вердиктами LLM. Уровень выгорания и когнитивный
+индекс пересчитываются по формулам фронтенда. Пороги берутся из TRIAGE_* (.env), поэтому
+их можно подбирать, меняя переменные окружения. Запуск из каталога backend:
+    TRIAGE_EXHAUSTION_HIGH=25 python -m benchmarks.eval_triage
+"""
+import argparse
+
+from db_utils import fetch_all, get_connection
+from graph.triage import TriageThresholds, burnout_level, classify, cognitive_index
+
+QUERY = """
+SELECT exhaustion, depersonalization, achievement, mean_reaction_time_ms, llm_burnout_verdict
+FROM burnout_tests
+WHERE llm_burnout_verdict IS NOT NULL AND verdict_source = 'llm'
+  AND exhaustion IS NOT NULL AND depersonalization IS NOT NULL AND achievement IS NOT NULL
+ORDER BY test_datetime DESC
+LIMIT %s
+"""
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--limit", type=int, default=100000)
+    args = arg_parser.parse_args()
+
+    thresholds = TriageThresholds.from_env()
+    with get_connection() as connection:
+        rows = fetch_all(connection, QUERY, [args.limit])
+
+    counts = {None: 0, 0: 0, 1: 0}
+    agreed = {0: 0, 1: 0}
+    for row in rows:
+        scores = {
+            'exhaustion': row['exhaustion'],
+            'depersonalization': row['depersonalization'],
+            'achievement': row['achievement'],
+            'burnout': burnout_level(row['exhaustion'], row['depersonalization'], row['achievement']),
+            'cognitive_index': cognitive_index(row['mean_reaction_time_ms'] or 0),
+        }
+        verdict = classify(scores, thresholds)
+        counts[verdict] += 1
+        if verdict is not None and int(row['llm_burnout_verdict']) == verdict:
+            agreed[verdict] += 1
+
+    total = len(rows)
+    if not total:
+        print("Нет тестов с вердиктом LLM")
+        return
+    confident = counts[0] + counts[1]
+    print(f"Пороги: {thresholds}")
+    print(f"Тестов: {total}, решено правилами: {confident} ({100 * confident / total:.1f}%), в LLM: {counts[None]}")
+    for verdict, name in ((0, "нет выгорания"), (1, "выгорание")):
+        if counts[verdict]:
+            print(
+                f"  {name:>14}: {counts[verdict]:>6}, совпадает с LLM: {agreed[verdict]} "
+                f"({100 * agreed[verdict] / counts[verdict]:.1f}%)"
+            )
+    if confident:
+        print(f"Согласованность с LLM: {100 * (agreed[0] + agreed[1]) / confident:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from timeseries import aggregation_key
+
+# Показатели тестов: целочисленные шкалы MBI хранятся в float32 (точно для целых, NULL - NaN),
+# вещественные - в float64, чтобы значения совпадали с ответом БД
+METRIC_DTYPES = {
+    'exhaustion': np.float32,
+    'depersonalization': np.float32,
+    'achievement': np.float32,
+    'burnout_score': np.float64,
+    'mean_reaction_time_ms': np.float64,
+}
+INTEGER_METRICS = {'exhaustion', 'depersonalization', 'achievement'}
+# Атрибуты сотрудника, закодированные словарем (код -1 - значение отсутствует)
+DIMENSIONS = ('city', 'department', 'position')
+
+PERCENTILES = {'p50': 0.5, 'p90': 0.9}
+
+
+def truncate(ts: np.ndarray, bucket: str) -> np.ndarray:
+    """
+    Аналог date_trunc: начало дня, недели (понедельник) или месяца для datetime64[us].
+    """
+    days = ts.astype('datetime64[D]')
+    if bucket == 'day':
+        return days.astype('datetime64[us]')
+    if bucket == 'week':
+        # 1970-01-01 - четверг, поэтому понедельники отстоят от эпохи на 4 + 7k дней
+        day_numbers = days.astype(np.int64)
+        return ((day_numbers - 4) // 7 * 7 + 4).astype('datetime64[D]').astype('datetime64[us]')
+    return ts.astype('datetime64[M]').astype('datetime64[us]')
+
+
+def to_python(values: np.ndarray, integer: bool = False) -> List[Any]:
+    """
+    Значения столбца для ответа API: NaN - None, целочисленные шкалы - int.
+    """
+    missing = np.isnan(values)
+    if integer:
+        result = np.where(missing, 0, values).astype(np.int64).astype(object)
+    else:
+        result = values.astype(np.float64).astype(object)
+    result[missing] = None
+    return result.tolist()
+
+
+class ColumnarSnapshot:
+    """
+    Снимок burnout_tests, соединенных с атрибутами сотрудников, в виде столбцов NumPy
+    для ответов дашборда без обращения к БД.
+
+    - строки упорядочены по test_datetime: диапазон дат выбирается двоичным поиском,
+      остальные фильтры - векторными масками;
+    - город, отдел и должность закодированы словарем (int16), возраст - int16 (-1 - нет данных);
+    - не чаще refresh_interval секунд догружаются новые тесты: id больше последнего загруженного
+      и id из пропусков. Пропуск - диапазон id, которых не было при загрузке: транзакция, получившая
+      их, могла еще не завершиться (id выделяются до фиксации, и фиксация идет не по порядку id).
+      Пропуск проверяется при каждой догрузке, пока не заполнится или не пройдет gap_timeout секунд
+      (откаченные транзакции и удаленные тесты оставляют пропуски навсегда);
+    - раз в full_reload_interval секунд снимок перечитывается полностью (изменения сотрудников,
+      удаленные тесты) в фоновом потоке: запросы до замены обслуживает прежний снимок;
+    - loader(after_id, gaps) возвращает строки с id > after_id или из диапазонов gaps
+      [(первый id, последний id)] в формате fetch_columns, упорядоченные по id, или None при ошибке.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[int, List[Tuple[int, int]]], Optional[Dict[str, List[Any]]]],
+        refresh_interval: float = 5.0,
+        full_reload_interval: float = 3600.0,
+        gap_timeout: float = 600.0,
+        enabled: bool = True
+    ):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.gap_timeout = gap_timeout
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        # Столбцы и словари заменяются вместе одним присваиванием, поэтому запросы читают их без блокировки
+        self._state: Optional[Tuple[Dict[str, np.ndarray], Dict[str, Dict[str, int]]]] = None
+        self._max_id = 0
+        # Пропуски id: (первый id, последний id, когда замечен)
+        self._gaps: List[Tuple[int, int, float]] = []
+        self._reloading = False
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+        self._full_loads = 0
+        self._refreshes = 0
+        self._refresh_ms_last = 0.0
+
+    @classmethod
+    def from_env(
+        cls, loader: Callable[[int, List[Tuple[int, int]]], Optional[Dict[str, List[Any]]]]
+    ) -> "ColumnarSnapshot":
+        return cls(
+            loader,
+            refresh_interval=float(os.getenv('COLUMNAR_REFRESH_SECONDS', 5)),
+            full_reload_interval=float(os.getenv('COLUMNAR_FULL_RELOAD_SECONDS', 3600)),
+            gap_timeout=float(os.getenv('COLUMNAR_GAP_SECONDS', 600)),
+            enabled=os.getenv('COLUMNAR_SNAPSHOT', '0') == '1',
+        )
+
+    def _encode(self, dictionaries: Dict[str, Dict[str, int]], name: str, values: List[Any]) -> np.ndarray:
+        dictionary = dictionaries.setdefault(name, {})
+        codes = np.empty(len(values), dtype=np.int16)
+        for i, value in enumerate(values):
+            if value is None or value == '':
+                codes[i] = -1
+                continue
+            code = dictionary.get(value)
+            if code is None:
+                code = dictionary[value] = len(dictionary)
+            codes[i] = code
+        return codes
+
+    def _build(self, rows: Dict[str, List[Any]], dictionaries: Dict[str, Dict[str, int]]) -> Dict[str, np.ndarray]:
+        columns = {
+            'id': np.array(rows['id'], dtype=np.int64),
+            'user_id': np.array(rows['user_id'], dtype=np.int32),
+            'ts': np.array(rows['test_datetime'], dtype='datetime64[us]'),
+            'age': np.array([-1 if age is None else age for age in rows['age']], dtype=np.int16),
+        }
+        for name, dtype in METRIC_DTYPES.items():
+            columns[name] = np.array(rows[name], dtype=dtype)
+        for name in DIMENSIONS:
+            columns[name] = self._encode(dictionaries, name, rows[name])
+        return columns
+
+    @staticmethod
+    def _holes(ids: np.ndarray, low: int, high: int) -> List[Tuple[int, int]]:
+        """
+        Диапазоны id из (low, high], отсутствующие в отсортированном массиве ids.
+        """
+        ids = ids[(ids > low) & (ids <= high)]
+        bounds = np.concatenate([[low], ids, [high + 1]])
+        at = np.flatnonzero(np.diff(bounds) > 1)
+        return [(int(bounds[i]) + 1, int(bounds[i + 1]) - 1) for i in at]
+
+    def _track_gaps(
+        self, ids: np.ndarray, previous_max: int, gaps: List[Tuple[int, int, float]], now: float
+    ) -> List[Tuple[int, int, float]]:
+        """
+        Пропуски после загрузки строк ids (отсортированы): незаполненные части известных пропусков
+        сохраняют время обнаружения, пропуски выше previous_max - новые. Пропуски ниже previous_max,
+        которых не было среди известных, - удаленные тесты, они не отслеживаются.
+        """
+        tracked = [
+            (first, last, seen)
+            for low, high, seen in gaps if now - seen <= self.gap_timeout
+            for first, last in self._holes(ids, low - 1, high)
+        ]
+        if len(ids):
+            tracked += [(first, last, now) for first, last in self._holes(ids, previous_max, int(ids[-1]))]
+        return tracked
+
+    def _load_full(self, rows: Dict[str, List[Any]]) -> Tuple[Dict[str, np.ndarray], Dict[str, Dict[str, int]]]:
+        dictionaries: Dict[str, Dict[str, int]] = {}
+        columns = self._build(rows, dictionaries)
+        order = np.argsort(columns['ts'], kind='stable')
+        return {name: values[order] for name, values in columns.items()}, dictionaries
+
+    def refresh(self, full: bool = False, force: bool = True) -> bool:
+        """
+        Догружает новые тесты (или перечитывает все при full=True, синхронно). При force=False
+        загрузка выполняется, только если снимок устарел (проверка под блокировкой, чтобы
+        одновременные запросы не загружали его повторно). Возвращает False при ошибке загрузки.
+        """
+        with self._lock:
+            now = time.monotonic()
+            full = full or self._state is None
+            if not force and not full and now - self._refreshed_at <= self.refresh_interval:
+                return True
+            started = time.perf_counter()
+            gaps = [(first, last) for first, last, seen in self._gaps if now - seen <= self.gap_timeout]
+            rows = self.loader(0, []) if full else self.loader(self._max_id, gaps)
+            if rows is None:
+                return False
+
+            new_ids = np.array(rows['id'], dtype=np.int64)
+            if full:
+                columns, dictionaries = self._load_full(rows)
+            else:
+                old, old_dictionaries = self._state
+                dictionaries = {name: dict(values) for name, values in old_dictionaries.items()}
+                columns = old
+                if len(new_ids):
+                    new = self._build(rows, dictionaries)
+                    columns = {name: np.concatenate([old[name], new[name]]) for name in old}
+                    # Пересортировка нужна, только если новые тесты датированы раньше последнего в снимке
+                    if len(old['ts']) > 0 and new['ts'].min() < old['ts'][-1]:
+                        order = np.argsort(columns['ts'], kind='stable')
+                        columns = {name: values[order] for name, values in columns.items()}
+            self._install(columns, dictionaries, new_ids, full, started, self._max_id, self._gaps)
+            return True
+
+    def _install(
+        self, columns, dictionaries, new_ids: np.ndarray, full: bool, started: float,
+        previous_max: int, gaps: List[Tuple[int, int, float]]
+    ):
+        # Вызывается под блокировкой; previous_max и gaps - состояние на момент начала загрузки
+        now = time.monotonic()
+        self._gaps = self._track_gaps(new_ids, previous_max, gaps, now)
+        self._state = (columns, dictionaries)
+        if full:
+            self._max_id = int(new_ids[-1]) if len(new_ids) else 0
+        elif len(new_ids):
+            self._max_id = max(self._max_id, int(new_ids[-1]))
+        self._refreshed_at = now
+        if full:
+            self._loaded_at = now
+            self._full_loads += 1
+        else:
+            self._refreshes += 1
+        self._refresh_ms_last = (time.perf_counter() - started) * 1000
+
+    def _reload(self, previous_max: int, gaps: List[Tuple[int, int, float]]):
+        """
+        Полная перезагрузка в фоновом потоке: снимок строится без блокировки, затем заменяет
+        прежний, и сразу догружаются тесты, сохраненные во время загрузки (они выше previous_max
+        или в пропусках, поэтому отслеживаются как пропуски нового снимка).
+        """
+        try:
+            started = time.perf_counter()
+            rows = self.loader(0, [])
+            if rows is None:
+                return
+            columns, dictionaries = self._load_full(rows)
+            with self._lock:
+                self._install(
+                    columns, dictionaries, np.array(rows['id'], dtype=np.int64), True, started, previous_max, gaps
+                )
+            self.refresh()
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def _ensure_fresh(self) -> bool:
+        # При ошибке загрузки запросы обслуживает предыдущий снимок, если он есть
+        now = time.monotonic()
+        if self._state is not None and now - self._loaded_at > self.full_reload_interval:
+            with self._lock:
+                start = not self._reloading
+                self._reloading = True
+                args = (self._max_id, list(self._gaps))
+            if start:
+                threading.Thread(target=self._reload, args=args, name='columnar-reload', daemon=True).start()
+        if self._state is None or now - self._refreshed_at > self.refresh_interval:
+            return self.refresh(force=False) or self._state is not None
+        return True
+
+    @staticmethod
+    def _codes(dictionaries: Dict[str, Dict[str, int]], name: str, values: List[str]) -> np.ndarray:
+        dictionary = dictionaries.get(name, {})
+        return np.array([dictionary[value] for value in values if value in dictionary], dtype=np.int16)
+
+    def timeseries(
+        self,
+        characteristics: List[str],
+        user_id: Optional[int] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        cities: Optional[List[str]] = None,
+        positions: Optional[List[str]] = None,
+        departments: Optional[List[str]] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+        bucket: Optional[str] = None,
+        aggregations: Optional[List[str]] = None
+    ) -> Optional[Dict[str, List[Any]]]:
+        """
+        Временной ряд в формате fetch_columns, совпадающий с ответом SQL-пути get_burnout_timeseries
+        (test_datetime - datetime). Имена характеристик, bucket и агрегаты должны быть проверены заранее.
+        Возвращает None, если снимок не удалось загрузить.
+        """
+        if not self._ensure_fresh():
+            return None
+        columns, dictionaries = self._state
+        aggregations = aggregations or ['mean']
+
+        # Диапазон дат - двоичным поиском по отсортированному test_datetime (конец дня включается)
+        ts = columns['ts']
+        start = np.searchsorted(ts, np.datetime64(start_date, 'us'), 'left') if start_date else 0
+        end = np.searchsorted(ts, np.datetime64(f"{end_date}T23:59:59", 'us'), 'right') if end_date else len(ts)
+        window = slice(start, end)
+
+        mask = np.ones(end - start, dtype=bool) if end > start else np.zeros(0, dtype=bool)
+        if user_id is not None:
+            mask &= columns['user_id'][window] == user_id
+        if min_age is not None:
+            mask &= columns['age'][window] >= min_age
+        if max_age is not None:
+            age = columns['age'][window]
+            mask &= (age >= 0) & (age <= max_age)
+        for name, values in (('city', cities), ('position', positions), ('department', departments)):
+            if values:
+                mask &= np.isin(columns[name][window], self._codes(dictionaries, name, values))
+        rows = np.flatnonzero(mask) + start
+
+        selected_ts = ts[rows]
+        if not bucket:
+            result = {'test_datetime': selected_ts.tolist()}
+            for name in characteristics:
+                result[name] = to_python(columns[name][rows], integer=name in INTEGER_METRICS)
+            return result
+
+        keys = truncate(selected_ts, bucket)
+        result = {'test_datetime': [], **{
+            aggregation_key(name, aggregation): [] for name in characteristics for aggregation in aggregations
+        }}
+        if len(keys) == 0:
+            return result
+        starts = np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1])
+        lengths = np.diff(np.append(starts, len(keys)))
+        group = np.repeat(np.arange(len(starts)), lengths)
+        result['test_datetime'] = keys[starts].tolist()
+
+        for name in characteristics:
+            values = columns[name][rows].astype(np.float64)
+            valid = ~np.isnan(values)
+            count = np.add.reduceat(valid.astype(np.int64), starts)
+            total = np.add.reduceat(np.where(valid, values, 0.0), starts)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = total / count
+            for aggregation in aggregations:
+                key = aggregation_key(name, aggregation)
+                if aggregation == 'mean':
+                    result[key] = to_python(np.where(count > 0, mean, np.nan))
+                elif aggregation == 'count':
+                    result[key] = count.tolist()
+                elif aggregation == 'std':
+                    # Выборочное стандартное отклонение в два прохода, как stddev_samp
+                    deviation = np.where(valid, values - mean[group], 0.0)
+                    squares = np.add.reduceat(deviation * deviation, starts)
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        std = np.sqrt(squares / (count - 1))
+                    result[key] = to_python(np.where(count > 1, std, np.nan))
+                else:
+                    percentile = self._percentile(values, valid, group, starts, count, PERCENTILES[aggregation])
+                    result[key] = to_python(percentile)
+        return result
+
+    @staticmethod
+    def _percentile(values, valid, group, starts, count, q: float) -> np.ndarray:
+        """
+        percentile_cont для каждой группы: значения сортируются внутри групп (NaN в конце),
+        затем линейная интерполяция между соседними порядковыми статистиками.
+        """
+        order = np.lexsort((np.where(valid, values, np.inf), group))
+        ordered = values[order]
+        position = q * np.maximum(count - 1, 0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        low_values = ordered[np.minimum(starts + lower, len(ordered) - 1)]
+        high_values = ordered[np.minimum(starts + upper, len(ordered) - 1)]
+        result = low_values + (high_values - low_values) * (position - lower)
+        return np.where(count > 0, result, np.nan)
+
+    def stats(self) -> Dict[str, Any]:
+        columns, dictionaries = self._state or (None, {})
+        rows = len(columns['id']) if columns is not None else 0
+        size = sum(values.nbytes for values in columns.values()) if columns is not None else 0
+        return {
+            "enabled": self.enabled,
+            "rows": rows,
+            "bytes": size,
+            "bytes_per_row": round(size / rows, 1) if rows else 0.0,
+            "mb_per_million_rows": round(size / rows * 1_000_000 / 1024 / 1024, 1) if rows else 0.0,
+            "dictionary_sizes": {name: len(values) for name, values in dictionaries.items()},
+            "max_id": self._max_id,
+            "gaps": len(self._gaps),
+            "reloading": self._reloading,
+            "full_loads": self._full_loads,
+            "refreshes": self._refreshes,
+            "refresh_ms_last": round(self._refresh_ms_last, 2),
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if columns is not None else None,
+        }
@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from psycopg2 import OperationalError, extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class PoolTimeoutError(OperationalError):
+    """
+    Не удалось дождаться свободного соединения из пула.
+    Наследуется от OperationalError, чтобы существующие обработчики
+    psycopg2.Error в db_utils обрабатывали ее так же, как ошибку подключения.
+    """
+
+
+class ConnectionPool:
+    """
+    Общий ограниченный пул соединений с PostgreSQL.
+
+    - не более maxconn соединений одновременно, остальные потоки ждут до timeout секунд;
+    - соединение, простоявшее дольше health_check_interval, проверяется запросом SELECT 1
+      и пересоздается, если оно оборвалось;
+    - при возврате незавершенная транзакция откатывается;
+    - собирается статистика ожидания соединений.
+    """
+
+    def __init__(
+        self,
+        db_config: Dict[str, Any],
+        minconn: int = 1,
+        maxconn: int = 10,
+        timeout: float = 10.0,
+        health_check_interval: float = 30.0
+    ):
+        self._db_config = db_config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._pool = None
+        self._init_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used: Dict[int, float] = {}
+
+        self._stats_lock = threading.Lock()
+        self._borrowed = 0
+        self._in_use = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._health_check_failures = 0
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        # Пул создается при первом обращении, чтобы импорт db_utils не открывал соединений
+        if self._pool is None:
+            with self._init_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self._db_config)
+        return self._pool
+
+    def _is_healthy(self, connection) -> bool:
+        if connection.closed:
+            return False
+        last_used = self._last_used.get(id(connection))
+        # Только что открытое соединение проверять не нужно
+        if last_used is None or time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except Exception as e:
+            logging.warning(f"Соединение из пула не прошло проверку: {e}")
+            return False
+
+    def getconn(self):
+        """
+        Берет соединение из пула, ожидая освобождения не дольше timeout секунд.
+        """
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._stats_lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(f"Нет свободных соединений в пуле за {self.timeout} с")
+
+        try:
+            pool = self._get_pool()
+            connection = pool.getconn()
+            # Оборванные соединения закрываются, взамен пул открывает новые
+            while not self._is_healthy(connection):
+                with self._stats_lock:
+                    self._health_check_failures += 1
+                self._last_used.pop(id(connection), None)
+                pool.putconn(connection, close=True)
+                connection = pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self._borrowed += 1
+            self._in_use += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return connection
+
+    def putconn(self, connection):
+        """
+        Возвращает соединение в пул, откатывая незавершенную транзакцию.
+        """
+        close = bool(connection.closed)
+        if not close and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except Exception:
+                close = True
+
+        if close:
+            self._last_used.pop(id(connection), None)
+        else:
+            self._last_used[id(connection)] = time.monotonic()
+
+        try:
+            self._get_pool().putconn(connection, close=close)
+        finally:
+            with self._stats_lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Контекстный менеджер: берет соединение и гарантированно возвращает его в пул.
+        """
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def close(self):
+        """
+        Закрывает все соединения пула (вызывается при остановке приложения).
+        """
+        with self._init_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "minconn": self.minconn,
+                "maxconn": self.maxconn,
+                "in_use": self._in_use,
+                "borrowed_total": self._borrowed,
+                "wait_timeouts": self._timeouts,
+                "wait_avg_ms": round(self._wait_total / self._borrowed * 1000, 3) if self._borrowed else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+                "health_check_failures": self._health_check_failures,
+            }
@@ -1,10 +1,24 @@
-import pandas as pd
-import psycopg2
-from psycopg2 import Error
+import csv
+import datetime
+import io
+
+import numpy as np
+from psycopg2 import Binary, Error, extensions
 from dotenv import load_dotenv
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import os
 
+from cache import LRUCache, TTLCache
+from columnar import ColumnarSnapshot
+from db_pool import ConnectionPool
+from reaction_analysis import (
+    METRIC_COLUMNS, METRICS_VERSION, analyze, analyze_trials, pack_trials, trials_matrix, unpack_matrix
+)
+from rollups import AGE_BAND_YEARS, ROLLUP_AGGREGATIONS, ROLLUP_TABLE, ROLLUP_UPSERT_SQL, rollups_cover
+from timeseries import AGGREGATIONS, VALID_BUCKETS, aggregation_key, downsample
+from write_buffer import WriteBehindBuffer
+
 # Загружаем переменные окружения из файла .env
 load_dotenv()
 
@@ -15,111 +29,511 @@ print(f"Загружен пароль: {'*' * len(os.getenv('DATASOURCE_PASSWORD
 db_config = {
   'user': os.getenv('DATASOURCE_USER'),
   'password': os.getenv('DATASOURCE_PASSWORD'),
-  'host': 'datasource-db',  # Имя сервиса из docker-compose.yml
+  'host': os.getenv('DATASOURCE_HOST', 'datasource-db'),  # Имя сервиса из docker-compose.yml
   'dbname': os.getenv('DATASOURCE_DB'),
   'port': 5432
 }
 
+# Общий пул соединений: все функции модуля берут соединение из него.
+# psycopg2 держит открытыми не более minconn простаивающих соединений,
+# поэтому DB_POOL_MIN задает число "теплых" соединений, а DB_POOL_MAX - верхнюю границу.
+pool = ConnectionPool(
+    db_config,
+    minconn=int(os.getenv('DB_POOL_MIN', 5)),
+    maxconn=int(os.getenv('DB_POOL_MAX', 10)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    health_check_interval=float(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL', 30))
+)
+get_connection = pool.connection
+
+# Кэш справочников (отделы, города, должности): они меняются крайне редко
+dimension_cache = TTLCache(ttl=float(os.getenv('DIMENSION_CACHE_TTL', 300)))
+
+# Профили сотрудников по id: одна строка employees на пользователя вместо
+# отдельных запросов за ролью, отделом и данными для LLM. Backend не изменяет employees,
+# поэтому после правки профиля кэш сбрасывается через /api/invalidate_profiles (или по TTL)
+profile_cache = LRUCache(
+    maxsize=int(os.getenv('PROFILE_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('PROFILE_CACHE_TTL', 600))
+)
+
+# Столбцы профиля сотрудника (без пароля)
+PROFILE_COLUMNS = [
+    'id', 'email', 'legal_entity', 'gender', 'city', 'position', 'department', 'experience_text', 'age',
+    'role_type', 'kpi_june', 'kpi_july', 'kpi_august', 'kpi_september', 'kpi_october',
+    'attestation_status', 'training_status', 'last_vacation_text', 'had_sick_leave', 'has_reprimand',
+    'corporate_activities_participation', 'self_assessment_burnout_state'
+]
+# Столбцы профиля, которые передаются в промпт LLM (без идентификаторов и контактов)
+PROMPT_PROFILE_COLUMNS = [column for column in PROFILE_COLUMNS if column not in ('id', 'email')]
+# Столбцы тестов для истории в промптах (без сырых попыток теста реакции и метрик по ним)
+TEST_COLUMNS = [
+    'id', 'user_id', 'test_datetime', 'exhaustion', 'depersonalization', 'achievement',
+    'burnout_score', 'mean_reaction_time_ms', 'llm_burnout_verdict'
+]
 
-def save_burnout_test_result(user_id: int, scores: Dict[str, Any], llm_response: Dict[str, Any]):
+# Горячие запросы (планы проверяет benchmarks/check_query_plans на тех же строках)
+PROFILE_QUERY = f"SELECT {', '.join(PROFILE_COLUMNS)} FROM employees WHERE id = %s"
+PROFILES_QUERY = f"SELECT {', '.join(PROFILE_COLUMNS)} FROM employees WHERE id = ANY(%s)"
+LOGIN_QUERY = "SELECT id, position FROM employees WHERE email = %s AND password = %s"
+# N последних тестов и средние по всем тестам каждого пользователя пачки (параметры: id, N)
+ANALYSIS_TESTS_QUERY = f"""
+SELECT * FROM (
+    SELECT
+        {', '.join('b.' + column for column in TEST_COLUMNS)},
+        ROW_NUMBER() OVER (PARTITION BY b.user_id ORDER BY b.test_datetime DESC) AS row_number,
+        AVG(b.exhaustion) OVER per_user AS avg_score1,
+        AVG(b.depersonalization) OVER per_user AS avg_score2,
+        AVG(b.achievement) OVER per_user AS avg_score3,
+        AVG(b.burnout_score) OVER per_user AS avg_burnout_score,
+        AVG(b.mean_reaction_time_ms) OVER per_user AS avg_reaction_time_ms
+    FROM burnout_tests b
+    WHERE b.user_id = ANY(%s)
+    WINDOW per_user AS (PARTITION BY b.user_id)
+) t
+WHERE row_number <= %s
+ORDER BY user_id, row_number;
+"""
+PENDING_VERDICTS_QUERY = """
+SELECT id, user_id, exhaustion, depersonalization, achievement, burnout_score, mean_reaction_time_ms
+FROM burnout_tests
+WHERE llm_burnout_verdict IS NULL AND NOT (id = ANY(%s))
+  AND exhaustion IS NOT NULL AND depersonalization IS NOT NULL AND achievement IS NOT NULL
+ORDER BY id
+LIMIT %s;
+"""
+
+
+def user_stats_queries(before_id: bool = False) -> Tuple[str, str]:
+    """
+    Запросы get_user_burnout_stats: N последних тестов (параметры: user_id[, before_id], N)
+    и средние (user_id[, before_id]).
+    """
+    before_clause = "AND id < %s" if before_id else ""
+    last_n = f"""
+    SELECT {', '.join(TEST_COLUMNS)} FROM burnout_tests
+    WHERE user_id = %s {before_clause}
+    ORDER BY test_datetime DESC
+    LIMIT %s;
     """
-    Сохраняет результаты одного теста на выгорание в базу данных.
+    averages = f"""
+    SELECT
+        AVG(exhaustion) as avg_score1, AVG(depersonalization) as avg_score2,
+        AVG(achievement) as avg_score3, AVG(burnout_score) as avg_burnout_score,
+        AVG(mean_reaction_time_ms) as avg_reaction_time_ms
+    FROM burnout_tests WHERE user_id = %s {before_clause};
+    """
+    return last_n, averages
+
+# Отвечать на агрегированные запросы дашборда из таблицы ежедневных агрегатов
+USE_ROLLUPS = os.getenv('USE_ROLLUPS', '1') != '0'
+
+# NUMERIC (например, результат AVG по целым столбцам) сразу приводится к float,
+# как это раньше делал pandas.read_sql
+DEC2FLOAT = extensions.new_type(
+    extensions.DECIMAL.values,
+    'DEC2FLOAT',
+    lambda value, cursor: float(value) if value is not None else None
+)
+extensions.register_type(DEC2FLOAT)
+
+
+def fetch_one(connection, query: str, params=None) -> Optional[Dict[str, Any]]:
+    """
+    Выполняет запрос и возвращает первую строку как словарь или None.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column.name for column in cursor.description], row))
+
+
+def fetch_all(connection, query: str, params=None) -> List[Dict[str, Any]]:
+    """
+    Выполняет запрос и возвращает все строки как список словарей.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        names = [column.name for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def fetch_columns(connection, query: str, params=None) -> Dict[str, List[Any]]:
+    """
+    Выполняет запрос и возвращает результат по столбцам: {имя столбца: [значения]}.
+    Аналог pd.read_sql(...).to_dict('list') без построения DataFrame.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        names = [column.name for column in cursor.description]
+        rows = cursor.fetchall()
+    if not rows:
+        return {name: [] for name in names}
+    return {name: list(values) for name, values in zip(names, zip(*rows))}
+
+
+def _load_columnar_rows(after_id: int, gaps: List[Tuple[int, int]]) -> Optional[Dict[str, List[Any]]]:
+    """
+    Тесты с id > after_id или из диапазонов gaps [(первый id, последний id)] вместе с атрибутами
+    сотрудников для снимка дашборда.
     """
-    connection = None
-    cursor = None
     try:
-        connection = psycopg2.connect(**db_config)
-        cursor = connection.cursor()
-
-        # Подготовка данных для вставки
-        score1 = scores.get('exhaustion')
-        score2 = scores.get('depersonalization')
-        score3 = scores.get('achievement')
-        burnout_score = scores.get('burnout')
-        mean_reaction_time = scores.get('mean_reaction_time_ms')
-
-        llm_verdict = llm_response.get('score')
-
-        sql_query = """
-        INSERT INTO burnout_tests (
-            user_id, test_datetime, score1, score2, score3, 
-            burnout_score, mean_reaction_time_ms, llm_burnout_verdict
-        ) VALUES (
-            %s, NOW(), %s, %s, %s, %s, %s, %s
-        );
-        """
-        
-        data_to_insert = (
-            user_id, score1, score2, score3, 
-            burnout_score, mean_reaction_time, llm_verdict
-        )
+        with get_connection() as connection:
+            return fetch_columns(connection, """
+                SELECT b.id, b.user_id, b.test_datetime, b.exhaustion, b.depersonalization, b.achievement,
+                       b.burnout_score, b.mean_reaction_time_ms, e.city, e.department, e.position, e.age
+                FROM (
+                    SELECT id FROM burnout_tests WHERE id > %s
+                    UNION ALL
+                    SELECT t.id
+                    FROM unnest(%s::bigint[], %s::bigint[]) AS g(first_id, last_id)
+                    JOIN burnout_tests t ON t.id BETWEEN g.first_id AND g.last_id
+                ) wanted
+                JOIN burnout_tests b ON b.id = wanted.id
+                JOIN employees e ON b.user_id = e.id
+                ORDER BY b.id;
+            """, [after_id, [first for first, _ in gaps], [last for _, last in gaps]])
+    except Error as e:
+        print(f"Ошибка при загрузке снимка тестов из PostgreSQL: {e}")
+        return None
+
 
-        cursor.execute(sql_query, data_to_insert)
-        connection.commit()
-        print(f"Результаты теста для пользователя {user_id} успешно сохранены в БД.")
+# Снимок тестов в памяти для запросов дашборда (COLUMNAR_SNAPSHOT=1), загружается при первом запросе
+columnar_snapshot = ColumnarSnapshot.from_env(_load_columnar_rows)
+
+
+def save_burnout_test_result(
+    user_id: int,
+    scores: Dict[str, Any],
+    llm_response: Dict[str, Any],
+    reaction_times: Optional[List[float]] = None,
+    verdict_source: str = 'llm'
+):
+    """
+    Сохраняет результаты одного теста на выгорание в базу данных
+    и в той же транзакции добавляет его в ежедневные агрегаты.
+    Попытки теста реакции сохраняются упакованными вместе с метриками по ним.
+    verdict_source - 'llm' или 'rule' (вердикт триажа), сохраняется только вместе с вердиктом.
+    Возвращает id теста или None при ошибке.
+    """
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            # Подготовка данных для вставки
+            score1 = scores.get('exhaustion')
+            score2 = scores.get('depersonalization')
+            score3 = scores.get('achievement')
+            burnout_score = scores.get('burnout')
+            mean_reaction_time = scores.get('mean_reaction_time_ms', scores.get('reaction_avg'))
+
+            llm_verdict = llm_response.get('score')
+            trials = pack_trials(reaction_times)
+            metrics = analyze_trials(reaction_times)
+
+            sql_query = """
+            INSERT INTO burnout_tests (
+                user_id, test_datetime, exhaustion, depersonalization, achievement, 
+                burnout_score, mean_reaction_time_ms, llm_burnout_verdict, verdict_source,
+                reaction_trials, reaction_trimmed_mean_ms, reaction_sd_ms, reaction_fatigue_slope_ms,
+                reaction_lapses, reaction_metrics_version
+            ) VALUES (
+                %s, NOW(), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+            )
+            RETURNING id;
+            """
+
+            data_to_insert = (
+                user_id, score1, score2, score3, 
+                burnout_score, mean_reaction_time, llm_verdict,
+                verdict_source if llm_verdict is not None else None,
+                Binary(trials) if trials else None,
+                *(metrics[column] for column in METRIC_COLUMNS),
+                METRICS_VERSION if trials else None
+            )
+
+            cursor.execute(sql_query, data_to_insert)
+            test_id = cursor.fetchone()[0]
+            cursor.execute(ROLLUP_UPSERT_SQL, ([test_id],))
+            connection.commit()
+            print(f"Результаты теста для пользователя {user_id} успешно сохранены в БД.")
+            return test_id
 
     except Error as e:
+        # Незавершенная транзакция откатывается пулом при возврате соединения
         print(f"Ошибка при сохранении данных в PostgreSQL: {e}")
-        if connection:
-            connection.rollback()  # Откатываем транзакцию в случае ошибки
+        return None
 
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
 
+# Столбцы burnout_tests в порядке COPY при пакетной загрузке
+BULK_TEST_COLUMNS = [
+    'id', 'user_id', 'test_datetime', 'exhaustion', 'depersonalization', 'achievement',
+    'burnout_score', 'mean_reaction_time_ms', 'llm_burnout_verdict', 'verdict_source', 'reaction_trials',
+    *METRIC_COLUMNS, 'reaction_metrics_version'
+]
 
-def get_user_data(user_id: int):
-    """Возвращает информацию о пользователе по id"""
-    connection = None
+
+def _copy_value(value: Any) -> Any:
+    # Формат CSV для COPY: NULL - пустое значение без кавычек, bytea - шестнадцатеричная запись
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return '\\x' + value.hex()
+    if isinstance(value, float) and np.isnan(value):
+        return ''
+    return value
+
+
+def _db_timezone(cursor) -> datetime.tzinfo:
+    """
+    Часовой пояс сессии БД (TimeZone). Если имя пояса не распознано zoneinfo (например,
+    POSIX-строка), используется текущее смещение БД от UTC.
+    """
+    cursor.execute("SELECT current_setting('TimeZone'), localtimestamp - (now() AT TIME ZONE 'UTC')")
+    name, utc_offset = cursor.fetchone()
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return datetime.timezone(utc_offset)
+
+
+def _db_local_time(value: Any, timezone: datetime.tzinfo) -> Any:
+    """
+    Время теста для столбца timestamp без часового пояса в поясе сессии БД, как у NOW() при прямой
+    записи: время с поясом (в том числе ISO-строка из буфера записи) переводится в пояс БД,
+    время без пояса сохраняется как есть.
+    """
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        value = value.astimezone(timezone).replace(tzinfo=None)
+    return value
+
+
+def save_burnout_test_results_bulk(records: List[Dict[str, Any]]) -> Optional[List[int]]:
+    """
+    Сохраняет пачку тестов одной транзакцией: id выделяются из последовательности одним запросом,
+    строки загружаются через COPY, затем добавляются в ежедневные агрегаты.
+    Каждая запись: user_id, scores (как в save_burnout_test_result), verdict (может быть None),
+    verdict_source ('llm' по умолчанию или 'rule'), reaction_times и test_datetime (None - время сервера БД;
+    время с часовым поясом переводится в пояс сессии БД).
+    Возвращает id тестов в порядке записей или None при ошибке (ничего не сохраняется).
+    """
+    if not records:
+        return []
+    trials = [record.get('reaction_times') or [] for record in records]
+    metrics = analyze(trials_matrix(trials))
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence('burnout_tests', 'id')), localtimestamp "
+                "FROM generate_series(1, %s)",
+                [len(records)]
+            )
+            allocated = cursor.fetchall()
+            timezone = _db_timezone(cursor)
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for i, (record, (test_id, now)) in enumerate(zip(records, allocated)):
+                scores = record['scores']
+                packed = pack_trials(trials[i])
+                row = [
+                    test_id, record['user_id'], _db_local_time(record.get('test_datetime'), timezone) or now,
+                    scores.get('exhaustion'), scores.get('depersonalization'), scores.get('achievement'),
+                    scores.get('burnout'), scores.get('mean_reaction_time_ms', scores.get('reaction_avg')),
+                    record.get('verdict'),
+                    (record.get('verdict_source') or 'llm') if record.get('verdict') is not None else None,
+                    packed,
+                    *(metrics[column][i].item() if packed else None for column in METRIC_COLUMNS),
+                    METRICS_VERSION if packed else None,
+                ]
+                writer.writerow([_copy_value(value) for value in row])
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"COPY burnout_tests ({', '.join(BULK_TEST_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+
+            test_ids = [test_id for test_id, _ in allocated]
+            cursor.execute(ROLLUP_UPSERT_SQL, (test_ids,))
+            connection.commit()
+            print(f"Пакетно сохранено тестов: {len(test_ids)}")
+            return test_ids
+    except Error as e:
+        print(f"Ошибка при пакетном сохранении тестов в PostgreSQL: {e}")
+        return None
+
+
+# Буфер отложенной записи результатов тестов (WRITE_BUFFER=1): сбрасывается пачками
+# через save_burnout_test_results_bulk, запускается и останавливается в lifespan backend
+test_write_buffer = WriteBehindBuffer.from_env(save_burnout_test_results_bulk)
+
+
+def buffer_burnout_test_result(
+    user_id: int,
+    scores: Dict[str, Any],
+    llm_response: Dict[str, Any],
+    reaction_times: Optional[List[float]] = None,
+    verdict_source: str = 'llm'
+):
+    """
+    Ставит результат теста в буфер отложенной записи вместо отдельной транзакции.
+    Время теста фиксируется в момент вызова, а не при сбросе буфера: в UTC, а при сбросе
+    переводится в часовой пояс сессии БД, поэтому не зависит от TZ процесса backend.
+    """
+    test_write_buffer.add({
+        'user_id': user_id,
+        'scores': scores,
+        'verdict': llm_response.get('score'),
+        'verdict_source': verdict_source,
+        'reaction_times': reaction_times,
+        'test_datetime': datetime.datetime.now(datetime.timezone.utc).isoformat(sep=' '),
+    })
+
+
+def update_llm_verdict(test_id: int, verdict: Optional[int], verdict_source: str = 'llm'):
+    """
+    Записывает вердикт для уже сохраненного теста (отложенная обработка пакетной загрузки).
+    """
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE burnout_tests SET llm_burnout_verdict = %s, verdict_source = %s WHERE id = %s",
+                (verdict, verdict_source if verdict is not None else None, test_id)
+            )
+            connection.commit()
+    except Error as e:
+        print(f"Ошибка при сохранении вердикта для теста {test_id}: {e}")
+
+
+def get_tests_without_verdict(limit: int, exclude_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """
+    Сохраненные тесты без вердикта (отложенная обработка пакета не была запущена из-за заполненной
+    очереди или потерялась при перезапуске, либо LLM не вернула вердикт) для повторного прогона через граф.
+    exclude_ids - тесты, которые уже обрабатываются или исчерпали попытки.
+    """
     try:
-        connection = psycopg2.connect(**db_config)
-        query = "SELECT * FROM employees WHERE id = %s"
-        # .to_dict('records') вернет список словарей, берем первый элемент [0]
-        user_data = pd.read_sql(query, connection, params=[user_id]).to_dict('records')[0]
-        return user_data
+        with get_connection() as connection:
+            return fetch_all(connection, PENDING_VERDICTS_QUERY, (list(exclude_ids or []), limit))
+    except Error as e:
+        print(f"Ошибка при выборке тестов без вердикта: {e}")
+        return []
+
+
+def get_existing_user_ids(user_ids: List[int]) -> Optional[set]:
+    """
+    Возвращает множество id из user_ids, для которых есть сотрудник, или None при ошибке.
+    """
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM employees WHERE id = ANY(%s)", [list(set(user_ids))])
+            return {row[0] for row in cursor.fetchall()}
+    except Error as e:
+        print(f"Ошибка при проверке пользователей: {e}")
+        return None
+
+
+def _load_user_profile(user_id: int) -> Optional[Dict[str, Any]]:
+    try:
+        with get_connection() as connection:
+            user_data = fetch_one(connection, PROFILE_QUERY, [user_id])
+            if user_data is None:
+                raise IndexError(f"пользователь с id {user_id} отсутствует")
+            return user_data
     except (Error, IndexError) as e:
         print(f"Ошибка при работе с PostgreSQL или пользователь не найден: {e}")
         return None
-    finally:
-        if connection:
-            connection.close()
 
 
-def get_user_burnout_stats(user_id: int, n: int = 3):
+def get_user_profile(user_id: int, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Возвращает профиль сотрудника из LRU-кэша (при промахе - одним запросом к employees).
+    columns ограничивает набор возвращаемых столбцов.
+    """
+    profile = profile_cache.get(user_id, lambda: _load_user_profile(user_id))
+    if profile is None:
+        return None
+    if columns is None:
+        return dict(profile)
+    return {column: profile.get(column) for column in columns}
+
+
+def invalidate_user_profile(user_id: Optional[int] = None):
+    """
+    Сбрасывает кэшированный профиль сотрудника (или все профили) после изменения employees;
+    вызывается из /api/invalidate_profiles.
+    """
+    profile_cache.invalidate(user_id)
+
+
+def get_user_data(user_id: int):
+    """Возвращает информацию о пользователе по id"""
+    return get_user_profile(user_id)
+
+
+def get_user_burnout_stats(user_id: int, n: int = 3, before_id: Optional[int] = None):
     """
     Получает N последних записей о тестах на выгорание для пользователя
     и рассчитывает средние значения по ключевым показателям.
+    before_id ограничивает историю и средние тестами с id < before_id: для уже сохраненного
+    теста (пакетная загрузка) они не должны включать его самого и более поздние тесты.
     """
-    connection = None
+    query_last_n, query_overall_avg = user_stats_queries(before_id is not None)
+    params = [user_id, before_id] if before_id is not None else [user_id]
     try:
-        connection = psycopg2.connect(**db_config)
-        
-        query_last_n = """
-        SELECT * FROM burnout_tests 
-        WHERE user_id = %s 
-        ORDER BY test_datetime DESC 
-        LIMIT %s;
-        """
-        df_last_n = pd.read_sql(query_last_n, connection, params=[user_id, n]).to_dict('list')
-        
-        query_overall_avg = """
-        SELECT
-            AVG(exhaustion) as avg_score1, AVG(depersonalization) as avg_score2,
-            AVG(achievement) as avg_score3, AVG(burnout_score) as avg_burnout_score,
-            AVG(mean_reaction_time_ms) as avg_reaction_time_ms
-        FROM burnout_tests WHERE user_id = %s;
-        """
-        averages = pd.read_sql(query_overall_avg, connection, params=[user_id]).to_dict('records')[0]
-        
-        return df_last_n, averages
+        with get_connection() as connection:
+            df_last_n = fetch_columns(connection, query_last_n, params + [n])
+            averages = fetch_one(connection, query_overall_avg, params)
+
+            return df_last_n, averages
     except (Error, IndexError) as e:
         print(f"Ошибка при работе с PostgreSQL или записи не найдены: {e}")
         return None, None
-    finally:
-        if connection:
-            connection.close()
+
+
+def get_users_analysis_inputs(user_ids: List[int], n: int = 3) -> Dict[int, Dict[str, Any]]:
+    """
+    Пакетная загрузка данных для анализа группы пользователей за два запроса:
+    профили сотрудников и, одним запросом с оконными функциями, N последних тестов
+    и средние значения по всем тестам каждого пользователя.
+    Возвращает {user_id: {'user_data', 'last_tests', 'averages'}} в формате,
+    совпадающем с get_user_profile(user_id, PROMPT_PROFILE_COLUMNS) и get_user_burnout_stats.
+    """
+    if not user_ids:
+        return {}
+    try:
+        with get_connection() as connection:
+            profiles = fetch_all(connection, PROFILES_QUERY, [list(user_ids)])
+            with connection.cursor() as cursor:
+                cursor.execute(ANALYSIS_TESTS_QUERY, [list(user_ids), n])
+                names = [column.name for column in cursor.description]
+                rows = cursor.fetchall()
+    except Error as e:
+        print(f"Ошибка при пакетной загрузке данных пользователей: {e}")
+        return {}
+
+    average_names = ['avg_score1', 'avg_score2', 'avg_score3', 'avg_burnout_score', 'avg_reaction_time_ms']
+    test_names = [name for name in names if name not in average_names and name != 'row_number']
+    user_index = names.index('user_id')
+
+    inputs = {
+        profile['id']: {
+            'user_data': {column: profile[column] for column in PROMPT_PROFILE_COLUMNS},
+            'last_tests': {name: [] for name in test_names},
+            'averages': dict.fromkeys(average_names),
+        }
+        for profile in profiles
+    }
+    for row in rows:
+        user_inputs = inputs.get(row[user_index])
+        if user_inputs is None:
+            continue
+        record = dict(zip(names, row))
+        for name in test_names:
+            user_inputs['last_tests'][name].append(record[name])
+        user_inputs['averages'] = {name: record[name] for name in average_names}
+    return inputs
 
 
 def login_user(email: str, password: str):
@@ -128,28 +542,172 @@ def login_user(email: str, password: str):
     Returns:
         tuple(int, str): (ID пользователя, Должность) или (-1, '') в случае неудачи.
     """
-    connection = None
     try:
-        connection = psycopg2.connect(**db_config)
-        query = "SELECT id, position FROM employees WHERE email = %s AND password = %s"
-        result_df = pd.read_sql(query, connection, params=[email, password])
-        
-        if not result_df.empty:
-            user_id = int(result_df.iloc[0]['id'])
-            position = result_df.iloc[0]['position']
-            return user_id, position
-        else:
-            return -1, ''
+        with get_connection() as connection:
+            row = fetch_one(connection, LOGIN_QUERY, [email, password])
+
+            if row is not None:
+                return int(row['id']), row['position']
+            else:
+                return -1, ''
     except Error as e:
         print(f"Ошибка при работе с PostgreSQL: {e}")
         return -1, ''
-    finally:
-        if connection:
-            connection.close()
+
+
+def _rollup_timeseries_query(
+    characteristics: List[str],
+    bucket: str,
+    aggregations: List[str],
+    start_date: Optional[str],
+    end_date: Optional[str],
+    cities: Optional[List[str]],
+    positions: Optional[List[str]],
+    departments: Optional[List[str]],
+    min_age: Optional[int],
+    max_age: Optional[int]
+):
+    """
+    Строит запрос временного ряда по таблице ежедневных агрегатов.
+    Имена характеристик, bucket и агрегаты должны быть заранее проверены по белым спискам.
+    """
+    select_columns = ", ".join(
+        f"{ROLLUP_AGGREGATIONS[aggregation].format(column=name)} AS {aggregation_key(name, aggregation)}"
+        for name in characteristics
+        for aggregation in aggregations
+    )
+    query = f"""
+        SELECT date_trunc('{bucket}', r.day::timestamp) AS test_datetime, {select_columns}
+        FROM {ROLLUP_TABLE} r
+    """
+
+    where_clauses = []
+    params = []
+
+    if start_date:
+        where_clauses.append("r.day >= %s::date")
+        params.append(start_date)
+    if end_date:
+        where_clauses.append("r.day <= %s::date")
+        params.append(end_date)
+    if min_age is not None or max_age is not None:
+        # Сотрудники без указанного возраста не попадают под возрастной фильтр
+        where_clauses.append("r.age_band >= 0")
+    if min_age is not None:
+        where_clauses.append("r.age_band >= %s")
+        params.append(min_age)
+    if max_age is not None:
+        where_clauses.append("r.age_band + %s <= %s")
+        params.extend([AGE_BAND_YEARS - 1, max_age])
+    if cities:
+        where_clauses.append("r.city IN %s")
+        params.append(tuple(cities))
+    if positions:
+        where_clauses.append("r.position IN %s")
+        params.append(tuple(positions))
+    if departments:
+        where_clauses.append("r.department IN %s")
+        params.append(tuple(departments))
+
+    if where_clauses:
+        query += " WHERE " + " AND ".join(where_clauses)
+    query += " GROUP BY 1 ORDER BY 1 ASC;"
+    return query, params
+
+
+def _raw_timeseries_query(
+    characteristics: List[str],
+    user_id: Optional[int],
+    start_date: Optional[str],
+    end_date: Optional[str],
+    cities: Optional[List[str]],
+    positions: Optional[List[str]],
+    departments: Optional[List[str]],
+    min_age: Optional[int],
+    max_age: Optional[int],
+    bucket: Optional[str],
+    aggregations: List[str]
+):
+    """
+    Строит запрос временного ряда по сырым тестам (burnout_tests JOIN employees).
+    Имена характеристик, bucket и агрегаты должны быть заранее проверены по белым спискам.
+    """
+    if bucket:
+        select_columns = ", ".join(
+            f"{AGGREGATIONS[aggregation].format(column=f'b.{name}')} "
+            f"AS {aggregation_key(name, aggregation)}"
+            for name in characteristics
+            for aggregation in aggregations
+        )
+        base_query = f"""
+            SELECT date_trunc('{bucket}', b.test_datetime) AS test_datetime, {select_columns}
+            FROM burnout_tests b JOIN employees e ON b.user_id = e.id
+        """
+    else:
+        base_query = f"""
+            SELECT b.test_datetime, {", ".join(f"b.{name}" for name in characteristics)}
+            FROM burnout_tests b JOIN employees e ON b.user_id = e.id
+        """
+
+    where_clauses = []
+    params = []
+
+    if start_date:
+        where_clauses.append("b.test_datetime >= %s")
+        params.append(start_date)
+    if end_date:
+        where_clauses.append("b.test_datetime <= %s")
+        params.append(f"{end_date} 23:59:59")
+    if min_age is not None:
+        where_clauses.append("e.age >= %s")
+        params.append(min_age)
+    if max_age is not None:
+        where_clauses.append("e.age <= %s")
+        params.append(max_age)
+    if cities:
+        where_clauses.append("e.city IN %s")
+        params.append(tuple(cities))
+    if positions:
+        where_clauses.append("e.position IN %s")
+        params.append(tuple(positions))
+    if departments:
+        where_clauses.append("e.department IN %s")
+        params.append(tuple(departments))
+
+    if user_id is not None:
+        where_clauses.append("b.user_id = %s")
+        params.append(user_id)
+
+    if where_clauses:
+        query = base_query + " WHERE " + " AND ".join(where_clauses)
+    else:
+        query = base_query
+
+    if bucket:
+        query += " GROUP BY 1 ORDER BY 1 ASC;"
+    else:
+        query += " ORDER BY b.test_datetime ASC, b.id ASC;"
+    return query, params
+
+
+def _finish_timeseries(
+    timeseries: Dict[str, List[Any]],
+    characteristics: List[str],
+    bucket: Optional[str],
+    aggregations: List[str],
+    max_points: Optional[int]
+) -> Dict[str, List[Any]]:
+    # Точки для прореживания выбираются по первой характеристике
+    value_key = aggregation_key(characteristics[0], aggregations[0]) if bucket else characteristics[0]
+    timeseries = downsample(timeseries, value_key, max_points)
+    timeseries['test_datetime'] = [
+        dt.isoformat() for dt in timeseries['test_datetime']
+    ]
+    return timeseries
 
 
 def get_burnout_timeseries(
-    characteristic: str,
+    characteristic: Union[str, List[str]],
     user_id: Optional[int] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -157,240 +715,150 @@ def get_burnout_timeseries(
     positions: Optional[List[str]] = None,
     departments: Optional[List[str]] = None,
     min_age: Optional[int] = None,
-    max_age: Optional[int] = None
+    max_age: Optional[int] = None,
+    bucket: Optional[str] = None,
+    aggregations: Optional[List[str]] = None,
+    max_points: Optional[int] = None
 ):
     print(characteristic, user_id)
     """
     Возвращает временной ряд для заданной характеристики с фильтрацией.
+
+    characteristic может быть списком: тогда все характеристики читаются одним запросом
+    и возвращаются на общей оси test_datetime.
+    bucket ('day', 'week', 'month') группирует тесты по корзинам времени на стороне БД,
+    aggregations задает агрегаты по корзине ('mean', 'count', 'std', 'p50', 'p90'; по умолчанию 'mean').
+    Среднее возвращается под именем характеристики, остальные - как '<характеристика>_<агрегат>'.
+    max_points ограничивает число точек ответа прореживанием LTTB.
+
+    Если фильтры это позволяют (см. rollups_cover), ряд строится по burnout_daily_rollups,
+    и стоимость запроса зависит от числа дней, а не от числа тестов.
+    При COLUMNAR_SNAPSHOT=1 ответ строится по снимку тестов в памяти (columnar_snapshot)
+    без обращения к БД; если снимок не загрузился, используется SQL.
     """
     valid_characteristics = ['exhaustion', 'depersonalization', 'achievement', 'burnout_score', 'mean_reaction_time_ms']
-    if characteristic not in valid_characteristics:
-        print(f"Ошибка: Недопустимое имя характеристики '{characteristic}'.")
+    characteristics = [characteristic] if isinstance(characteristic, str) else list(dict.fromkeys(characteristic))
+    invalid_characteristics = [name for name in characteristics if name not in valid_characteristics]
+    if not characteristics or invalid_characteristics:
+        print(f"Ошибка: Недопустимое имя характеристики '{invalid_characteristics or characteristic}'.")
         return None
-
-    connection = None
-    try:
-        connection = psycopg2.connect(**db_config)
-        
-        base_query = f"""
-            SELECT b.test_datetime, b.{characteristic}
-            FROM burnout_tests b JOIN employees e ON b.user_id = e.id
-        """
-        
-        where_clauses = []
-        params = []
-
-        if start_date:
-            where_clauses.append("b.test_datetime >= %s")
-            params.append(start_date)
-        if end_date:
-            where_clauses.append("b.test_datetime <= %s")
-            params.append(f"{end_date} 23:59:59")
-        if min_age is not None:
-            where_clauses.append("e.age >= %s")
-            params.append(min_age)
-        if max_age is not None:
-            where_clauses.append("e.age <= %s")
-            params.append(max_age)
-        if cities:
-            where_clauses.append("e.city IN %s")
-            params.append(tuple(cities))
-        if positions:
-            where_clauses.append("e.position IN %s")
-            params.append(tuple(positions))
-        if departments:
-            where_clauses.append("e.department IN %s")
-            params.append(tuple(departments))
-
-        if user_id is not None:
-            where_clauses.append("b.user_id = %s")
-            params.append(user_id)
-
-        if where_clauses:
-            query = base_query + " WHERE " + " AND ".join(where_clauses)
-        else:
-            query = base_query
-            
-        query += " ORDER BY b.test_datetime ASC;"
-        
-        timeseries = pd.read_sql(query, connection, params=params).to_dict('list')
-        timeseries['test_datetime'] = [
-            dt.isoformat() for dt in timeseries['test_datetime']
-        ]
-        print(timeseries)
-        return timeseries
-    except Error as e:
-        print(f"Ошибка при работе с PostgreSQL: {e}")
+    if bucket is not None and bucket not in VALID_BUCKETS:
+        print(f"Ошибка: Недопустимый размер корзины '{bucket}'.")
+        return None
+    aggregations = aggregations or ['mean']
+    if any(aggregation not in AGGREGATIONS for aggregation in aggregations):
+        print(f"Ошибка: Недопустимые агрегаты {aggregations}.")
         return None
-    finally:
-        if connection:
-            connection.close()
-
-# Добавьте эти функции в db_utils.py
-
-def get_user_role(user_id: int) -> str:
-    """
-    Возвращает роль пользователя по его ID.
-    """
-    connection = None
-    try:
-        connection = psycopg2.connect(**db_config)
-        query = """
-        SELECT role_type 
-        FROM employees 
-        WHERE id = %s
-        """
-        df = pd.read_sql(query, connection, params=[user_id])
-        if not df.empty:
-            return df.iloc[0]['role_type']
-        return 'Сотрудник'
-        
-    except Error as e:
-        print(f"Ошибка при получении роли пользователя: {e}")
-        return 'Сотрудник'
-        
-    finally:
-        if connection:
-            connection.close()
-
-def get_user_department(user_id: int) -> str:
-    """
-    Возвращает отдел пользователя по его ID.
-    """
-    connection = None
-    try:
-        connection = psycopg2.connect(**db_config)
-        query = """
-        SELECT department 
-        FROM employees 
-        WHERE id = %s
-        """
-        df = pd.read_sql(query, connection, params=[user_id])
-        if not df.empty:
-            return df.iloc[0]['department']
-        return 'Отдел не определен'
-        
-    except Error as e:
-        print(f"Ошибка при получении отдела пользователя: {e}")
-        return 'Отдел не определен'
-        
-    finally:
-        if connection:
-            connection.close()
 
+    if columnar_snapshot.enabled:
+        try:
+            timeseries = columnar_snapshot.timeseries(
+                characteristics, user_id, start_date, end_date, cities, positions, departments,
+                min_age, max_age, bucket, aggregations
+            )
+        except ValueError as e:
+            print(f"Ошибка: Недопустимый диапазон дат: {e}")
+            return None
+        if timeseries is not None:
+            return _finish_timeseries(timeseries, characteristics, bucket, aggregations, max_points)
 
-def get_departments_list():
-    """
-    Возвращает список всех уникальных отделов из таблицы employees.
-    """
-    connection = None
     try:
-        connection = psycopg2.connect(**db_config)
-        query = """
-        SELECT DISTINCT department 
-        FROM employees 
-        WHERE department IS NOT NULL AND department != ''
-        ORDER BY department;
-        """
-        df = pd.read_sql(query, connection)
-        departments = df['department'].tolist()
-        return departments
+        with get_connection() as connection:
+            if USE_ROLLUPS and rollups_cover(user_id, bucket, aggregations, min_age, max_age):
+                query, params = _rollup_timeseries_query(
+                    characteristics, bucket, aggregations, start_date, end_date,
+                    cities, positions, departments, min_age, max_age
+                )
+                timeseries = fetch_columns(connection, query, params)
+            else:
+                query, params = _raw_timeseries_query(
+                    characteristics, user_id, start_date, end_date, cities, positions, departments,
+                    min_age, max_age, bucket, aggregations
+                )
+                timeseries = fetch_columns(connection, query, params)
 
+        return _finish_timeseries(timeseries, characteristics, bucket, aggregations, max_points)
     except Error as e:
         print(f"Ошибка при работе с PostgreSQL: {e}")
-        return []
-
-    finally:
-        if connection:
-            connection.close()
-
+        return None
 
+@dimension_cache.cached('cities')
 def get_city_list():
     """
     Возвращает список всех уникальных отделов из таблицы employees.
     """
-    connection = None
     try:
-        connection = psycopg2.connect(**db_config)
-        query = """
-        SELECT DISTINCT city 
-        FROM employees 
-        WHERE city IS NOT NULL AND city != ''
-        ORDER BY city;
-        """
-        df = pd.read_sql(query, connection)
-        departments = df['city'].tolist()
-        return departments
+        with get_connection() as connection:
+            query = """
+            SELECT DISTINCT city 
+            FROM employees 
+            WHERE city IS NOT NULL AND city != ''
+            ORDER BY city;
+            """
+            departments = fetch_columns(connection, query)['city']
+            return departments
 
     except Error as e:
         print(f"Ошибка при работе с PostgreSQL: {e}")
         return []
 
-    finally:
-        if connection:
-            connection.close()
 
 
+@dimension_cache.cached('positions')
 def get_position_list():
     """
     Возвращает список всех уникальных отделов из таблицы employees.
     """
-    connection = None
     try:
-        connection = psycopg2.connect(**db_config)
-        query = """
-        SELECT DISTINCT position 
-        FROM employees 
-        WHERE position IS NOT NULL AND position != ''
-        ORDER BY position;
-        """
-        df = pd.read_sql(query, connection)
-        departments = df['position'].tolist()
-        return departments
+        with get_connection() as connection:
+            query = """
+            SELECT DISTINCT position 
+            FROM employees 
+            WHERE position IS NOT NULL AND position != ''
+            ORDER BY position;
+            """
+            departments = fetch_columns(connection, query)['position']
+            return departments
 
     except Error as e:
         print(f"Ошибка при работе с PostgreSQL: {e}")
         return []
 
-    finally:
-        if connection:
-            connection.close()
 
 
 def get_user_statistics(user_id: int):
     """
     Возвращает статистику для конкретного пользователя.
     """
-    connection = None
     try:
-        connection = psycopg2.connect(**db_config)
-        query = """
-        SELECT 
-            AVG(burnout_score) as avg_burnout_score,
-            COUNT(*) as total_tests,
-            SUM(CASE WHEN burnout_score > 30 THEN 1 ELSE 0 END) as high_risk_count,
-            MIN(burnout_score) as min_burnout_score,
-            MAX(burnout_score) as max_burnout_score
-        FROM burnout_tests 
-        WHERE user_id = %s
-        """
-        df = pd.read_sql(query, connection, params=[user_id])
-        if not df.empty:
+        with get_connection() as connection:
+            query = """
+            SELECT 
+                AVG(burnout_score) as avg_burnout_score,
+                COUNT(*) as total_tests,
+                SUM(CASE WHEN burnout_score > 30 THEN 1 ELSE 0 END) as high_risk_count,
+                MIN(burnout_score) as min_burnout_score,
+                MAX(burnout_score) as max_burnout_score
+            FROM burnout_tests 
+            WHERE user_id = %s
+            """
+            row = fetch_one(connection, query, [user_id])
+            if row is not None:
+                return {
+                    'avg_burnout_score': float(row['avg_burnout_score']) if row['avg_burnout_score'] else 0,
+                    'total_tests': int(row['total_tests']),
+                    'high_risk_count': int(row['high_risk_count'] or 0),
+                    'min_burnout_score': float(row['min_burnout_score']) if row['min_burnout_score'] else 0,
+                    'max_burnout_score': float(row['max_burnout_score']) if row['max_burnout_score'] else 0
+                }
             return {
-                'avg_burnout_score': float(df.iloc[0]['avg_burnout_score']) if df.iloc[0]['avg_burnout_score'] else 0,
-                'total_tests': int(df.iloc[0]['total_tests']),
-                'high_risk_count': int(df.iloc[0]['high_risk_count']),
-                'min_burnout_score': float(df.iloc[0]['min_burnout_score']) if df.iloc[0]['min_burnout_score'] else 0,
-                'max_burnout_score': float(df.iloc[0]['max_burnout_score']) if df.iloc[0]['max_burnout_score'] else 0
+                'avg_burnout_score': 0,
+                'total_tests': 0,
+                'high_risk_count': 0,
+                'min_burnout_score': 0,
+                'max_burnout_score': 0
             }
-        return {
-            'avg_burnout_score': 0,
-            'total_tests': 0,
-            'high_risk_count': 0,
-            'min_burnout_score': 0,
-            'max_burnout_score': 0
-        }
-        
+
     except Error as e:
         print(f"Ошибка при получении статистики пользователя: {e}")
         return {
@@ -401,31 +869,25 @@ def get_user_statistics(user_id: int):
             'max_burnout_score': 0
         }
         
-    finally:
-        if connection:
-            connection.close()
 
 
 def get_all_user_ids_and_emails():
-    connection = None
     try:
-        connection = psycopg2.connect(**db_config)
-        query = "SELECT id, email FROM employees WHERE email IS NOT NULL;"
-        users_df = pd.read_sql(query, connection)
-        users_list = list(users_df.itertuples(index=False, name=None))
-        return users_list
+        with get_connection() as connection:
+            query = "SELECT id, email FROM employees WHERE email IS NOT NULL;"
+            with connection.cursor() as cursor:
+                cursor.execute(query)
+                users_list = cursor.fetchall()
+            return users_list
     except Error as e:
         print(f"Ошибка при получении списка пользователей: {e}")
         return []
-    finally:
-        if connection:
-            connection.close()
 
 def get_user_role(user_id: int) -> Optional[str]:
     """
     Возвращает роль пользователя ('Сотрудник' или 'Руководитель') по его ID.
     """
-    user_data = get_user_data(user_id)
+    user_data = get_user_profile(user_id, ['role_type'])
     return user_data.get('role_type') if user_data else None
 
 
@@ -433,28 +895,260 @@ def get_user_department(user_id: int) -> Optional[str]:
     """
     Возвращает отдел пользователя по его ID.
     """
-    user_data = get_user_data(user_id)
+    user_data = get_user_profile(user_id, ['department'])
     return user_data.get('department') if user_data else None
 
 
+@dimension_cache.cached('departments')
 def get_departments_list() -> List[str]:
     """
     Возвращает список всех уникальных отделов из таблицы employees.
     """
-    connection = None
     try:
-        connection = psycopg2.connect(**db_config)
-        query = """
-        SELECT DISTINCT department 
-        FROM employees 
-        WHERE department IS NOT NULL AND department != '' AND department != 'Отдел не определен'
-        ORDER BY department;
-        """
-        df = pd.read_sql(query, connection)
-        return df['department'].tolist()
+        with get_connection() as connection:
+            query = """
+            SELECT DISTINCT department 
+            FROM employees 
+            WHERE department IS NOT NULL AND department != '' AND department != 'Отдел не определен'
+            ORDER BY department;
+            """
+            return fetch_columns(connection, query)['department']
     except Error as e:
         print(f"Ошибка при получении списка отделов: {e}")
         return []
-    finally:
-        if connection:
-            connection.close()
\ No newline at end of file
+
+
+def enqueue_email(user_id: Optional[int], recipient: str, subject: str, body: str) -> Optional[int]:
+    """
+    Добавляет письмо в очередь email_outbox. Возвращает id записи или None при ошибке.
+    """
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO email_outbox (user_id, recipient, subject, body)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id;
+                """,
+                (user_id, recipient, subject, body)
+            )
+            outbox_id = cursor.fetchone()[0]
+            connection.commit()
+            return outbox_id
+    except Error as e:
+        print(f"Ошибка при добавлении письма в очередь: {e}")
+        return None
+
+
+def claim_outbox_batch(limit: int, lock_timeout_seconds: int = 600) -> List[Dict[str, Any]]:
+    """
+    Забирает на отправку до limit писем, время повторной попытки которых наступило.
+    Письма, зависшие в статусе 'sending' дольше lock_timeout_seconds (обработчик упал),
+    забираются повторно. Несколько обработчиков не получат одно и то же письмо.
+    """
+    try:
+        with get_connection() as connection:
+            rows = fetch_all(
+                connection,
+                """
+                UPDATE email_outbox SET status = 'sending', locked_at = now()
+                WHERE id IN (
+                    SELECT id FROM email_outbox
+                    WHERE next_attempt_at <= now()
+                      AND (status = 'pending'
+                           OR (status = 'sending' AND locked_at < now() - %s * INTERVAL '1 second'))
+                    ORDER BY next_attempt_at, id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, user_id, recipient, subject, body, attempts;
+                """,
+                (lock_timeout_seconds, limit)
+            )
+            connection.commit()
+            return sorted(rows, key=lambda row: row['id'])
+    except Error as e:
+        print(f"Ошибка при выборке писем из очереди: {e}")
+        return []
+
+
+def mark_outbox_sent(outbox_ids: List[int]):
+    """
+    Отмечает письма доставленными.
+    """
+    if not outbox_ids:
+        return
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE email_outbox
+                SET status = 'sent', sent_at = now(), attempts = attempts + 1, last_error = NULL, locked_at = NULL
+                WHERE id = ANY(%s);
+                """,
+                (outbox_ids,)
+            )
+            connection.commit()
+    except Error as e:
+        print(f"Ошибка при отметке доставленных писем: {e}")
+
+
+def mark_outbox_failed(outbox_id: int, error: str, retry_in_seconds: Optional[float]):
+    """
+    Записывает неудачную попытку доставки. Если retry_in_seconds не указан,
+    письмо окончательно помечается как 'failed', иначе возвращается в очередь.
+    """
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE email_outbox
+                SET status = CASE WHEN %s IS NULL THEN 'failed' ELSE 'pending' END,
+                    attempts = attempts + 1,
+                    last_error = %s,
+                    locked_at = NULL,
+                    next_attempt_at = now() + COALESCE(%s, 0) * INTERVAL '1 second'
+                WHERE id = %s;
+                """,
+                (retry_in_seconds, error, retry_in_seconds, outbox_id)
+            )
+            connection.commit()
+    except Error as e:
+        print(f"Ошибка при записи неудачной доставки письма {outbox_id}: {e}")
+
+
+def release_outbox(outbox_ids: List[int], error: str, retry_in_seconds: float):
+    """
+    Возвращает в очередь забранные, но не отправленные письма (сервер стал недоступен
+    до их отправки). Число попыток не увеличивается.
+    """
+    if not outbox_ids:
+        return
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE email_outbox
+                SET status = 'pending',
+                    last_error = %s,
+                    locked_at = NULL,
+                    next_attempt_at = now() + %s * INTERVAL '1 second'
+                WHERE id = ANY(%s) AND status = 'sending';
+                """,
+                (error, retry_in_seconds, outbox_ids)
+            )
+            connection.commit()
+    except Error as e:
+        print(f"Ошибка при возврате писем в очередь: {e}")
+
+
+def get_outbox_stats() -> Dict[str, int]:
+    """
+    Количество писем в очереди по статусам.
+    """
+    try:
+        with get_connection() as connection:
+            rows = fetch_all(connection, "SELECT status, COUNT(*) AS count FROM email_outbox GROUP BY status;")
+            return {row['status']: row['count'] for row in rows}
+    except Error as e:
+        print(f"Ошибка при получении статистики очереди писем: {e}")
+        return {}
+
+
+def get_analyzer_checkpoints(user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Контрольные точки массового анализа для группы пользователей: {user_id: запись}.
+    """
+    if not user_ids:
+        return {}
+    try:
+        with get_connection() as connection:
+            rows = fetch_all(
+                connection,
+                """
+                SELECT user_id, last_test_id, input_hash, necessity, analyzed_at
+                FROM analyzer_checkpoints WHERE user_id = ANY(%s);
+                """,
+                [list(user_ids)]
+            )
+            return {row['user_id']: row for row in rows}
+    except Error as e:
+        print(f"Ошибка при получении контрольных точек анализа: {e}")
+        return {}
+
+
+def save_analyzer_checkpoint(user_id: int, last_test_id: Optional[int], input_hash: str, necessity: Optional[bool]):
+    """
+    Сохраняет контрольную точку после успешного анализа пользователя.
+    """
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO analyzer_checkpoints (user_id, last_test_id, input_hash, necessity, analyzed_at)
+                VALUES (%s, %s, %s, %s, now())
+                ON CONFLICT (user_id) DO UPDATE SET
+                    last_test_id = EXCLUDED.last_test_id,
+                    input_hash = EXCLUDED.input_hash,
+                    necessity = EXCLUDED.necessity,
+                    analyzed_at = EXCLUDED.analyzed_at;
+                """,
+                (user_id, last_test_id, input_hash, necessity)
+            )
+            connection.commit()
+    except Error as e:
+        print(f"Ошибка при сохранении контрольной точки анализа пользователя {user_id}: {e}")
+
+
+def recompute_reaction_metrics(batch_size: int = 10000, only_outdated: bool = True) -> int:
+    """
+    Пересчитывает метрики теста реакции по сохраненным попыткам (reaction_analysis.analyze).
+    Каждая пачка читается одной строкой: склеенные попытки, их длины и id тестов,
+    считается одной матричной операцией и записывается одним UPDATE.
+    Возвращает число обновленных тестов.
+    """
+    outdated = "AND reaction_metrics_version IS DISTINCT FROM %s" if only_outdated else ""
+    query_batch = f"""
+    SELECT
+        array_agg(id ORDER BY id),
+        array_agg(octet_length(reaction_trials) / 4 ORDER BY id),
+        string_agg(reaction_trials, ''::bytea ORDER BY id)
+    FROM (
+        SELECT id, reaction_trials FROM burnout_tests
+        WHERE reaction_trials IS NOT NULL AND id > %s {outdated}
+        ORDER BY id
+        LIMIT %s
+    ) batch;
+    """
+    query_update = """
+    UPDATE burnout_tests AS b SET
+        reaction_trimmed_mean_ms = NULLIF(v.trimmed_mean, 'NaN'),
+        reaction_sd_ms = NULLIF(v.sd, 'NaN'),
+        reaction_fatigue_slope_ms = NULLIF(v.slope, 'NaN'),
+        reaction_lapses = v.lapses,
+        reaction_metrics_version = %s
+    FROM unnest(%s::int[], %s::real[], %s::real[], %s::real[], %s::smallint[])
+        AS v(id, trimmed_mean, sd, slope, lapses)
+    WHERE b.id = v.id;
+    """
+    updated = 0
+    last_id = 0
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            while True:
+                params = [last_id, METRICS_VERSION, batch_size] if only_outdated else [last_id, batch_size]
+                cursor.execute(query_batch, params)
+                ids, lengths, blob = cursor.fetchone()
+                if not ids:
+                    break
+                metrics = analyze(unpack_matrix(bytes(blob), np.array(lengths)))
+                cursor.execute(query_update, [
+                    METRICS_VERSION, ids,
+                    *(metrics[column].tolist() for column in METRIC_COLUMNS)
+                ])
+                connection.commit()
+                updated += len(ids)
+                last_id = ids[-1]
+    except Error as e:
+        print(f"Ошибка при пересчете метрик теста реакции: {e}")
+    return updated
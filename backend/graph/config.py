@@ -27,7 +27,7 @@ Analyze the provided employee data (MBI results and weekly work report) to creat
 - *Depersonalization (DP):* High scores suggest burnout.
 - *Personal Accomplishment (PA):* Low scores suggest burnout.
 
-**3. Weekly Work Activity Report:**
+**3. Work Activity Summary (hours, task statuses, overdue and blocked tasks, meeting load):**
 {user_work_data}
 
 ---
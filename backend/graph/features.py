@@ -0,0 +1,233 @@
+import datetime
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# Короткие имена показателей MBI в промпте
+SCORE_NAMES = {
+    'exhaustion': 'EE',
+    'depersonalization': 'DP',
+    'achievement': 'PA',
+    'burnout_score': 'burnout',
+    'mean_reaction_time_ms': 'reaction_ms',
+}
+# Имена тех же показателей в результатах текущего теста (submit_results)
+CURRENT_SCORE_NAMES = {
+    'exhaustion': 'EE',
+    'depersonalization': 'DP',
+    'achievement': 'PA',
+    'burnout': 'burnout',
+    'reaction_avg': 'reaction_ms',
+    'cognitive_index': 'cognitive_index',
+}
+# Имена средних из get_user_burnout_stats
+AVERAGE_NAMES = {
+    'avg_score1': 'EE',
+    'avg_score2': 'DP',
+    'avg_score3': 'PA',
+    'avg_burnout_score': 'burnout',
+    'avg_reaction_time_ms': 'reaction_ms',
+}
+
+
+def _round(value: Any, digits: int = 1) -> Any:
+    return round(value, digits) if isinstance(value, float) else value
+
+
+def _parse_date(value: str) -> Optional[datetime.date]:
+    try:
+        return datetime.datetime.strptime(value, "%d.%m.%Y").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def to_prompt(value: Any) -> str:
+    """
+    Компактная запись значения для промпта: JSON без пробелов и без экранирования кириллицы.
+    """
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def compact_profile(user_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Профиль сотрудника без пустых полей.
+    """
+    return {key: _round(value) for key, value in (user_data or {}).items() if value not in (None, '')}
+
+
+def activity_features(projects: List[Dict[str, Any]], today: Optional[datetime.date] = None) -> Dict[str, Any]:
+    """
+    Сводка рабочей активности из generate_project_data: часы по неделям, задачи по статусам,
+    просроченные и заблокированные задачи, нагрузка встречами.
+    """
+    today = today or datetime.date.today()
+    hours_by_week: Dict[str, float] = defaultdict(float)
+    statuses: Dict[str, int] = defaultdict(int)
+    overdue = 0
+    task_hours = 0.0
+    meetings = 0
+    meeting_hours = 0.0
+
+    for project in projects or []:
+        for task in project.get('tasks', []):
+            status = task.get('task_status')
+            statuses[status] += 1
+            deadline = _parse_date(task.get('deadline'))
+            if status != 'Done' and deadline is not None and deadline < today:
+                overdue += 1
+            for entry in task.get('spend_time', []):
+                hours = entry.get('hours') or 0
+                task_hours += hours
+                date = _parse_date(entry.get('date'))
+                if date is not None:
+                    year, week, _ = date.isocalendar()
+                    hours_by_week[f"{year}-W{week:02d}"] += hours
+        for meeting in project.get('meetings', []):
+            meetings += 1
+            minutes = meeting.get('spend_time') or 0
+            meeting_hours += minutes / 60
+            date = _parse_date(meeting.get('meetings_date'))
+            if date is not None:
+                year, week, _ = date.isocalendar()
+                hours_by_week[f"{year}-W{week:02d}"] += minutes / 60
+
+    weekly = [hours_by_week[week] for week in sorted(hours_by_week)]
+    total_hours = task_hours + meeting_hours
+    return {
+        'projects': len(projects or []),
+        'tasks': sum(statuses.values()),
+        'tasks_done': statuses.get('Done', 0),
+        'tasks_in_progress': statuses.get('In Progress', 0),
+        'tasks_todo': statuses.get('To Do', 0),
+        'tasks_blocked': statuses.get('Blocked', 0),
+        'tasks_overdue': overdue,
+        'hours_total': round(total_hours, 1),
+        'hours_per_week_avg': round(sum(weekly) / len(weekly), 1) if weekly else 0,
+        'hours_per_week_max': round(max(weekly), 1) if weekly else 0,
+        'weeks_over_40h': sum(1 for hours in weekly if hours > 40),
+        'meetings': meetings,
+        'meeting_hours': round(meeting_hours, 1),
+        'meeting_share': round(meeting_hours / total_hours, 2) if total_hours else 0,
+    }
+
+
+def history_features(last_tests: Optional[Dict[str, List[Any]]]) -> List[Dict[str, Any]]:
+    """
+    Последние тесты (столбцы get_user_burnout_stats) в виде коротких записей: дата и показатели.
+    """
+    if not last_tests or not last_tests.get('test_datetime'):
+        return []
+    history = []
+    for i, tested_at in enumerate(last_tests['test_datetime']):
+        record = {'date': tested_at.date().isoformat() if hasattr(tested_at, 'date') else str(tested_at)}
+        for column, name in SCORE_NAMES.items():
+            if column in last_tests:
+                record[name] = _round(last_tests[column][i])
+        history.append(record)
+    return history
+
+
+def averages_features(averages: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Средние по всем тестам с короткими именами показателей.
+    """
+    return {
+        AVERAGE_NAMES.get(key, key): _round(value)
+        for key, value in (averages or {}).items() if value is not None
+    }
+
+
+def score_deltas(current: Dict[str, Any], reference: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Изменение показателей относительно опорных значений (предыдущий тест или средние).
+    """
+    return {
+        name: _round(current[name] - reference[name])
+        for name in current
+        if isinstance(current.get(name), (int, float)) and isinstance(reference.get(name), (int, float))
+    }
+
+
+def current_test_features(
+    scores: Dict[str, Any],
+    history: List[Dict[str, Any]],
+    averages: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Результаты текущего теста и их изменение относительно последнего теста и средних.
+    """
+    current = {CURRENT_SCORE_NAMES.get(key, key): _round(value) for key, value in scores.items()}
+    features = {'scores': current}
+    if history:
+        features['delta_vs_last'] = score_deltas(current, history[0])
+    if averages:
+        features['delta_vs_avg'] = score_deltas(current, averages)
+    return features
+
+
+def trend_features(history: List[Dict[str, Any]], averages: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Изменение между двумя последними тестами и отклонение последнего теста от средних.
+    """
+    if not history:
+        return {}
+    features = {'tests': len(history)}
+    if len(history) > 1:
+        features['delta_last_vs_prev'] = score_deltas(history[0], history[1])
+    if averages:
+        features['delta_last_vs_avg'] = score_deltas(history[0], averages)
+    return features
+
+
+def estimate_tokens(llm: Any, text: str) -> int:
+    """
+    Число токенов промпта: токенизатором локальной модели, если он доступен,
+    иначе приближенно (около 4 символов на токен) без обращения к API провайдера.
+    """
+    pipe = getattr(llm, 'pipeline', None) or getattr(getattr(llm, 'batcher', None), 'pipe', None)
+    tokenizer = getattr(pipe, 'tokenizer', None)
+    if tokenizer is not None:
+        try:
+            return len(tokenizer.encode(text))
+        except Exception:
+            pass
+    return max(1, len(text) // 4)
+
+
+class PromptStats:
+    """
+    Размер промптов по графам: число запросов, символы и токены (среднее, максимум, последний).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, graph_name: str, llm: Any, prompt: str) -> int:
+        tokens = estimate_tokens(llm, prompt)
+        with self._lock:
+            stats = self._stats.setdefault(
+                graph_name, {"requests": 0, "chars_total": 0, "tokens_total": 0, "tokens_max": 0}
+            )
+            stats["requests"] += 1
+            stats["chars_total"] += len(prompt)
+            stats["tokens_total"] += tokens
+            stats["tokens_max"] = max(stats["tokens_max"], tokens)
+            stats["tokens_last"] = tokens
+        logging.info(f"Промпт {graph_name}: {len(prompt)} символов, ~{tokens} токенов")
+        return tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                name: {
+                    **stats,
+                    "tokens_avg": round(stats["tokens_total"] / stats["requests"], 1),
+                }
+                for name, stats in self._stats.items()
+            }
+
+
+prompt_stats = PromptStats()
@@ -1,40 +1,126 @@
+import asyncio
 import logging
-from langchain_core.output_parsers import PydanticOutputParser
+import os
+import threading
+import weakref
+from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
+from langchain_core.utils.json import parse_json_markdown
 from typing import TypedDict, Dict, List, Any
 from random import randint
 
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END
 
 from graph.answer_schema import LLMResponse
 
 from graph.config import prompt_template
-from graph.tasks_generation import generate_project_data
+from graph.features import (
+    activity_features, averages_features, compact_profile, current_test_features, history_features,
+    prompt_stats, to_prompt
+)
+from graph.tasks_generation import activity_seed, generate_project_data
+from graph.triage import ROUTE_RULE, templated_response, triage, verdict_source
 
-from db_utils import get_user_burnout_stats, get_user_data, save_burnout_test_result
+from llm_cache import llm_cache, schema_hash
+from db_utils import (
+    PROMPT_PROFILE_COLUMNS, buffer_burnout_test_result, get_user_burnout_stats, get_user_profile,
+    pool, save_burnout_test_result, test_write_buffer, update_llm_verdict
+)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Парсер и инструкции по формату не зависят от запроса, поэтому считаются один раз
+parser = PydanticOutputParser(pydantic_object=LLMResponse)
+format_instructions = parser.get_format_instructions()
+response_schema = schema_hash(LLMResponse)
+
+# Одновременные обращения графа к БД. get_data держит два соединения пула сразу (профиль и статистика),
+# поэтому по умолчанию половина DB_POOL_MAX без одного слота: пул не исчерпывается
+# при любом JOB_WORKERS и остаются соединения для запросов дашборда
+GRAPH_DB_CONCURRENCY = int(os.getenv('GRAPH_DB_CONCURRENCY', max(1, pool.maxconn // 2 - 1)))
+_db_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def db_slots() -> asyncio.Semaphore:
+    # Семафор создается для каждого цикла событий: asyncio.Semaphore привязан к циклу
+    loop = asyncio.get_running_loop()
+    slots = _db_slots.get(loop)
+    if slots is None:
+        slots = _db_slots[loop] = asyncio.Semaphore(GRAPH_DB_CONCURRENCY)
+    return slots
+
+
+# Скомпилированные графы по идентификатору бэкенда LLM
+_compiled_graphs: Dict[str, Any] = {}
+_compiled_graphs_lock = threading.Lock()
+
 
 class AgentState(TypedDict):
     user_id: int
+    # Задан для уже сохраненного теста (пакетная загрузка): граф только записывает вердикт
+    test_id: int
     scores: Dict[str, int]
+    reaction_times: List[int]
     user_activity: List[Dict[str, Any]]
     user_data: Dict[str, Any]
     prev_results: Dict[str, Any]
     avg_results: Dict[str, Any]
+    triage: Dict[str, Any]
     llm_response: LLMResponse
 
 
-def create(llm: Any):
-    def get_data_node(state: AgentState):
+def partial_recommendation(text: str) -> str:
+    """
+    Достает текст рекомендации из недописанного JSON-ответа LLM.
+    """
+    try:
+        data = parse_json_markdown(text)
+    except Exception:
+        return ""
+    recommendation = data.get("recommendation") if isinstance(data, dict) else None
+    return recommendation if isinstance(recommendation, str) else ""
+
+
+def create(llm: Any, backend_id: str = "default"):
+    # Узлы асинхронные: граф выполняется через ainvoke/astream в цикле событий.
+    # Ответ LLM читается потоком, чтобы при graph.astream(stream_mode="custom")
+    # текст рекомендации уходил клиенту по мере генерации
+    chain = prompt_template | llm | StrOutputParser()
+
+    async def triage_node(state: AgentState):
         """
-        Узел получения данных
+        Узел триажа: уверенные случаи получают вердикт и шаблонную рекомендацию без LLM.
+        """
+        logging.info("--- Узел: Триаж ---")
+        decision = triage.route(state['scores'])
+        if decision["route"] != ROUTE_RULE:
+            return {"triage": decision}
+
+        res = templated_response(decision["verdict"], state['scores'], triage.thresholds)
+        get_stream_writer()({"recommendation_delta": res["recommendation"]})
+        logging.info(f"Триаж: вердикт {decision['verdict']} без вызова LLM.")
+        return {"triage": decision, "llm_response": res}
+
+    def route_after_triage(state: AgentState) -> str:
+        return "save_to_db" if state.get('llm_response') else "get_data"
+
+    async def get_data_node(state: AgentState):
+        """
+        Узел получения данных: генерация активности, профиль и статистика тестов
+        загружаются одновременно, запросы к БД выполняются в потоках.
+        Если профиль или статистику загрузить не удалось (в том числе из-за нехватки
+        соединений в пуле), задание завершается ошибкой, а не промптом с пустыми данными.
         """
         logging.info("--- Узел: Получение данных ---")
         user_id = state['user_id']
-        user_activity = generate_project_data(4, 10, 10, 15)
-        user_data = get_user_data(user_id)
-        prev_results, avg_results = get_user_burnout_stats(user_id)
+        async with db_slots():
+            user_activity, user_data, (prev_results, avg_results) = await asyncio.gather(
+                asyncio.to_thread(generate_project_data, 4, 10, 10, 15, activity_seed(user_id)),
+                asyncio.to_thread(get_user_profile, user_id, PROMPT_PROFILE_COLUMNS),
+                asyncio.to_thread(get_user_burnout_stats, user_id, 3, state.get('test_id')),
+            )
+        if user_data is None or prev_results is None:
+            raise RuntimeError(f"Не удалось загрузить профиль или историю тестов пользователя {user_id}")
         logging.info("Данные получены.")
 
         return {
@@ -44,54 +130,113 @@ def create(llm: Any):
             "avg_results": avg_results
         }
 
-    def llm_node(state: AgentState):
+    async def llm_node(state: AgentState):
         """
         Вызов выбранной LLM со структурированным выводом.
         """
         logging.info("--- Узел: Вызов LLM ---")
-        parser = PydanticOutputParser(pydantic_object=LLMResponse)
+        # Вместо сырых структур в промпт попадают компактные сводки
+        history = history_features(state['prev_results'])
+        averages = averages_features(state['avg_results'])
         input_vars = {
-            "user_data": state['user_data'],
-            "prev_test_resulst": state['prev_results'],
-            "test_results": state['scores'],
-            "user_work_data": state['user_activity'],
-            "avg_results": state['avg_results'],
-            "instructions": parser.get_format_instructions()
+            "user_data": to_prompt(compact_profile(state['user_data'])),
+            "prev_test_resulst": to_prompt(history),
+            "test_results": to_prompt(current_test_features(state['scores'], history, averages)),
+            "user_work_data": to_prompt(activity_features(state['user_activity'])),
+            "avg_results": to_prompt(averages),
+            "instructions": format_instructions
         }
-        chain = prompt_template | llm | parser
-        res = chain.invoke(input_vars).model_dump()
+        writer = get_stream_writer()
+        streamed = False
+
+        async def generate():
+            nonlocal streamed
+            streamed = True
+            text = ""
+            sent = ""
+            async for chunk in chain.astream(input_vars):
+                text += chunk
+                recommendation = partial_recommendation(text)
+                if len(recommendation) > len(sent) and recommendation.startswith(sent):
+                    writer({"recommendation_delta": recommendation[len(sent):]})
+                    sent = recommendation
+            return parser.parse(text).model_dump()
+
+        prompt = prompt_template.format(**input_vars)
+        prompt_stats.record("submit_results", llm, prompt)
+        res = await llm_cache.aget_or_call(backend_id, prompt, response_schema, generate)
+        if not streamed and res.get("recommendation"):
+            # Ответ из кэша отдается в поток целиком
+            writer({"recommendation_delta": res["recommendation"]})
+        triage.record_llm_verdict(state.get('triage'), res.get("score"))
         logging.info("LLM вернула ответ.")
         return {"llm_response": res}
     
-    def db_save_node(state: AgentState):
+    async def db_save_node(state: AgentState):
         """
-        Узел сохранения результатов теста в базу данных.
+        Узел сохранения результатов теста в базу данных (в потоке, не блокируя цикл событий).
         """
         logging.info("--- Узел: Сохранение данных в БД ---")
         try:
             user_id = state['user_id']
             scores = state['scores']
             llm_response = state['llm_response']
+            source = verdict_source(state.get('triage'))
             
-            save_burnout_test_result(
-                user_id=user_id,
-                scores=scores,
-                llm_response=llm_response
-            )
+            if state.get('test_id'):
+                async with db_slots():
+                    await asyncio.to_thread(update_llm_verdict, state['test_id'], llm_response.get('score'), source)
+            elif test_write_buffer.enabled:
+                # Запись на диск буфера вместо транзакции в БД; в БД тест попадет при сбросе пачки
+                await asyncio.to_thread(
+                    buffer_burnout_test_result, user_id, scores, llm_response, state.get('reaction_times'), source
+                )
+            else:
+                async with db_slots():
+                    test_id = await asyncio.to_thread(
+                        save_burnout_test_result,
+                        user_id=user_id,
+                        scores=scores,
+                        llm_response=llm_response,
+                        reaction_times=state.get('reaction_times'),
+                        verdict_source=source
+                    )
+                if test_id is None:
+                    raise RuntimeError("результат теста не сохранен")
         except Exception as e:
             logging.error(f"Не удалось сохранить данные в БД: {e}")
+            if not state.get('test_id'):
+                # Результат теста не сохранен (в том числе буфер записи заполнен дольше
+                # WRITE_BUFFER_ADD_TIMEOUT_MS): задание завершается с ошибкой, клиент повторяет отправку.
+                # Вердикт сохраненного теста при ошибке повторно запишет sweep_missing_verdicts
+                raise
         
         return {}
     
     workflow = StateGraph(AgentState)
+    workflow.add_node("triage", triage_node)
     workflow.add_node("get_data", get_data_node)
     workflow.add_node("llm", llm_node)
     workflow.add_node("save_to_db", db_save_node)
 
-    workflow.set_entry_point("get_data")
+    workflow.set_entry_point("triage")
+    workflow.add_conditional_edges("triage", route_after_triage, ["get_data", "save_to_db"])
     workflow.add_edge("get_data", "llm")
     workflow.add_edge("llm", "save_to_db")
     workflow.add_edge("save_to_db", END)
 
     return workflow.compile()
 
+
+def get_graph(backend_id: str, llm: Any):
+    """
+    Возвращает скомпилированный граф для бэкенда LLM, собирая его только при первом обращении.
+    """
+    graph = _compiled_graphs.get(backend_id)
+    if graph is None:
+        with _compiled_graphs_lock:
+            graph = _compiled_graphs.get(backend_id)
+            if graph is None:
+                graph = create(llm, backend_id)
+                _compiled_graphs[backend_id] = graph
+    return graph
@@ -1,6 +1,7 @@
 import random
 import datetime
 import json
+from typing import Optional
 
 project_name_pool = [
     "Jupiter Expedition", "Project Phoenix", "QuantumLeap", "Starlight", "Omega Protocol",
@@ -80,51 +81,67 @@ task_name_pool = [
 meeting_name_pool = ["Daily Standup", "Sprint Planning", "Retrospective", "Client Demo", "Technical Deep Dive"]
 task_status_pool = ["In Progress", "Done", "To Do", "Blocked"]
 
-def generate_random_date(start_year=2025, end_year=2025, start_month=9, start_date=1):
+def generate_random_date(start_year=2025, end_year=2025, start_month=9, start_date=1, rng=random):
     """Генерирует случайную дату в указанном диапазоне."""
     start_date = datetime.date(start_year, start_month, start_date)
     end_date = datetime.date(end_year, 11, 15)
     time_between_dates = end_date - start_date
     days_between_dates = time_between_dates.days
-    random_number_of_days = random.randrange(days_between_dates)
+    random_number_of_days = rng.randrange(days_between_dates)
     random_date = start_date + datetime.timedelta(days=random_number_of_days)
     return random_date.strftime("%d.%m.%Y")
 
-def generate_project_data(num_projects: int = 2, max_tasks: int = 3, max_meetings: int = 3, max_time_entries: int = 3):
+def activity_seed(user_id: int, day: Optional[datetime.date] = None) -> str:
+    """
+    Зерно генерации активности: одно на сотрудника и день, чтобы повторные запуски
+    и ретраи строили тот же промпт и попадали в кэш ответов LLM.
+    """
+    return f"{user_id}:{(day or datetime.date.today()).isoformat()}"
+
+
+def generate_project_data(
+    num_projects: int = 2,
+    max_tasks: int = 3,
+    max_meetings: int = 3,
+    max_time_entries: int = 3,
+    seed: Optional[str] = None
+):
     """
     Генерирует список случайных данных по проектам на основе предопределенных пулов,
     сохраняя исходную структуру, предоставленную пользователем.
+    При заданном seed (см. activity_seed) результат детерминирован.
     """
+    rng = random.Random(seed) if seed is not None else random
     tasks_on_projects = []
 
     for _ in range(num_projects):
         project = {
-            "project_name": random.choice(project_name_pool),
+            "project_name": rng.choice(project_name_pool),
             "tasks": [],
             "meetings": []
         }
 
-        for _ in range(random.randint(1, max_tasks)):
+        for _ in range(rng.randint(1, max_tasks)):
             task = {
-                "task_name": random.choice(task_name_pool),
-                "task_status": random.choice(task_status_pool),
+                "task_name": rng.choice(task_name_pool),
+                "task_status": rng.choice(task_status_pool),
                 "spend_time": [],
-                "deadline": generate_random_date()
+                "deadline": generate_random_date(rng=rng)
             }
 
-            for _ in range(random.randint(1, max_time_entries)):
+            for _ in range(rng.randint(1, max_time_entries)):
                 time_entry = {
-                    "date": generate_random_date(),
-                    "hours": random.randint(1, 8)
+                    "date": generate_random_date(rng=rng),
+                    "hours": rng.randint(1, 8)
                 }
                 task["spend_time"].append(time_entry)
             project["tasks"].append(task)
 
-        for _ in range(random.randint(1, max_meetings)):
+        for _ in range(rng.randint(1, max_meetings)):
             meeting = {
-                "meetings_name": random.choice(meeting_name_pool),
-                "meetings_date": generate_random_date(),
-                "spend_time": random.choice([15, 30, 45, 60, 90]) # в минутах
+                "meetings_name": rng.choice(meeting_name_pool),
+                "meetings_date": generate_random_date(rng=rng),
+                "spend_time": rng.choice([15, 30, 45, 60, 90]) # в минутах
             }
             project["meetings"].append(meeting)
 
@@ -0,0 +1,223 @@
+import logging
+import math
+import os
+import random
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+# Маршруты результата после триажа
+ROUTE_RULE = "rule"
+ROUTE_LLM = "llm"
+ROUTE_SHADOW = "shadow"
+
+LOW_RISK_RECOMMENDATION = (
+    "Ваши результаты не показывают признаков выгорания: уровень эмоционального истощения и "
+    "деперсонализации низкий, ощущение профессиональной эффективности высокое, скорость реакции в норме. "
+    "Продолжайте поддерживать баланс между работой и отдыхом: планируйте перерывы в течение дня, "
+    "не переносите рабочие задачи на вечер и выходные и оставляйте время на занятия, которые вас восстанавливают. "
+    "Регулярно проходите тест, чтобы вовремя заметить изменения."
+)
+
+HIGH_RISK_RECOMMENDATION = (
+    "Ваши результаты указывают на высокий риск выгорания: {signs}. "
+    "Постарайтесь в ближайшее время обсудить нагрузку с руководителем и договориться о приоритетах - "
+    "какие задачи можно перенести, делегировать или упростить. "
+    "Выделяйте время на полноценный отдых и сон, делайте короткие перерывы каждые 1-2 часа и "
+    "не отвечайте на рабочие сообщения вне рабочего времени. "
+    "Если напряжение не снижается, обратитесь к специалисту по психологической поддержке."
+)
+
+HIGH_RISK_SIGNS = {
+    "exhaustion": "высокое эмоциональное истощение",
+    "depersonalization": "выраженная деперсонализация",
+    "achievement": "сниженное ощущение профессиональной эффективности",
+    "cognitive_index": "замедленная реакция",
+}
+
+
+def burnout_level(exhaustion: float, depersonalization: float, achievement: float) -> float:
+    """
+    Интегральный уровень выгорания от 0 до 1, как его считает MaslachTest на фронтенде.
+    """
+    return math.sqrt(
+        ((exhaustion / 54) ** 2 + (depersonalization / 30) ** 2 + (1 - achievement / 48) ** 2) / 3
+    )
+
+
+def cognitive_index(reaction_avg_ms: float) -> float:
+    """
+    Когнитивный индекс от 0 до 100 по средней скорости реакции, как его считает ReactionTest.
+    """
+    index = 100.0
+    if reaction_avg_ms > 250:
+        index -= (reaction_avg_ms - 250) * 0.1
+    if reaction_avg_ms > 350:
+        index -= (reaction_avg_ms - 350) * 0.2
+    return max(0.0, min(100.0, index))
+
+
+@dataclass
+class TriageThresholds:
+    """
+    Пороги уверенного решения без LLM. Границы шкал MBI - стандартные пороги
+    низкого и высокого уровня (EE 0-54, DP 0-30, PA 0-48).
+    """
+    exhaustion_low: float = 16
+    exhaustion_high: float = 27
+    depersonalization_low: float = 6
+    depersonalization_high: float = 13
+    achievement_low: float = 31
+    achievement_high: float = 39
+    burnout_low: float = 0.3
+    burnout_high: float = 0.45
+    cognitive_ok: float = 70
+
+    @classmethod
+    def from_env(cls) -> "TriageThresholds":
+        values = {}
+        for name, default in asdict(cls()).items():
+            values[name] = float(os.getenv(f"TRIAGE_{name.upper()}", default))
+        return cls(**values)
+
+
+def classify(scores: Dict[str, Any], thresholds: TriageThresholds) -> Optional[int]:
+    """
+    Вердикт по результатам теста: 0 - выгорания нет, 1 - выгорание,
+    None - случай неоднозначный и решение остается за LLM.
+    """
+    try:
+        exhaustion = float(scores['exhaustion'])
+        depersonalization = float(scores['depersonalization'])
+        achievement = float(scores['achievement'])
+        burnout = float(scores['burnout'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    cognitive = scores.get('cognitive_index')
+
+    if (
+        exhaustion >= thresholds.exhaustion_high
+        and depersonalization >= thresholds.depersonalization_high
+        and achievement <= thresholds.achievement_low
+        and burnout >= thresholds.burnout_high
+    ):
+        return 1
+    if (
+        exhaustion <= thresholds.exhaustion_low
+        and depersonalization <= thresholds.depersonalization_low
+        and achievement >= thresholds.achievement_high
+        and burnout <= thresholds.burnout_low
+        and cognitive is not None and cognitive >= thresholds.cognitive_ok
+    ):
+        return 0
+    return None
+
+
+def verdict_source(decision: Optional[Dict[str, Any]]) -> str:
+    """
+    Источник вердикта для burnout_tests.verdict_source: 'rule', если вердикт вынесли правила, иначе 'llm'.
+    """
+    return ROUTE_RULE if decision and decision.get("route") == ROUTE_RULE else ROUTE_LLM
+
+
+def templated_response(verdict: int, scores: Dict[str, Any], thresholds: TriageThresholds) -> Dict[str, Any]:
+    """
+    Ответ в формате LLMResponse для уверенного решения триажа.
+    """
+    if verdict == 0:
+        return {"recommendation": LOW_RISK_RECOMMENDATION, "score": 0}
+    signs = [HIGH_RISK_SIGNS["exhaustion"], HIGH_RISK_SIGNS["depersonalization"], HIGH_RISK_SIGNS["achievement"]]
+    cognitive = scores.get('cognitive_index')
+    if cognitive is not None and cognitive < thresholds.cognitive_ok:
+        signs.append(HIGH_RISK_SIGNS["cognitive_index"])
+    return {"recommendation": HIGH_RISK_RECOMMENDATION.format(signs=", ".join(signs)), "score": 1}
+
+
+class Triage:
+    """
+    Правиловый этап перед LLM: уверенные случаи получают вердикт и шаблонную рекомендацию
+    без вызова модели, неоднозначные уходят в LLM.
+
+    Доля shadow_rate уверенных случаев все равно отправляется в LLM, и ее вердикт
+    сравнивается с вердиктом правил - так собирается согласованность для подбора порогов.
+    При enabled=False в LLM уходят все случаи, а согласованность считается по всем уверенным.
+    """
+
+    def __init__(self, thresholds: TriageThresholds, enabled: bool = True, shadow_rate: float = 0.05):
+        self.thresholds = thresholds
+        self.enabled = enabled
+        self.shadow_rate = shadow_rate
+
+        self._lock = threading.Lock()
+        self._routes = {ROUTE_RULE: 0, ROUTE_LLM: 0, ROUTE_SHADOW: 0}
+        self._rule_verdicts = {0: 0, 1: 0}
+        self._compared = {0: 0, 1: 0}
+        self._agreed = {0: 0, 1: 0}
+        self._llm_verdicts = {0: 0, 1: 0}
+
+    @classmethod
+    def from_env(cls) -> "Triage":
+        return cls(
+            thresholds=TriageThresholds.from_env(),
+            enabled=os.getenv('TRIAGE', '1') != '0',
+            shadow_rate=float(os.getenv('TRIAGE_SHADOW_RATE', 0.05)),
+        )
+
+    def route(self, scores: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Решение для одного теста: {"verdict": 0 | 1 | None, "route": rule | llm | shadow}.
+        """
+        verdict = classify(scores, self.thresholds)
+        if verdict is None:
+            route = ROUTE_LLM
+        elif not self.enabled or random.random() < self.shadow_rate:
+            route = ROUTE_SHADOW
+        else:
+            route = ROUTE_RULE
+        with self._lock:
+            self._routes[route] += 1
+            if verdict is not None:
+                self._rule_verdicts[verdict] += 1
+        return {"verdict": verdict, "route": route}
+
+    def record_llm_verdict(self, decision: Optional[Dict[str, Any]], llm_verdict: Any):
+        """
+        Учитывает вердикт LLM: для теневых проверок сравнивает его с вердиктом правил.
+        """
+        if llm_verdict not in (0, 1):
+            return
+        with self._lock:
+            self._llm_verdicts[llm_verdict] += 1
+            if decision and decision.get("route") == ROUTE_SHADOW:
+                verdict = decision["verdict"]
+                self._compared[verdict] += 1
+                if verdict == llm_verdict:
+                    self._agreed[verdict] += 1
+                else:
+                    logging.info(f"Триаж: вердикт правил {verdict} не совпал с вердиктом LLM {llm_verdict}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decisions = sum(self._routes.values())
+            compared = sum(self._compared.values())
+            agreed = sum(self._agreed.values())
+            return {
+                "enabled": self.enabled,
+                "shadow_rate": self.shadow_rate,
+                "thresholds": asdict(self.thresholds),
+                "decisions": decisions,
+                "routes": dict(self._routes),
+                "rule_share": round(self._routes[ROUTE_RULE] / decisions, 3) if decisions else 0.0,
+                "confident_share": round(sum(self._rule_verdicts.values()) / decisions, 3) if decisions else 0.0,
+                "rule_verdicts": dict(self._rule_verdicts),
+                "llm_verdicts": dict(self._llm_verdicts),
+                "shadow_compared": compared,
+                "agreement": round(agreed / compared, 3) if compared else None,
+                "agreement_by_verdict": {
+                    verdict: round(self._agreed[verdict] / self._compared[verdict], 3) if self._compared[verdict] else None
+                    for verdict in (0, 1)
+                },
+            }
+
+
+triage = Triage.from_env()
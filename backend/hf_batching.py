@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from histogram import Histogram
+
+# Границы корзин гистограммы ожидания в очереди, миллисекунды
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class MicroBatcher:
+    """
+    Собирает одновременные промпты к локальной модели в пачки и генерирует их одним вызовом
+    pipeline: пачка отправляется, когда набралось max_batch_size промптов или с момента
+    прихода первого из них прошло max_wait_ms. Результат возвращается каждому вызывающему
+    через его Future. generate ждет результата не дольше timeout секунд (None - без ограничения).
+    """
+
+    def __init__(self, pipe: Any, max_batch_size: int = 8, max_wait_ms: float = 20.0, timeout: Optional[float] = 300.0):
+        self.pipe = pipe
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout
+
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes = Histogram(range(1, max_batch_size + 1))
+        self._queue_wait = Histogram(WAIT_BUCKETS_MS)
+        self._batches = 0
+        self._generate_seconds = 0.0
+
+        self._prepare_tokenizer()
+        self._thread = threading.Thread(target=self._loop, name='hf-batcher', daemon=True)
+        self._thread.start()
+
+    def _prepare_tokenizer(self):
+        # Для пачки промптов разной длины нужен токен дополнения; у декодерных моделей
+        # дополнение должно быть слева, чтобы генерация продолжала текст промпта
+        tokenizer = getattr(self.pipe, 'tokenizer', None)
+        if tokenizer is None:
+            return
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = 'left'
+
+    def submit(self, prompt: str) -> Future:
+        future: Future = Future()
+        self._queue.put((prompt, future, time.perf_counter()))
+        return future
+
+    def generate(self, prompt: str) -> str:
+        future = self.submit(prompt)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # Промпт, еще не попавший в пачку, не будет сгенерирован
+            future.cancel()
+            raise TimeoutError(f"Генерация не завершилась за {self.timeout} с")
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            # Промпты, отмененные по таймауту до начала генерации, пропускаются
+            batch = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._run(batch)
+            except Exception as e:
+                logging.error(f"Ошибка обработки пачки из {len(batch)} промптов: {e}")
+                error = e
+            else:
+                error = None
+            # Каждый вызывающий получает результат или исключение, иначе generate ждал бы вечно
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error or RuntimeError("Модель не вернула результат для промпта"))
+
+    def _run(self, batch: List[tuple]):
+        started = time.perf_counter()
+        with self._lock:
+            self._batches += 1
+            self._batch_sizes.observe(len(batch))
+            for _, _, queued_at in batch:
+                self._queue_wait.observe((started - queued_at) * 1000)
+
+        prompts = [prompt for prompt, _, _ in batch]
+        outputs = self.pipe(prompts, batch_size=len(prompts), return_full_text=False)
+
+        with self._lock:
+            self._generate_seconds += time.perf_counter() - started
+        for (_, future, _), output in zip(batch, outputs):
+            # pipeline возвращает для каждого промпта список вариантов генерации
+            candidate = output[0] if isinstance(output, list) else output
+            future.set_result(candidate["generated_text"])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "generate_avg_ms": round(self._generate_seconds / self._batches * 1000, 1) if self._batches else 0.0,
+                "batch_size": self._batch_sizes.snapshot(),
+                "queue_wait_ms": self._queue_wait.snapshot(),
+            }
+
+
+class BatchedHuggingFacePipeline(LLM):
+    """
+    LLM для LangChain поверх MicroBatcher: каждый вызов ставит промпт в общую очередь
+    и ждет своего результата. Пачка генерируется pipeline целиком, поэтому потоковой выдачи
+    по токенам нет: astream (потоковый /api/submit_results/stream) получает весь ответ
+    одним фрагментом после генерации пачки.
+    """
+
+    batcher: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "batched_huggingface_pipeline"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        text = self.batcher.generate(prompt)
+        if stop:
+            for token in stop:
+                index = text.find(token)
+                if index != -1:
+                    text = text[:index]
+        return text
+
+    async def _astream(
+        self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any
+    ) -> AsyncIterator[GenerationChunk]:
+        # Генерация ждет пачку в отдельном потоке, чтобы не блокировать цикл событий
+        text = await asyncio.to_thread(self._call, prompt, stop, None, **kwargs)
+        chunk = GenerationChunk(text=text)
+        if run_manager:
+            await run_manager.on_llm_new_token(text, chunk=chunk)
+        yield chunk
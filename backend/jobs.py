@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """
+    Очередь заданий заполнена: новое задание не принято.
+    """
+
+
+class JobQueue:
+    """
+    Очередь фоновых заданий: обычные функции выполняются на ограниченном пуле потоков,
+    корутинные функции - задачами в цикле событий вызывающего (submit из async-кода).
+
+    - одновременно выполняется не более max_workers заданий каждого вида, ожидают не более max_pending;
+    - состояние и результат задания хранятся в памяти процесса retention секунд после завершения
+      (устаревшие удаляются при submit и при чтении). Состояние не разделяется между процессами:
+      при нескольких воркерах uvicorn /api/jobs/{id} на другом воркере вернет 404;
+    - отмененное задание (остановка сервера, cancel задачи) завершается со статусом failed;
+    - для каждого задания фиксируется время ожидания в очереди и время выполнения.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 100, retention: float = 3600.0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._futures: Dict[str, Any] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._running = 0
+
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Dict[str, Any]:
+        """
+        Ставит задание в очередь и сразу возвращает его состояние.
+        Если очередь заполнена, бросает QueueFullError.
+        """
+        with self._lock:
+            self._purge()
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise QueueFullError(f"В очереди уже {self._pending} заданий")
+            job_id = uuid.uuid4().hex
+            job = {
+                "job_id": job_id,
+                "status": JOB_QUEUED,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "queue_wait_ms": None,
+                "run_ms": None,
+                "result": None,
+                "error": None,
+            }
+            self._jobs[job_id] = job
+            self._pending += 1
+            if asyncio.iscoroutinefunction(func):
+                # Корутина не занимает поток: в одном процессе может выполняться много заданий сразу
+                self._futures[job_id] = asyncio.get_running_loop().create_task(
+                    self._run_async(job_id, func, args, kwargs)
+                )
+            else:
+                self._futures[job_id] = self._executor.submit(self._run, job_id, func, args, kwargs)
+            return dict(job)
+
+    def _start(self, job_id: str) -> float:
+        started = time.time()
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = JOB_RUNNING
+            job["started_at"] = started
+            self._pending -= 1
+            self._running += 1
+        return started
+
+    def _run(self, job_id: str, func: Callable[..., Any], args, kwargs):
+        started = self._start(job_id)
+        result, error = None, None
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            logging.exception(f"Задание {job_id} завершилось с ошибкой")
+            error = str(e)
+        self._finish(job_id, started, result, error)
+
+    async def _run_async(self, job_id: str, func: Callable[..., Any], args, kwargs):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        started = None
+        result, error = None, "Задание отменено"
+        try:
+            async with self._slots:
+                started = self._start(job_id)
+                try:
+                    result = await func(*args, **kwargs)
+                    error = None
+                except Exception as e:
+                    logging.exception(f"Задание {job_id} завершилось с ошибкой")
+                    error = str(e)
+        finally:
+            # CancelledError не перехватывается выше: задание все равно завершается,
+            # иначе оно навсегда останется queued/running, а счетчики stats() не уменьшатся
+            self._finish(job_id, started, result, error)
+
+    def _finish(self, job_id: str, started: Optional[float], result: Any, error: Optional[str]):
+        # started=None - задание отменено, не дождавшись запуска
+        finished = time.time()
+        with self._lock:
+            job = self._jobs[job_id]
+            if started is None:
+                started = finished
+                self._pending -= 1
+            else:
+                self._running -= 1
+            waited = started - job["created_at"]
+            took = finished - started
+            job.update({
+                "status": JOB_FAILED if error else JOB_DONE,
+                "finished_at": finished,
+                "queue_wait_ms": round(waited * 1000, 1),
+                "run_ms": round(took * 1000, 1),
+                "result": result,
+                "error": error,
+            })
+            if error:
+                self._failed += 1
+            else:
+                self._completed += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._run_total += took
+            self._run_max = max(self._run_max, took)
+            self._futures.pop(job_id, None)
+
+    def _purge(self):
+        # Завершенные задания удаляются по истечении retention (вызывается под блокировкой)
+        deadline = time.time() - self.retention
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < deadline
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def is_full(self) -> bool:
+        """
+        Заполнена ли очередь: следующий submit бросит QueueFullError.
+        """
+        with self._lock:
+            return self._pending >= self.max_pending
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает копию состояния задания или None, если задание неизвестно.
+        """
+        with self._lock:
+            self._purge()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Асинхронно ждет завершения задания, не блокируя цикл событий.
+        """
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.get(job_id)
+
+    async def join(self):
+        """
+        Дожидается всех принятых асинхронных заданий.
+        """
+        with self._lock:
+            tasks = [future for future in self._futures.values() if isinstance(future, asyncio.Task)]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Останавливает пул; при wait=True дожидается уже принятых заданий в потоках.
+        """
+        self._executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "queue_depth": self._pending,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "queue_wait_avg_ms": round(self._wait_total / finished * 1000, 1) if finished else 0.0,
+                "queue_wait_max_ms": round(self._wait_max * 1000, 1),
+                "run_avg_ms": round(self._run_total / finished * 1000, 1) if finished else 0.0,
+                "run_max_ms": round(self._run_max * 1000, 1),
+            }
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Type
+
+from pydantic import BaseModel
+
+
+def schema_hash(model: Type[BaseModel]) -> str:
+    """
+    Хэш JSON-схемы ответа: при изменении схемы парсера старые записи перестают находиться.
+    """
+    schema = json.dumps(model.model_json_schema(), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(schema.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Кэш разобранных ответов LLM на диске (SQLite), общий для процессов backend и анализатора.
+
+    - ключ: идентификатор бэкенда LLM, хэш текста промпта и хэш схемы парсера;
+    - записи старше ttl секунд не возвращаются и удаляются;
+    - при превышении max_bytes вытесняются давно не использованные записи;
+    - enabled=False отключает кэш (например, при генерации с сэмплированием).
+    """
+
+    def __init__(self, path: str, ttl: float, max_bytes: int, enabled: bool = True):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls) -> "LLMResponseCache":
+        return cls(
+            path=os.getenv('LLM_CACHE_PATH', 'llm_cache.sqlite3'),
+            ttl=float(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600)),
+            max_bytes=int(float(os.getenv('LLM_CACHE_MAX_MB', 100)) * 1024 * 1024),
+            enabled=os.getenv('LLM_CACHE', '1') != '0',
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        # Файл открывается при первом обращении, вызывается под блокировкой
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses (last_access)")
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def make_key(backend_id: str, prompt: str, schema: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        return hashlib.sha256(f"{backend_id}\n{prompt_hash}\n{schema}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                row = db.execute("SELECT value, created_at FROM llm_responses WHERE key = ?", (key,)).fetchone()
+                if row is None or row[1] < now - self.ttl:
+                    if row is not None:
+                        db.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                        db.commit()
+                    self.misses += 1
+                    return None
+                db.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key))
+                db.commit()
+                self.hits += 1
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.warning(f"Кэш ответов LLM недоступен: {e}")
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, data, len(data.encode('utf-8')), now, now)
+                )
+                self.writes += 1
+                self._evict(db, now)
+                db.commit()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.warning(f"Не удалось записать ответ LLM в кэш: {e}")
+
+    def _evict(self, db: sqlite3.Connection, now: float):
+        expired = db.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl,)).rowcount
+        self.evictions += max(expired, 0)
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Вытесняются самые давно использованные записи, пока размер не опустится до 90% лимита
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM llm_responses ORDER BY last_access"):
+            if freed >= target:
+                break
+            victims.append((key,))
+            freed += size
+        db.executemany("DELETE FROM llm_responses WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def get_or_call(
+        self,
+        backend_id: str,
+        prompt: str,
+        schema: str,
+        call: Callable[[], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Возвращает ответ из кэша или вызывает LLM через call() и сохраняет результат.
+        """
+        if not self.enabled:
+            return call()
+        key = self.make_key(backend_id, prompt, schema)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        value = call()
+        self.put(key, value)
+        return value
+
+    async def aget_or_call(
+        self,
+        backend_id: str,
+        prompt: str,
+        schema: str,
+        call: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Асинхронный get_or_call: обращения к файлу кэша выполняются в потоке, LLM - через await call().
+        """
+        if not self.enabled:
+            return await call()
+        key = self.make_key(backend_id, prompt, schema)
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            return cached
+        value = await call()
+        await asyncio.to_thread(self.put, key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM llm_responses")
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        stats = {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+        if self.enabled:
+            try:
+                with self._lock:
+                    entries, size = self._db().execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses"
+                    ).fetchone()
+                stats.update({"entries": entries, "size_bytes": size})
+            except sqlite3.Error:
+                pass
+        return stats
+
+
+llm_cache = LLMResponseCache.from_env()
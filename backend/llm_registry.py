@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from langchain_community.llms.huggingface_pipeline import HuggingFacePipeline
+from langchain_openai import ChatOpenAI
+from langchain_google_genai import GoogleGenerativeAI
+
+from hf_batching import BatchedHuggingFacePipeline, MicroBatcher
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+WARMUP_PROMPT = "Привет"
+
+# Пакетная генерация для локальной модели (HF_MAX_BATCH_SIZE=1 - без пачек)
+HF_MAX_BATCH_SIZE = int(os.getenv("HF_MAX_BATCH_SIZE", 8))
+HF_BATCH_WAIT_MS = float(os.getenv("HF_BATCH_WAIT_MS", 20))
+HF_GENERATE_TIMEOUT = float(os.getenv("HF_GENERATE_TIMEOUT", 300))
+
+
+def get_rss_mb() -> float:
+    """
+    Возвращает текущий объем резидентной памяти процесса в мегабайтах.
+    """
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    # Запасной вариант для систем без /proc: пиковое значение RSS
+    import resource
+    import sys
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def build_llm(llm_id: str):
+    """
+    Создает клиента LLM по идентификатору модели из LLM_ID.
+    """
+    if llm_id.startswith("gemini"):
+        return GoogleGenerativeAI(model=llm_id, api_key=os.getenv("GEMINI_API_KEY"))
+    if llm_id.startswith("gpt"):
+        return ChatOpenAI(model=llm_id, api_key=os.getenv("OPENAI_API_KET"))
+
+    tokenizer = AutoTokenizer.from_pretrained(llm_id)
+    model = AutoModelForCausalLM.from_pretrained(llm_id, device_map="auto")
+    pipe = pipeline(
+        "text-generation",
+        model=model,
+        tokenizer=tokenizer,
+        max_new_tokens=512,
+        temperature=0.7,
+        top_p=0.95,
+        repetition_penalty=1.15
+    )
+    if HF_MAX_BATCH_SIZE > 1:
+        batcher = MicroBatcher(
+            pipe, max_batch_size=HF_MAX_BATCH_SIZE, max_wait_ms=HF_BATCH_WAIT_MS, timeout=HF_GENERATE_TIMEOUT
+        )
+        logging.info(
+            f"Пакетная генерация включена (HF_MAX_BATCH_SIZE={HF_MAX_BATCH_SIZE}): потоковая выдача "
+            f"по токенам отключена, ответ передается одним фрагментом"
+        )
+        return BatchedHuggingFacePipeline(batcher=batcher)
+    return HuggingFacePipeline(pipeline=pipe)
+
+
+class ModelRegistry:
+    """
+    Реестр LLM на весь процесс: модель загружается один раз при старте
+    приложения, и все запросы получают один и тот же экземпляр.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._llm = None
+        self._llm_id: Optional[str] = None
+        self._stats: Dict[str, Any] = {}
+
+    @property
+    def llm_id(self) -> Optional[str]:
+        return self._llm_id
+
+    def load(self, llm_id: Optional[str] = None, warmup: Optional[bool] = None):
+        """
+        Загружает модель, выбранную в LLM_ID, и прогревает ее.
+        Повторный вызов с тем же идентификатором ничего не делает.
+        """
+        llm_id = llm_id or os.getenv("LLM_ID")
+        if not llm_id:
+            raise RuntimeError("Переменная окружения LLM_ID не задана")
+        if warmup is None:
+            warmup = os.getenv("LLM_WARMUP", "1") != "0"
+
+        with self._lock:
+            if self._llm is not None and self._llm_id == llm_id:
+                return self._llm
+
+            logging.info(f"--- Загрузка LLM '{llm_id}' ---")
+            rss_before = get_rss_mb()
+            started = time.perf_counter()
+            llm = build_llm(llm_id)
+            load_seconds = time.perf_counter() - started
+
+            warmup_seconds = None
+            if warmup:
+                started = time.perf_counter()
+                try:
+                    llm.invoke(WARMUP_PROMPT)
+                    warmup_seconds = time.perf_counter() - started
+                except Exception as e:
+                    logging.warning(f"Не удалось прогреть LLM '{llm_id}': {e}")
+
+            rss_after = get_rss_mb()
+            self._llm = llm
+            self._llm_id = llm_id
+            self._stats = {
+                "llm_id": llm_id,
+                "load_seconds": round(load_seconds, 3),
+                "warmup_seconds": round(warmup_seconds, 3) if warmup_seconds is not None else None,
+                "rss_before_mb": round(rss_before, 1),
+                "rss_after_mb": round(rss_after, 1),
+                "rss_delta_mb": round(rss_after - rss_before, 1),
+                "loaded_at": time.time(),
+            }
+            logging.info(
+                f"LLM '{llm_id}' загружена за {load_seconds:.2f} с, "
+                f"RSS: {rss_before:.0f} -> {rss_after:.0f} МБ"
+            )
+            return llm
+
+    def get(self):
+        """
+        Возвращает загруженную модель. Если реестр не был запущен
+        (например, вне FastAPI), модель загружается при первом обращении.
+        """
+        if self._llm is None:
+            return self.load()
+        return self._llm
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Метрики холодного старта и текущий объем памяти процесса.
+        """
+        stats = {**self._stats, "loaded": self._llm is not None, "rss_mb": round(get_rss_mb(), 1)}
+        batcher = getattr(self._llm, "batcher", None)
+        if batcher is not None:
+            stats["batching"] = batcher.stats()
+        return stats
+
+
+registry = ModelRegistry()
@@ -1,20 +1,30 @@
-from fastapi import FastAPI, HTTPException, status
-from pydantic import BaseModel
-from typing import List, Optional
-from fastapi.middleware.cors import CORSMiddleware
-
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-from langchain_community.llms.huggingface_pipeline import HuggingFacePipeline
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import GoogleGenerativeAI
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
 import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Dict, List, Literal, Optional
+from fastapi.middleware.cors import CORSMiddleware
 
 from db_utils import (
     login_user, get_burnout_timeseries, get_departments_list,
-    get_user_department, get_user_role, get_position_list, get_city_list
+    get_user_profile, invalidate_user_profile, get_position_list, get_city_list, get_existing_user_ids,
+    get_tests_without_verdict,
+    save_burnout_test_results_bulk, pool as db_pool, dimension_cache, profile_cache, test_write_buffer,
+    columnar_snapshot
 )
 
-from graph.graph import create, AgentState
+from graph.features import prompt_stats
+from graph.graph import get_graph, AgentState
+from graph.triage import cognitive_index, triage
+from jobs import JOB_DONE, JOB_FAILED, JobQueue, QueueFullError
+from llm_cache import llm_cache
+from llm_registry import registry
 
 # ===================== MODELS ===================== #
 
@@ -42,8 +52,17 @@ class CombinedResult(BaseModel):
     reaction_result: ReactionResult
     user_id: int
 
+class BatchRecord(CombinedResult):
+    # Время прохождения теста на точке сбора; без него - время сохранения
+    collected_at: Optional[datetime.datetime] = None
+
+class BatchResults(BaseModel):
+    # Записи проверяются по одной, чтобы ошибка в одной не отклоняла всю пачку
+    results: List[Dict[str, Any]]
+
 class DashboardRequest(BaseModel):
-    characteristic: str
+    characteristic: Optional[str] = None
+    characteristics: Optional[List[str]] = None
     user_id: Optional[int] = None
     start_date: Optional[str] = None
     end_date: Optional[str] = None
@@ -52,10 +71,56 @@ class DashboardRequest(BaseModel):
     departments: Optional[List[str]] = None
     min_age: Optional[int] = None
     max_age: Optional[int] = None
+    bucket: Optional[Literal['day', 'week', 'month']] = None
+    aggregations: Optional[List[Literal['mean', 'count', 'std', 'p50', 'p90']]] = None
+    max_points: Optional[int] = Field(default=None, ge=3)
 
 # ===================== APP CONFIG ===================== #
 
-app = FastAPI()
+# Пакетная загрузка: максимум записей в запросе и одновременных вызовов LLM при отложенной обработке
+BATCH_MAX_RECORDS = int(os.getenv('BATCH_MAX_RECORDS', 1000))
+BATCH_LLM_CONCURRENCY = int(os.getenv('BATCH_LLM_CONCURRENCY', 4))
+
+# Повторная обработка сохраненных тестов без вердикта: период, секунды (0 - отключена),
+# и число попыток на тест в пределах процесса
+VERDICT_SWEEP_INTERVAL = float(os.getenv('VERDICT_SWEEP_INTERVAL', 300))
+VERDICT_SWEEP_MAX_ATTEMPTS = int(os.getenv('VERDICT_SWEEP_MAX_ATTEMPTS', 3))
+VERDICT_SWEEP_MAX_TRACKED = int(os.getenv('VERDICT_SWEEP_MAX_TRACKED', 10000))
+
+# Допустимые значения шкал MBI
+MBI_RANGES = {'exhaustion': (0, 54), 'depersonalization': (0, 30), 'achievement': (0, 48)}
+
+# Граф с вызовом LLM выполняется в фоне асинхронными заданиями: ожидание LLM и БД
+# не занимает потоков, поэтому одновременно обрабатывается до JOB_WORKERS отправок
+job_queue = JobQueue(
+    max_workers=int(os.getenv('JOB_WORKERS', 32)),
+    max_pending=int(os.getenv('JOB_QUEUE_SIZE', 100)),
+    retention=float(os.getenv('JOB_RETENTION', 3600))
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Модель загружается один раз при старте и переиспользуется всеми запросами
+    llm = registry.load()
+    get_graph(registry.llm_id, llm)
+    # Несохраненные результаты из буфера записи прошлого запуска сбрасываются в БД
+    test_write_buffer.start()
+    sweep = asyncio.create_task(sweep_missing_verdicts()) if VERDICT_SWEEP_INTERVAL > 0 else None
+    # Снимок тестов для дашборда загружается заранее, чтобы первый запрос не ждал полной загрузки
+    if columnar_snapshot.enabled:
+        await asyncio.to_thread(columnar_snapshot.refresh, True)
+    yield
+    if sweep is not None:
+        sweep.cancel()
+    # Принятые задания дорабатывают и буфер записи сбрасывается до закрытия пула соединений
+    await job_queue.join()
+    job_queue.shutdown(wait=True)
+    await asyncio.to_thread(test_write_buffer.close)
+    db_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -80,30 +145,7 @@ async def login_for_access_token(user_credentials: UserLogin):
     )
 
 
-@app.post("/api/submit_results")
-async def submit_results(results: CombinedResult):
-    llm_id = os.getenv("LLM_ID")
-
-    if llm_id.startswith("gemini"):
-        llm = GoogleGenerativeAI(model=llm_id, api_key=os.getenv("GEMINI_API_KEY"))
-    elif llm_id.startswith("gpt"):
-        llm = ChatOpenAI(model=llm_id, api_key=os.getenv("OPENAI_API_KET"))
-    else:
-        tokenizer = AutoTokenizer.from_pretrained(llm_id)
-        model = AutoModelForCausalLM.from_pretrained(llm_id, device_map="auto")
-        pipe = pipeline(
-            "text-generation",
-            model=model,
-            tokenizer=tokenizer,
-            max_new_tokens=512,
-            temperature=0.7,
-            top_p=0.95,
-            repetition_penalty=1.15
-        )
-        llm = HuggingFacePipeline(pipeline=pipe)
-
-    graph = create(llm)
-
+def submission_state(results: CombinedResult) -> AgentState:
     scores = {
         "exhaustion": results.maslach_result.exhaustion,
         "depersonalization": results.maslach_result.depersonalization,
@@ -113,16 +155,371 @@ async def submit_results(results: CombinedResult):
         "cognitive_index": results.reaction_result.cognitiveIndex,
     }
 
-    start_state = AgentState({"user_id": results.user_id, "scores": scores})
-    end_state = graph.invoke(start_state)
+    return AgentState({
+        "user_id": results.user_id,
+        "scores": scores,
+        "reaction_times": results.reaction_result.times,
+    })
+
+
+async def run_submission(results: CombinedResult) -> str:
+    """
+    Прогоняет результаты тестов через граф: триаж, данные и LLM, сохранение в БД.
+    Возвращает текст рекомендации.
+    """
+    graph = get_graph(registry.llm_id, registry.get())
+    end_state = await graph.ainvoke(submission_state(results))
+
+    return end_state.get("llm_response").get("recommendation")
+
+
+async def stream_submission(results: CombinedResult, emit) -> str:
+    """
+    То же, что run_submission, но передает в emit фрагменты рекомендации по мере генерации
+    и итоговый ответ сразу после узла llm (или триажа, если LLM не понадобилась), до сохранения в БД.
+    """
+    recommendation = None
+    try:
+        graph = get_graph(registry.llm_id, registry.get())
+        async for mode, chunk in graph.astream(submission_state(results), stream_mode=["custom", "updates"]):
+            if mode == "custom" and "recommendation_delta" in chunk:
+                emit("token", {"text": chunk["recommendation_delta"]})
+            elif mode == "updates":
+                update = chunk.get("llm") or chunk.get("triage") or {}
+                if update.get("llm_response"):
+                    recommendation = update["llm_response"].get("recommendation")
+                    emit("result", {"message": recommendation})
+    finally:
+        emit(None, None)
+    return recommendation
+
+
+def job_view(job: dict) -> dict:
+    view = {key: value for key, value in job.items() if key not in ("result", "error")}
+    if job["status"] == JOB_DONE:
+        view["message"] = job["result"]
+    elif job["status"] == JOB_FAILED:
+        view["detail"] = job["error"]
+    return view
+
+
+def reject_if_write_buffer_full():
+    """
+    503 до постановки задания, если буфер отложенной записи заполнен: иначе сохранение результата
+    ждало бы сброса и могло завершиться ошибкой уже после ответа клиенту.
+    """
+    if test_write_buffer.enabled and test_write_buffer.is_full():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен, повторите отправку позже"
+        )
+
+
+@app.post("/api/submit_results", status_code=status.HTTP_202_ACCEPTED)
+async def submit_results(results: CombinedResult):
+    reject_if_write_buffer_full()
+    try:
+        job = job_queue.submit(run_submission, results)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен, повторите отправку позже"
+        )
 
-    return {"status": "success", "message": end_state.get("llm_response").get("recommendation")}
+    job_id = job["job_id"]
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Location": f"/api/jobs/{job_id}"},
+        content={
+            "status": "accepted",
+            "job_id": job_id,
+            "status_url": f"/api/jobs/{job_id}",
+            "events_url": f"/api/jobs/{job_id}/events",
+        }
+    )
+
+
+@app.post("/api/submit_results/stream")
+async def submit_results_stream(results: CombinedResult):
+    """
+    Потоковый вариант submit_results (Server-Sent Events): события token с фрагментами
+    рекомендации, result с полным текстом и done после сохранения в БД.
+    Граф выполняется в очереди заданий, поэтому сохранение завершится и при обрыве соединения.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+
+    def emit(event, data):
+        # Задание выполняется в том же цикле событий, что и ответ клиенту
+        events.put_nowait((event, data))
+
+    reject_if_write_buffer_full()
+    try:
+        job = job_queue.submit(stream_submission, results, emit)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен, повторите отправку позже"
+        )
+    job_id = job["job_id"]
+
+    async def stream():
+        yield f"event: job\ndata: {json.dumps({'job_id': job_id})}\n\n"
+        while True:
+            event, data = await events.get()
+            if event is None:
+                break
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        job = await job_queue.wait(job_id)
+        yield f"event: done\ndata: {json.dumps(job_view(job), ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def validate_batch(raw_records: List[Dict[str, Any]]):
+    """
+    Проверяет записи пакета за один проход: структура, диапазоны шкал и существование
+    пользователей (одним запросом). Возвращает статусы записей и [(индекс, BatchRecord)] корректных.
+    """
+    statuses: List[Dict[str, Any]] = []
+    valid = []
+    for index, raw in enumerate(raw_records):
+        try:
+            record = BatchRecord.model_validate(raw)
+        except ValidationError as e:
+            errors = [f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()]
+            statuses.append({"index": index, "status": "rejected", "errors": errors})
+            continue
+        errors = []
+        for name, (low, high) in MBI_RANGES.items():
+            value = getattr(record.maslach_result, name)
+            if not low <= value <= high:
+                errors.append(f"maslach_result.{name}: значение вне диапазона {low}-{high}")
+        if not 0 <= record.maslach_result.burnoutLevel <= 1:
+            errors.append("maslach_result.burnoutLevel: значение вне диапазона 0-1")
+        if any(time < 0 for time in record.reaction_result.times):
+            errors.append("reaction_result.times: отрицательное время реакции")
+        statuses.append({"index": index, "status": "rejected" if errors else "accepted", "errors": errors})
+        if not errors:
+            valid.append((index, record))
+
+    existing = get_existing_user_ids([record.user_id for _, record in valid]) if valid else set()
+    if existing is None:
+        raise HTTPException(status_code=503, detail="База данных недоступна")
+    checked = []
+    for index, record in valid:
+        if record.user_id in existing:
+            checked.append((index, record))
+        else:
+            statuses[index].update({
+                "status": "rejected",
+                "errors": [f"user_id: пользователь {record.user_id} не найден"],
+            })
+    return statuses, checked
+
+
+# Тесты, вердикт для которых уже поставлен в очередь в этом процессе, и попытки повторной обработки
+# тестов, еще не получивших вердикт (не больше VERDICT_SWEEP_MAX_TRACKED, самые старые вытесняются)
+verdicts_in_progress: set = set()
+verdict_sweep_attempts: Dict[int, int] = {}
+
+
+async def process_batch_verdicts(states: List[AgentState]) -> Dict[str, int]:
+    """
+    Отложенная обработка пакета: каждый сохраненный тест проходит граф (триаж, при необходимости LLM),
+    который записывает вердикт в уже сохраненную строку.
+    """
+    graph = get_graph(registry.llm_id, registry.get())
+    slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def process(state: AgentState) -> bool:
+        async with slots:
+            try:
+                end_state = await graph.ainvoke(state)
+                if (end_state.get("llm_response") or {}).get("score") is not None:
+                    # Вердикт записан: попытки повторной обработки больше не нужны
+                    verdict_sweep_attempts.pop(state['test_id'], None)
+                return True
+            except Exception as e:
+                logging.error(f"Не удалось получить вердикт для теста {state['test_id']}: {e}")
+                return False
+            finally:
+                verdicts_in_progress.discard(state['test_id'])
+
+    done = await asyncio.gather(*(process(state) for state in states))
+    return {"processed": sum(done), "failed": len(done) - sum(done)}
+
+
+def submit_verdicts(states: List[AgentState]) -> str:
+    """
+    Ставит отложенную обработку тестов в очередь заданий и возвращает id задания.
+    Если очередь заполнена, бросает QueueFullError; такие тесты подберет sweep_missing_verdicts.
+    """
+    test_ids = [state['test_id'] for state in states]
+    verdicts_in_progress.update(test_ids)
+    try:
+        return job_queue.submit(process_batch_verdicts, states)["job_id"]
+    except QueueFullError:
+        verdicts_in_progress.difference_update(test_ids)
+        raise
+
+
+def stored_test_state(row: Dict[str, Any]) -> AgentState:
+    # Состояние графа для сохраненного теста: граф только записывает вердикт в строку test_id
+    reaction_avg = row['mean_reaction_time_ms']
+    return AgentState({
+        "user_id": row['user_id'],
+        "test_id": row['id'],
+        "scores": {
+            "exhaustion": row['exhaustion'],
+            "depersonalization": row['depersonalization'],
+            "achievement": row['achievement'],
+            "burnout": row['burnout_score'],
+            "reaction_avg": reaction_avg,
+            "cognitive_index": cognitive_index(reaction_avg) if reaction_avg is not None else None,
+        },
+    })
+
+
+async def sweep_missing_verdicts():
+    """
+    Периодически ставит в обработку сохраненные тесты без вердикта: пакеты, для которых задание
+    не было принято (очередь заполнена) или потерялось при перезапуске, и тесты, для которых
+    LLM не вернула вердикт. Каждый тест повторяется не более VERDICT_SWEEP_MAX_ATTEMPTS раз.
+    """
+    while True:
+        await asyncio.sleep(VERDICT_SWEEP_INTERVAL)
+        try:
+            exhausted = [
+                test_id for test_id, attempts in verdict_sweep_attempts.items()
+                if attempts >= VERDICT_SWEEP_MAX_ATTEMPTS
+            ]
+            rows = await asyncio.to_thread(
+                get_tests_without_verdict, BATCH_MAX_RECORDS, list(verdicts_in_progress) + exhausted
+            )
+            if not rows:
+                continue
+            states = [stored_test_state(row) for row in rows]
+            job_id = submit_verdicts(states)
+            for row in rows:
+                verdict_sweep_attempts[row['id']] = verdict_sweep_attempts.get(row['id'], 0) + 1
+            # Вытесненный тест с исчерпанными попытками снова получит до VERDICT_SWEEP_MAX_ATTEMPTS попыток
+            while len(verdict_sweep_attempts) > VERDICT_SWEEP_MAX_TRACKED:
+                del verdict_sweep_attempts[next(iter(verdict_sweep_attempts))]
+            logging.info(f"Повторная обработка {len(states)} тестов без вердикта, задание {job_id}")
+        except QueueFullError:
+            logging.warning("Очередь заполнена, повторная обработка тестов без вердикта отложена")
+        except Exception as e:
+            logging.error(f"Ошибка повторной обработки тестов без вердикта: {e}")
+
+
+@app.post("/api/submit_results/batch")
+async def submit_results_batch(batch: BatchResults):
+    """
+    Пакетная загрузка результатов (киоски, офлайн-точки сбора): записи проверяются за один проход,
+    корректные сохраняются одной транзакцией через COPY, вердикты LLM вычисляются позже
+    фоновым заданием. Возвращает статус каждой записи и id задания обработки.
+    """
+    if len(batch.results) > BATCH_MAX_RECORDS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"В пакете больше {BATCH_MAX_RECORDS} записей"
+        )
+    statuses, valid = await asyncio.to_thread(validate_batch, batch.results)
+    if valid and job_queue.is_full():
+        # Без задания обработки тесты остались бы без вердикта до повторной обработки
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен, повторите отправку позже"
+        )
+
+    states = []
+    records = []
+    for _, record in valid:
+        state = submission_state(record)
+        states.append(state)
+        records.append({
+            "user_id": record.user_id,
+            "scores": state["scores"],
+            "verdict": None,
+            "reaction_times": state["reaction_times"],
+            "test_datetime": record.collected_at,
+        })
+    test_ids = await asyncio.to_thread(save_burnout_test_results_bulk, records) if records else []
+    if test_ids is None:
+        raise HTTPException(status_code=500, detail="Не удалось сохранить пакет результатов")
+
+    for (index, _), state, test_id in zip(valid, states, test_ids):
+        state["test_id"] = test_id
+        statuses[index].update({"status": "saved", "test_id": test_id})
+
+    job_id = None
+    if states:
+        try:
+            job_id = submit_verdicts(states)
+        except QueueFullError:
+            # Очередь заполнилась после проверки: тесты уже сохранены, вердикты вычислит sweep_missing_verdicts
+            logging.warning(f"Очередь заполнена, вердикты для {len(states)} тестов отложены до повторной обработки")
+
+    return {
+        "saved": len(test_ids),
+        "rejected": len(statuses) - len(test_ids),
+        "verdict_job_id": job_id,
+        "verdict_status_url": f"/api/jobs/{job_id}" if job_id else None,
+        "results": statuses,
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_view(job)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    """
+    Server-Sent Events: текущее состояние задания, затем итоговое состояние после завершения.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        current = job
+        yield f"event: status\ndata: {json.dumps(job_view(current), ensure_ascii=False)}\n\n"
+        while current["status"] not in (JOB_DONE, JOB_FAILED):
+            # Периодический комментарий не дает прокси закрыть простаивающее соединение
+            current = await job_queue.wait(job_id, timeout=15)
+            if current is None:
+                return
+            if current["status"] not in (JOB_DONE, JOB_FAILED):
+                yield ": keep-alive\n\n"
+        yield f"event: result\ndata: {json.dumps(job_view(current), ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.post("/api/get_timeseries")
 def get_timeseries(data: DashboardRequest):
+    characteristics = data.characteristics or data.characteristic
+    if not characteristics:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Нужно указать characteristic или characteristics"
+        )
+
     return get_burnout_timeseries(
-        data.characteristic,
+        characteristics,
         data.user_id,
         data.start_date,
         data.end_date,
@@ -130,33 +527,61 @@ def get_timeseries(data: DashboardRequest):
         data.positions,
         data.departments,
         data.min_age,
-        data.max_age
+        data.max_age,
+        data.bucket,
+        data.aggregations,
+        data.max_points
     )
 
 
+def dimension_response(request: Request, response: Response, names: List[str]):
+    """
+    Отдает справочник с ETag и отвечает 304, если у клиента уже актуальная версия.
+    """
+    etag = '"' + hashlib.sha1(json.dumps(names, ensure_ascii=False).encode("utf-8")).hexdigest() + '"'
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return [{"id": i, "name": name} for i, name in enumerate(names)]
+
+
 @app.get("/api/get_departments")
-def get_departments():
-    department_names = get_departments_list()
-    return [{"id": i, "name": name} for i, name in enumerate(department_names)]
+def get_departments(request: Request, response: Response):
+    return dimension_response(request, response, get_departments_list())
 
 @app.get("/api/get_cities")
-def get_cities():
-    city_names = get_city_list()
-    return [{"id": i, "name": name} for i, name in enumerate(city_names)]
+def get_cities(request: Request, response: Response):
+    return dimension_response(request, response, get_city_list())
 
 @app.get("/api/get_positions")
-def get_positions():
-    position_names = get_position_list()
-    return [{"id": i, "name": name} for i, name in enumerate(position_names)]
+def get_positions(request: Request, response: Response):
+    return dimension_response(request, response, get_position_list())
+
+
+@app.post("/api/invalidate_dimensions")
+def invalidate_dimensions():
+    dimension_cache.invalidate()
+    return {"status": "success"}
+
+
+@app.post("/api/invalidate_profiles")
+def invalidate_profiles(user_id: Optional[int] = None):
+    """
+    Сбрасывает кэш профилей после изменения employees вне backend: профиль одного сотрудника
+    или, без user_id, все профили. Иначе изменения видны только через PROFILE_CACHE_TTL.
+    """
+    invalidate_user_profile(user_id)
+    return {"status": "success"}
 
 
 @app.get("/api/user_context")
 def get_user_context(user_id: int):
-    role = get_user_role(user_id)
-    department = get_user_department(user_id)
-    if not role or not department:
+    profile = get_user_profile(user_id, ['role_type', 'department'])
+    if not profile or not profile['role_type'] or not profile['department']:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"user_id": user_id, "role": role, "department": department}
+    return {"user_id": user_id, "role": profile['role_type'], "department": profile['department']}
 
 
 @app.post("/api/statistics_data")
@@ -166,30 +591,49 @@ def get_statistics_data(
     end_date: str,
     department: Optional[str] = None
 ):
-    user_role = get_user_role(user_id)
+    profile = get_user_profile(user_id, ['role_type', 'department']) or {}
+    user_role = profile.get('role_type')
 
     if user_role == "Руководитель":
         departments_filter = [department] if department and department != "all" else None
         return {
             "manager_view": get_burnout_timeseries(
-                "burnout_score", start_date, end_date, departments=departments_filter
+                "burnout_score", start_date=start_date, end_date=end_date,
+                departments=departments_filter, bucket="day"
             )
         }
 
     if user_role == "Сотрудник":
-        user_department = get_user_department(user_id)
+        user_department = profile['department']
         return {
             "personal_view": get_burnout_timeseries(
-                "burnout_score", start_date, end_date, user_ids=[user_id]
+                "burnout_score", user_id=user_id, start_date=start_date, end_date=end_date
             ),
             "department_view": get_burnout_timeseries(
-                "burnout_score", start_date, end_date, departments=[user_department]
+                "burnout_score", start_date=start_date, end_date=end_date,
+                departments=[user_department], bucket="day"
             )
         }
 
     raise HTTPException(status_code=403, detail="Unknown role or insufficient permissions")
 
 
+@app.get("/api/metrics")
+def get_metrics():
+    return {
+        "llm": registry.stats(),
+        "db_pool": db_pool.stats(),
+        "dimension_cache": dimension_cache.stats(),
+        "profile_cache": profile_cache.stats(),
+        "jobs": job_queue.stats(),
+        "llm_cache": llm_cache.stats(),
+        "prompt_tokens": prompt_stats.stats(),
+        "triage": triage.stats(),
+        "write_buffer": test_write_buffer.stats(),
+        "columnar": columnar_snapshot.stats(),
+    }
+
+
 @app.get("/")
 def read_root():
     return {"message": "Сервер для СДЭК запущен!"}
@@ -0,0 +1,137 @@
+"""
+Векторизованный анализ попыток теста на скорость реакции.
+
+Попытки теста хранятся в burnout_tests.reaction_trials упакованными float32 (little-endian),
+по 4 байта на попытку. Анализ выполняется сразу для матрицы тестов (строки - тесты,
+столбцы - попытки, короткие тесты дополнены NaN), поэтому пересчет всей истории
+не создает Python-объектов на каждую попытку. Пересчет метрик по всей истории
+после изменения формул (увеличьте METRICS_VERSION):
+    python reaction_analysis.py            # только устаревшие записи
+    python reaction_analysis.py --all
+"""
+import os
+import warnings
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+# Версия формул: записи с другой версией пересчитываются при запуске модуля
+METRICS_VERSION = 1
+
+TRIAL_DTYPE = np.dtype('<f4')
+
+# Реакция быстрее REACTION_MIN_MS считается предвосхищением и не учитывается,
+# медленнее REACTION_LAPSE_MS - пропуском внимания (lapse)
+REACTION_MIN_MS = float(os.getenv('REACTION_MIN_MS', 100))
+REACTION_LAPSE_MS = float(os.getenv('REACTION_LAPSE_MS', 500))
+# Выбросы: дальше REACTION_OUTLIER_MAD робастных стандартных отклонений от медианы теста
+REACTION_OUTLIER_MAD = float(os.getenv('REACTION_OUTLIER_MAD', 3))
+
+METRIC_COLUMNS = (
+    'reaction_trimmed_mean_ms', 'reaction_sd_ms', 'reaction_fatigue_slope_ms', 'reaction_lapses'
+)
+
+
+def pack_trials(times: Optional[Sequence[float]]) -> Optional[bytes]:
+    """
+    Упаковывает попытки одного теста для столбца reaction_trials.
+    """
+    if not times:
+        return None
+    return np.asarray(times, dtype=TRIAL_DTYPE).tobytes()
+
+
+def unpack_matrix(blob: bytes, lengths: np.ndarray) -> np.ndarray:
+    """
+    Матрица попыток из склеенных упакованных тестов и числа попыток каждого теста.
+    """
+    values = np.frombuffer(blob, dtype=TRIAL_DTYPE).astype(np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    matrix = np.full((len(lengths), int(lengths.max()) if len(lengths) else 0), np.nan)
+    if values.size:
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        matrix[rows, np.arange(values.size) - offsets] = values
+    return matrix
+
+
+def trials_matrix(trials: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Матрица попыток из списка тестов (для записей, еще не упакованных в БД).
+    """
+    lengths = np.array([len(times) for times in trials], dtype=np.int64)
+    blob = b''.join(pack_trials(times) or b'' for times in trials)
+    return unpack_matrix(blob, lengths)
+
+
+def analyze(matrix: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Метрики для каждой строки матрицы попыток:
+    - reaction_trimmed_mean_ms: среднее без предвосхищений и выбросов;
+    - reaction_sd_ms: стандартное отклонение тех же попыток (вариативность);
+    - reaction_fatigue_slope_ms: наклон линейного тренда, мс на попытку (рост - утомление);
+    - reaction_lapses: число попыток медленнее REACTION_LAPSE_MS.
+    Для тестов без подходящих попыток метрики равны NaN.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim != 2 or matrix.shape[1] == 0:
+        empty = np.full(matrix.shape[0] if matrix.ndim == 2 else 0, np.nan)
+        return {column: empty.copy() for column in METRIC_COLUMNS}
+
+    present = ~np.isnan(matrix)
+    lapses = np.sum(present & (matrix > REACTION_LAPSE_MS), axis=1)
+
+    valid = np.where(present & (matrix >= REACTION_MIN_MS), matrix, np.nan)
+    # Строки без подходящих попыток дают NaN, предупреждения numpy о пустых срезах не нужны
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(valid, axis=1, keepdims=True)
+        mad = np.nanmedian(np.abs(valid - median), axis=1, keepdims=True) * 1.4826
+        # При нулевом MAD (почти одинаковые попытки) выбросы не отбрасываются
+        outlier = (mad > 0) & (np.abs(valid - median) > REACTION_OUTLIER_MAD * mad)
+        kept = np.where(outlier, np.nan, valid)
+
+        mask = ~np.isnan(kept)
+        count = mask.sum(axis=1)
+        mean = np.nanmean(kept, axis=1)
+        sd = np.nanstd(kept, axis=1)
+
+        # Наклон МНК по номеру попытки с учетом только оставленных попыток
+        index = np.broadcast_to(np.arange(matrix.shape[1], dtype=np.float64), matrix.shape)
+        index_mean = np.sum(np.where(mask, index, 0), axis=1) / count
+        dx = np.where(mask, index - index_mean[:, None], 0)
+        dy = np.where(mask, kept - mean[:, None], 0)
+        denominator = np.sum(dx * dx, axis=1)
+        slope = np.where(denominator > 0, np.sum(dx * dy, axis=1) / np.maximum(denominator, 1e-12), np.nan)
+
+    return {
+        'reaction_trimmed_mean_ms': mean,
+        'reaction_sd_ms': sd,
+        'reaction_fatigue_slope_ms': slope,
+        'reaction_lapses': lapses,
+    }
+
+
+def analyze_trials(times: Optional[Sequence[float]]) -> Dict[str, Optional[float]]:
+    """
+    Метрики одного теста для сохранения вместе с результатом.
+    """
+    if not times:
+        return dict.fromkeys(METRIC_COLUMNS)
+    metrics = {column: float(values[0]) for column, values in analyze(trials_matrix([times])).items()}
+    result = {column: (None if np.isnan(value) else value) for column, value in metrics.items()}
+    result['reaction_lapses'] = int(metrics['reaction_lapses'])
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from db_utils import recompute_reaction_metrics
+
+    arg_parser = argparse.ArgumentParser(description="Пересчет метрик реакции по сохраненным попыткам")
+    arg_parser.add_argument("--all", action="store_true", help="пересчитать все записи, а не только устаревшие")
+    arg_parser.add_argument("--batch-size", type=int, default=10000)
+    args = arg_parser.parse_args()
+    updated = recompute_reaction_metrics(batch_size=args.batch_size, only_outdated=not args.all)
+    print(f"Пересчитано тестов: {updated}")
@@ -0,0 +1,76 @@
+from typing import List, Optional
+
+# Ежедневные агрегаты burnout_tests (см. db/migrations/001_burnout_daily_rollups.sql)
+ROLLUP_TABLE = 'burnout_daily_rollups'
+ROLLUP_METRICS = ['exhaustion', 'depersonalization', 'achievement', 'burnout_score', 'mean_reaction_time_ms']
+AGE_BAND_YEARS = 5
+
+# Агрегаты, которые восстанавливаются из количества, суммы и суммы квадратов
+ROLLUP_AGGREGATIONS = {
+    'mean': "SUM(r.{column}_sum) / NULLIF(SUM(r.{column}_count), 0)",
+    'count': "SUM(r.{column}_count)",
+    'std': (
+        "SQRT(GREATEST(SUM(r.{column}_sumsq) - SUM(r.{column}_sum) ^ 2 / NULLIF(SUM(r.{column}_count), 0), 0)"
+        " / NULLIF(SUM(r.{column}_count) - 1, 0))"
+    ),
+}
+
+_key_columns = "day, department, city, position, age_band"
+_metric_columns = ", ".join(
+    f"{metric}_count, {metric}_sum, {metric}_sumsq" for metric in ROLLUP_METRICS
+)
+_metric_values = ", ".join(
+    f"COUNT(b.{metric}), COALESCE(SUM(b.{metric}), 0), COALESCE(SUM(b.{metric}::float * b.{metric}), 0)"
+    for metric in ROLLUP_METRICS
+)
+_metric_updates = ", ".join(
+    f"{metric}_{suffix} = {ROLLUP_TABLE}.{metric}_{suffix} + EXCLUDED.{metric}_{suffix}"
+    for metric in ROLLUP_METRICS
+    for suffix in ('count', 'sum', 'sumsq')
+)
+
+# Добавляет в агрегаты тесты с указанными id (параметр - список id).
+# Выполняется в той же транзакции, что и вставка тестов.
+# Атрибуты сотрудника берутся текущие, как в запросах по сырым тестам; при их изменении
+# триггер employees_move_rollups (db/migrations/006_rollup_employee_changes.sql) переносит
+# вклад тестов сотрудника в строки с новыми атрибутами, поэтому оба пути дают одинаковый ответ.
+ROLLUP_UPSERT_SQL = f"""
+INSERT INTO {ROLLUP_TABLE} ({_key_columns}, tests_count, {_metric_columns})
+SELECT
+    b.test_datetime::date,
+    COALESCE(e.department, ''),
+    COALESCE(e.city, ''),
+    COALESCE(e.position, ''),
+    COALESCE(e.age / {AGE_BAND_YEARS} * {AGE_BAND_YEARS}, -1),
+    COUNT(*),
+    {_metric_values}
+FROM burnout_tests b JOIN employees e ON b.user_id = e.id
+WHERE b.id = ANY(%s)
+GROUP BY 1, 2, 3, 4, 5
+ON CONFLICT ({_key_columns}) DO UPDATE SET
+    tests_count = {ROLLUP_TABLE}.tests_count + EXCLUDED.tests_count,
+    {_metric_updates};
+"""
+
+
+def rollups_cover(
+    user_id: Optional[int],
+    bucket: Optional[str],
+    aggregations: List[str],
+    min_age: Optional[int],
+    max_age: Optional[int]
+) -> bool:
+    """
+    Можно ли ответить на запрос временного ряда по агрегатам вместо сырых тестов:
+    нужна группировка по корзинам, без фильтра по пользователю, с агрегатами,
+    восстанавливаемыми из сумм, и с границами возраста, совпадающими с возрастными группами.
+    """
+    if user_id is not None or not bucket:
+        return False
+    if any(aggregation not in ROLLUP_AGGREGATIONS for aggregation in aggregations):
+        return False
+    if min_age is not None and min_age % AGE_BAND_YEARS != 0:
+        return False
+    if max_age is not None and (max_age + 1) % AGE_BAND_YEARS != 0:
+        return False
+    return True
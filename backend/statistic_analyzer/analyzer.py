@@ -1,8 +1,12 @@
+import asyncio
+import hashlib
+import json
 import logging
 import os
-import smtplib
-from email.mime.text import MIMEText
-from typing import TypedDict, Dict, List, Any, Hashable
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict, Dict, List, Any, Hashable, Optional
 
 from dotenv import load_dotenv
 from langchain_core.output_parsers import PydanticOutputParser
@@ -10,13 +14,81 @@ from langchain_google_genai import GoogleGenerativeAI
 from langgraph.graph import StateGraph, END
 
 from config import prompt_template
-from db_utils import get_user_burnout_stats, get_user_data, get_all_user_ids_and_emails
-from graph.tasks_generation import generate_project_data
+from llm_cache import llm_cache, schema_hash
+from db_utils import (
+    PROMPT_PROFILE_COLUMNS, enqueue_email, get_user_burnout_stats, get_user_profile, get_all_user_ids_and_emails,
+    get_analyzer_checkpoints, get_users_analysis_inputs, save_analyzer_checkpoint
+)
+from graph.features import (
+    activity_features, averages_features, history_features, prompt_stats, to_prompt, trend_features
+)
+from graph.tasks_generation import activity_seed, generate_project_data
 from answer_schema import Recommendations
+from outbox import OutboxWorker
+from rate_limit import AdaptiveLimiter, is_rate_limit_error, retry_after_seconds
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 load_dotenv()
 
+parser = PydanticOutputParser(pydantic_object=Recommendations)
+format_instructions = parser.get_format_instructions()
+response_schema = schema_hash(Recommendations)
+
+# Число сотрудников, анализируемых одновременно, и повторы при ограничении частоты запросов
+ANALYZER_CONCURRENCY = int(os.getenv('ANALYZER_CONCURRENCY', 8))
+ANALYZER_MAX_RETRIES = int(os.getenv('ANALYZER_MAX_RETRIES', 5))
+ANALYZER_PROGRESS_INTERVAL = float(os.getenv('ANALYZER_PROGRESS_INTERVAL', 30))
+# Сколько сотрудников загружается из БД одной пачкой перед анализом
+ANALYZER_PREFETCH_BATCH = int(os.getenv('ANALYZER_PREFETCH_BATCH', 500))
+# 1 - анализировать всех сотрудников, не пропуская тех, чьи данные не изменились
+ANALYZER_FULL_RUN = os.getenv('ANALYZER_FULL_RUN', '0') == '1'
+
+# Скомпилированные графы по идентификатору бэкенда LLM
+_compiled_graphs: Dict[str, Any] = {}
+_compiled_graphs_lock = threading.Lock()
+
+EMAIL_SUBJECT = 'Персональные рекомендации по результатам теста на выгорание'
+
+
+def render_recommendations_email(recommendation: str) -> str:
+    """
+    HTML-письмо с рекомендациями: каждая непустая строка ответа LLM - отдельный пункт списка.
+    """
+    items = [line.strip(" -•*") for line in recommendation.splitlines() if line.strip(" -•*")]
+    recommendations_html = "<ul>" + "".join(f"<li>{rec}</li>" for rec in items) + "</ul>"
+
+    return f"""
+        <html>
+        <head>
+            <style>
+                body {{ font-family: Arial, sans-serif; line-height: 1.6; }}
+                .container {{ padding: 20px; border: 1px solid #ddd; border-radius: 5px; max-width: 600px; margin: auto; }}
+                h2, h3 {{ color: #333; }}
+                .cta-button {{ display: inline-block; padding: 10px 20px; margin-top: 15px; font-size: 16px; color: #fff; background-color: #007bff; text-decoration: none; border-radius: 5px; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h2>Здравствуйте!</h2>
+                <p>Мы провели анализ вашего состояния на основе последних тестов и рабочей активности.</p>
+                
+                <h3>Рекомендации:</h3>
+                {recommendations_html}
+
+                <p>Пожалуйста, уделите внимание своему состоянию. Если у вас есть вопросы, обратитесь к вашему руководителю или HR-специалисту.</p>
+                
+                <hr>
+                
+                <p><b>Чтобы мы могли и дальше следить за вашим состоянием и вовремя предлагать поддержку, пожалуйста, пройдите наш тест по анализу рабочего состояния.</b></p>
+                Пройти тест сейчас</a>
+                
+                <p style="margin-top: 25px; color: #555;">С уважением,<br>Ваша система мониторинга состояния</p>
+            </div>
+        </body>
+        </html>
+        """
+
+
 class AnalyzerState(TypedDict):
     user_id: int
     user_email: str
@@ -27,17 +99,23 @@ class AnalyzerState(TypedDict):
     llm_response: Recommendations
 
 
-def create_graph(llm: Any):
+def create_graph(llm: Any, backend_id: str = "default"):
+    chain = prompt_template | llm | parser
+
     def get_data_node(state: AnalyzerState):
         """
         Получение данных о пользователе, его предыдущих тестах и активности.
+        Если данные уже загружены пакетно (get_users_analysis_inputs), запросов к БД нет.
         """
         logging.info(f"--- [Узел GET_DATA] для user_id: {state['user_id']} ---")
         user_id = state['user_id']
         
-        user_data = get_user_data(user_id)
-        df_last_3, averages = get_user_burnout_stats(user_id)
-        projects = generate_project_data()
+        if state.get("user_data") is not None:
+            user_data, df_last_3, averages = state["user_data"], state["df_last_3"], state["averages"]
+        else:
+            user_data = get_user_profile(user_id, PROMPT_PROFILE_COLUMNS)
+            df_last_3, averages = get_user_burnout_stats(user_id)
+        projects = generate_project_data(seed=activity_seed(user_id))
 
         return {
             "user_data": user_data,
@@ -51,80 +129,45 @@ def create_graph(llm: Any):
         Вызов LLM и получение структурированного вывода.
         """
         logging.info(f"--- [Узел LLM] для user_id: {state['user_id']} ---")
-        parser = PydanticOutputParser(pydantic_object=Recommendations)
-        
+        history = history_features(state["df_last_3"])
+        averages = averages_features(state["averages"])
         input_vars = {
-            "user_data": state["user_data"],
-            "averages": state["averages"],
-            "df_last_3": state["df_last_3"],
-            "projects": state["projects"],
-            "instructions": parser.get_format_instructions()
+            "averages": to_prompt(averages),
+            "df_last_3": to_prompt({"history": history, **trend_features(history, averages)}),
+            "projects": to_prompt(activity_features(state["projects"])),
+            "instructions": format_instructions
         }
 
-        chain = prompt_template | llm | parser
-        res = chain.invoke(input_vars).model_dump()
+        prompt = prompt_template.format(**input_vars)
+        prompt_stats.record("analyzer", llm, prompt)
+        res = llm_cache.get_or_call(
+            backend_id,
+            prompt,
+            response_schema,
+            lambda: chain.invoke(input_vars).model_dump()
+        )
         return {"llm_response": res}
 
     def send_recommendations_node(state: AnalyzerState):
         """
-        Функция отправки рекомендаций на почту пользователя.
+        Постановка письма с рекомендациями в очередь отправки (email_outbox).
+        Доставкой занимается OutboxWorker, поэтому медленный SMTP-сервер не задерживает граф.
         """
         logging.info(f"--- [Узел SEND_RECOMMENDATIONS] для user_id: {state['user_id']} ---")
         
         recipient_email = state["user_email"]
-        recommendation = state["llm_response"]["recommendation"]
-        
-        sender_email = os.getenv("EMAIL_SENDER")
-        sender_password = os.getenv("EMAIL_PASSWORD")
-        smtp_server = os.getenv("EMAIL_SMTP_SERVER")
-        smtp_port = int(os.getenv("EMAIL_SMTP_PORT"))
-
-        recommendations_html = "<ul>" + "".join(f"<li>{rec}</li>" for rec in recommendation) + "</ul>"
-        
-        email_body = f"""
-            <html>
-            <head>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; }}
-                    .container {{ padding: 20px; border: 1px solid #ddd; border-radius: 5px; max-width: 600px; margin: auto; }}
-                    h2, h3 {{ color: #333; }}
-                    .cta-button {{ display: inline-block; padding: 10px 20px; margin-top: 15px; font-size: 16px; color: #fff; background-color: #007bff; text-decoration: none; border-radius: 5px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <h2>Здравствуйте!</h2>
-                    <p>Мы провели анализ вашего состояния на основе последних тестов и рабочей активности.</p>
-                    
-                    <h3>Рекомендации:</h3>
-                    {recommendations_html}
-
-                    <p>Пожалуйста, уделите внимание своему состоянию. Если у вас есть вопросы, обратитесь к вашему руководителю или HR-специалисту.</p>
-                    
-                    <hr>
-                    
-                    <p><b>Чтобы мы могли и дальше следить за вашим состоянием и вовремя предлагать поддержку, пожалуйста, пройдите наш тест по анализу рабочего состояния.</b></p>
-                    Пройти тест сейчас</a>
-                    
-                    <p style="margin-top: 25px; color: #555;">С уважением,<br>Ваша система мониторинга состояния</p>
-                </div>
-            </body>
-            </html>
-            """
-
-        msg = MIMEText(email_body, 'html', 'utf-8')
-        msg['Subject'] = 'Персональные рекомендации по результатам теста на выгорание'
-        msg['From'] = sender_email
-        msg['To'] = recipient_email
+        recommendation = state["llm_response"]["recommendations"] or ""
 
-        try:
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls()
-                server.login(sender_email, sender_password)
-                server.send_message(msg)
-                logging.info(f"Письмо успешно отправлено на {recipient_email}")
-        except Exception as e:
-            logging.error(f"Не удалось отправить письмо на {recipient_email}. Ошибка: {e}")
+        outbox_id = enqueue_email(
+            state["user_id"],
+            recipient_email,
+            EMAIL_SUBJECT,
+            render_recommendations_email(recommendation)
+        )
+        if outbox_id is None:
+            logging.error(f"Не удалось поставить письмо для {recipient_email} в очередь")
+        else:
+            logging.info(f"Письмо для {recipient_email} поставлено в очередь (id {outbox_id})")
         
         return None
 
@@ -162,40 +205,242 @@ def create_graph(llm: Any):
 
     return workflow.compile()
 
-def run_graph_for_all_users():
+
+def get_graph(backend_id: str, llm: Any):
     """
-    Функция для запуска анализа всех сотрудников из БД.
+    Возвращает скомпилированный граф анализатора для бэкенда LLM, собирая его один раз.
+    """
+    graph = _compiled_graphs.get(backend_id)
+    if graph is None:
+        with _compiled_graphs_lock:
+            graph = _compiled_graphs.get(backend_id)
+            if graph is None:
+                graph = create_graph(llm, backend_id)
+                _compiled_graphs[backend_id] = graph
+    return graph
+
+def inputs_hash(llm_id: str, inputs: Dict[str, Any]) -> str:
+    """
+    SHA-256 входных данных анализа сотрудника. Проекты не учитываются: они детерминированы
+    (generate_project_data с зерном activity_seed по пользователю и дню), то есть определяются
+    id сотрудника и датой, а не входными данными. Средние округляются, чтобы порядок
+    суммирования в БД не менял хэш.
     """
-    logging.info("=== Запуск массового анализа сотрудников ===")
+    averages = {
+        key: round(value, 6) if isinstance(value, float) else value
+        for key, value in (inputs['averages'] or {}).items()
+    }
+    payload = json.dumps(
+        [llm_id, inputs['user_data'], inputs['last_tests'], averages],
+        sort_keys=True, default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def last_test_id(inputs: Dict[str, Any]) -> Optional[int]:
+    test_ids = (inputs['last_tests'] or {}).get('id') or []
+    return max(test_ids) if test_ids else None
 
+
+class RunProgress:
+    """
+    Счетчики массового прогона: обработано, ошибок, пропущено и скорость в пользователях в минуту.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.unchanged = 0
+        self.started = time.monotonic()
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded + self.failed + self.skipped + self.unchanged
+
+    def users_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed * 60 if elapsed > 0 else 0.0
+
+    def report(self, limiter: AdaptiveLimiter):
+        rate = self.users_per_minute()
+        remaining = self.total - self.processed
+        eta = f"~{remaining / rate:.1f} мин" if rate > 0 else "неизвестно"
+        logging.info(
+            f"Прогресс: {self.processed}/{self.total} (успешно {self.succeeded}, ошибок {self.failed}, "
+            f"пропущено {self.skipped}, без изменений {self.unchanged}), {rate:.1f} польз./мин, параллельность {limiter.limit}, "
+            f"осталось {eta}"
+        )
+
+    def summary(self, limiter: AdaptiveLimiter) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "unchanged": self.unchanged,
+            "elapsed_seconds": round(time.monotonic() - self.started, 1),
+            "users_per_minute": round(self.users_per_minute(), 2),
+            "rate_limited": limiter.rate_limited,
+        }
+
+
+async def analyze_user(
+    graph,
+    limiter: AdaptiveLimiter,
+    progress: RunProgress,
+    user_id: int,
+    user_email: str,
+    inputs: Optional[Dict[str, Any]] = None,
+    digest: Optional[str] = None
+):
+    """
+    Анализ одного сотрудника с повторами при ограничении частоты запросов.
+    inputs - заранее загруженные данные сотрудника из get_users_analysis_inputs,
+    digest - их хэш: после успешного анализа он сохраняется как контрольная точка.
+    Ошибка по одному сотруднику не прерывает обработку остальных.
+    """
+    start_state = AnalyzerState({
+        'user_id': user_id,
+        'user_email': user_email
+    })
+    if inputs is not None:
+        start_state.update({
+            'user_data': inputs['user_data'],
+            'df_last_3': inputs['last_tests'],
+            'averages': inputs['averages']
+        })
+
+    for attempt in range(ANALYZER_MAX_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            end_state = await graph.ainvoke(start_state)
+        except Exception as e:
+            if is_rate_limit_error(e) and attempt < ANALYZER_MAX_RETRIES:
+                delay = await limiter.on_rate_limit(attempt, retry_after_seconds(e))
+                logging.warning(
+                    f"Лимит запросов LLM для пользователя ID: {user_id}, повтор через {delay:.1f} с "
+                    f"(попытка {attempt + 1}/{ANALYZER_MAX_RETRIES}), параллельность снижена до {limiter.limit}"
+                )
+                continue
+            logging.error(f"Ошибка при обработке пользователя ID: {user_id}. Ошибка: {e}")
+            progress.failed += 1
+            return
+        else:
+            await limiter.on_success()
+            if digest is not None:
+                necessity = (end_state.get("llm_response") or {}).get("necessity")
+                await asyncio.get_running_loop().run_in_executor(
+                    None, save_analyzer_checkpoint, user_id, last_test_id(inputs), digest, necessity
+                )
+            progress.succeeded += 1
+            logging.info(f"--- Завершение обработки пользователя ID: {user_id} ---")
+            return
+        finally:
+            await limiter.release()
+
+
+async def run_graph_for_all_users_async(
+    concurrency: int = ANALYZER_CONCURRENCY,
+    full_run: bool = ANALYZER_FULL_RUN
+) -> Dict[str, Any]:
+    """
+    Анализ сотрудников из БД с ограниченной параллельностью. Возвращает итоги прогона.
+    Сотрудники, чьи данные не изменились с последнего успешного анализа, пропускаются
+    (если не задан full_run), поэтому повторный запуск прерванного прогона продолжает его.
+    """
+    logging.info(f"=== Запуск массового анализа сотрудников (параллельность {concurrency}) ===")
+
+    llm_id = 'gemini-1.5-flash'
     llm = GoogleGenerativeAI(
-        model='gemini-1.5-flash',
+        model=llm_id,
         api_key=os.getenv('GEMINI_API_KEY')
     )
-    graph = create_graph(llm)
+    graph = get_graph(llm_id, llm)
 
-    all_users = get_all_user_ids_and_emails()
+    # Синхронные узлы графа при ainvoke выполняются в пуле потоков по умолчанию
+    loop = asyncio.get_running_loop()
+    # (плюс потоки для пакетной загрузки данных и очереди писем)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency + 2, thread_name_prefix='analyzer'))
+
+    all_users = await loop.run_in_executor(None, get_all_user_ids_and_emails)
     if not all_users:
         logging.warning("Не найдено ни одного пользователя в БД. Завершение работы.")
-        return
+        return {}
 
-    for user_id, user_email in all_users:
-        if not user_email:
-            logging.warning(f"У пользователя с ID {user_id} отсутствует email. Пропускаем.")
-            continue
-        
-        logging.info(f"--- Начало обработки пользователя ID: {user_id}, Email: {user_email} ---")
-        
-        start_state = AnalyzerState({
-            'user_id': user_id,
-            'user_email': user_email
-        })
-        
+    limiter = AdaptiveLimiter(concurrency)
+    progress = RunProgress(len(all_users))
+
+    async def load_shard(shard):
+        shard_ids = [user_id for user_id, _ in shard]
+        inputs = await loop.run_in_executor(None, get_users_analysis_inputs, shard_ids)
+        checkpoints = {} if full_run else await loop.run_in_executor(None, get_analyzer_checkpoints, shard_ids)
+        return inputs, checkpoints
+
+    async def analyze_all():
+        # Данные загружаются пачками: анализ пачки идет, пока загружается следующая. Следующая
+        # пачка не начинается, пока не завершен анализ текущей, поэтому в памяти не больше
+        # двух пачек данных и ANALYZER_PREFETCH_BATCH заданий независимо от числа сотрудников
+        shards = [
+            all_users[start:start + ANALYZER_PREFETCH_BATCH]
+            for start in range(0, len(all_users), ANALYZER_PREFETCH_BATCH)
+        ]
+        prefetch = asyncio.create_task(load_shard(shards[0]))
         try:
-            graph.invoke(start_state)
-            logging.info(f"--- Завершение обработки пользователя ID: {user_id} ---")
-        except Exception as e:
-            logging.error(f"Ошибка при обработке пользователя ID: {user_id}. Ошибка: {e}")
+            for index, shard in enumerate(shards):
+                inputs, checkpoints = await prefetch
+                if index + 1 < len(shards):
+                    prefetch = asyncio.create_task(load_shard(shards[index + 1]))
+                await analyze_shard(shard, inputs, checkpoints)
+        finally:
+            prefetch.cancel()
+
+    async def analyze_shard(shard, inputs, checkpoints):
+        tasks = []
+        for user_id, user_email in shard:
+            if not user_email:
+                logging.warning(f"У пользователя с ID {user_id} отсутствует email. Пропускаем.")
+                progress.skipped += 1
+                continue
+            user_inputs = inputs.get(user_id)
+            digest = inputs_hash(llm_id, user_inputs) if user_inputs is not None else None
+            if digest is not None and checkpoints.get(user_id, {}).get('input_hash') == digest:
+                progress.unchanged += 1
+                continue
+            tasks.append(asyncio.create_task(
+                analyze_user(graph, limiter, progress, user_id, user_email, user_inputs, digest)
+            ))
+        await asyncio.gather(*tasks)
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(ANALYZER_PROGRESS_INTERVAL)
+            progress.report(limiter)
+
+    # Письма доставляются параллельно с анализом, остаток очереди - после его завершения
+    outbox_worker = OutboxWorker()
+    outbox_worker.start()
+    reporter = asyncio.create_task(report_progress())
+    try:
+        await analyze_all()
+    finally:
+        reporter.cancel()
+        await loop.run_in_executor(None, outbox_worker.stop)
+
+    progress.report(limiter)
+    summary = progress.summary(limiter)
+    summary["emails"] = outbox_worker.stats()
+    logging.info(f"=== Массовый анализ завершен: {summary} ===")
+    return summary
+
+
+def run_graph_for_all_users():
+    """
+    Функция для запуска анализа всех сотрудников из БД.
+    """
+    return asyncio.run(run_graph_for_all_users_async())
+
 
 if __name__ == '__main__':
-    run_graph_for_all_users()
\ No newline at end of file
+    run_graph_for_all_users()
@@ -1,14 +1,12 @@
 from pydantic import BaseModel, Field
-from typing import  Dict
+from typing import  Dict, Optional
 
 class Recommendations(BaseModel):
-    recommendations: str = Field(
-        ...,
+    recommendations: Optional[str] = Field(
         default=None,
         description="Recommendations"
     )
     necessity: bool = Field(
-        ...,
         default=False,
         description="True or False"
     )
\ No newline at end of file
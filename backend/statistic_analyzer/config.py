@@ -1,11 +1,11 @@
-from langchain.prompts import PromptTemplate
+from langchain_core.prompts import PromptTemplate
 prompt_template = PromptTemplate(
     template="""
 A dictionary with the user's current mean scores for emotional exhaustion, depersonalization, and reduced professional accomplishment.
 {averages}
-A dictionary with the user's three most recent test results for these dimensions.
+The user's most recent test results (newest first) and score changes between them.
 {df_last_3}
-A list of the user's current projects and tasks.
+A summary of the user's current projects, tasks and meetings.
 {projects}
 Analyze this and вecide whether the user needs to take a burnout test.
 The answer should be:
@@ -13,5 +13,7 @@ True - if it is necessary for user to pass test
 False - if it isn't necessary
 
 If True, write short message-recommendation in official style in Russian.
-""", input_variables=["averages", "df_last_3", "projects"]
+
+{instructions}
+""", input_variables=["averages", "df_last_3", "projects", "instructions"]
 )
\ No newline at end of file
@@ -0,0 +1,239 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from typing import Any, Dict, Optional
+
+from db_utils import claim_outbox_batch, get_outbox_stats, mark_outbox_failed, mark_outbox_sent, release_outbox
+
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 5))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', 60))
+OUTBOX_RETRY_MAX = float(os.getenv('OUTBOX_RETRY_MAX', 3600))
+
+# Ошибки, относящиеся к конкретному письму; остальные означают, что сессия непригодна
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class SMTPSession:
+    """
+    Долгоживущее SMTP-соединение: подключение, STARTTLS и вход выполняются один раз
+    и переиспользуются для многих писем.
+
+    - соединение, простоявшее дольше idle_timeout, проверяется командой NOOP;
+    - после max_messages писем соединение открывается заново (серверы ограничивают число писем на сессию);
+    - STARTTLS и вход можно отключить для локального тестового SMTP-сервера.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        starttls: bool = True,
+        timeout: float = 30.0,
+        max_messages: int = 100,
+        idle_timeout: float = 60.0
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+
+        self._server: Optional[smtplib.SMTP] = None
+        self._sent_in_session = 0
+        self._last_used = 0.0
+        self.connects = 0
+
+    @classmethod
+    def from_env(cls) -> "SMTPSession":
+        return cls(
+            host=os.getenv("EMAIL_SMTP_SERVER"),
+            port=int(os.getenv("EMAIL_SMTP_PORT", 587)),
+            username=os.getenv("EMAIL_SENDER"),
+            password=os.getenv("EMAIL_PASSWORD"),
+            starttls=os.getenv("EMAIL_SMTP_STARTTLS", "1") != "0",
+        )
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.password:
+            server.login(self.username, self.password)
+        self.connects += 1
+        self._sent_in_session = 0
+        return server
+
+    def _server_ready(self) -> smtplib.SMTP:
+        if self._server is not None and self._sent_in_session >= self.max_messages:
+            self.close()
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            try:
+                self._server.noop()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def send(self, msg: MIMEText):
+        """
+        Отправляет письмо. Если сервер разорвал соединение, письмо отправляется повторно
+        через новое соединение; прочие ошибки SMTP передаются вызывающему коду.
+        """
+        try:
+            self._server_ready().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._server_ready().send_message(msg)
+        self._sent_in_session += 1
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                self._server.close()
+            self._server = None
+
+
+def retry_delay(attempts: int) -> Optional[float]:
+    """
+    Пауза перед следующей попыткой доставки или None, если попытки исчерпаны.
+    """
+    if attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+        return None
+    return min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2 ** attempts)
+
+
+def build_message(row: Dict[str, Any], sender: Optional[str]) -> MIMEText:
+    msg = MIMEText(row['body'], 'html', 'utf-8')
+    msg['Subject'] = row['subject']
+    msg['From'] = sender
+    msg['To'] = row['recipient']
+    return msg
+
+
+def deliver_batch(session: SMTPSession, batch_size: int = OUTBOX_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Отправляет одну пачку писем из очереди через общее SMTP-соединение.
+    Отправленные письма отмечаются доставленными одним UPDATE на пачку, в том числе когда
+    пачка прервана ошибкой сервера или исключением. Письма, отправленные перед аварийным
+    завершением процесса, будут отправлены повторно после истечения блокировки.
+    Возвращает количество отправленных и неудачных писем.
+    """
+    rows = claim_outbox_batch(batch_size)
+    sent_ids = []
+    failed = 0
+    try:
+        for index, row in enumerate(rows):
+            try:
+                session.send(build_message(row, session.username))
+            except (smtplib.SMTPException, OSError) as e:
+                failed += 1
+                delay = retry_delay(row['attempts'])
+                logging.warning(
+                    f"Не удалось отправить письмо {row['id']} на {row['recipient']}: {e}. "
+                    + (f"Повтор через {delay:.0f} с" if delay is not None else "Попытки исчерпаны")
+                )
+                mark_outbox_failed(row['id'], str(e), delay)
+                if not isinstance(e, MESSAGE_ERRORS):
+                    # Сервер недоступен или отказал во входе: остаток пачки возвращается в очередь
+                    # без траты попыток и с той же паузой, что и неудачное письмо
+                    session.close()
+                    release_outbox(
+                        [rest['id'] for rest in rows[index + 1:]], str(e),
+                        delay if delay is not None else OUTBOX_RETRY_BASE
+                    )
+                    break
+                continue
+            sent_ids.append(row['id'])
+    finally:
+        mark_outbox_sent(sent_ids)
+    if rows:
+        logging.info(f"Доставка писем: отправлено {len(sent_ids)}, с ошибкой {failed}")
+    return {"sent": len(sent_ids), "failed": failed}
+
+
+class OutboxWorker:
+    """
+    Фоновый поток доставки писем: забирает очередь пачками, пока не будет остановлен.
+    """
+
+    def __init__(
+        self,
+        session: Optional[SMTPSession] = None,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL
+    ):
+        self.session = session or SMTPSession.from_env()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.sent = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        result = deliver_batch(self.session, self.batch_size)
+        self.sent += result["sent"]
+        self.failed += result["failed"]
+        return result["sent"] + result["failed"]
+
+    def drain(self):
+        """
+        Отправляет все письма, готовые к отправке прямо сейчас.
+        """
+        while self.run_once() > 0:
+            pass
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                logging.error(f"Ошибка обработчика очереди писем: {e}")
+                processed = 0
+            if processed == 0:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='outbox', daemon=True)
+        self._thread.start()
+
+    def stop(self, drain: bool = True):
+        """
+        Останавливает поток; при drain=True перед выходом отправляет оставшиеся письма.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if drain:
+            self.drain()
+        self.session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "smtp_connects": self.session.connects,
+            "queue": get_outbox_stats(),
+        }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    worker = OutboxWorker()
+    worker.drain()
+    worker.session.close()
+    logging.info(f"Очередь писем обработана: {worker.stats()}")
@@ -0,0 +1,97 @@
+import asyncio
+import random
+from typing import Optional
+
+# Признаки ответа провайдера LLM о превышении лимита запросов (Gemini, OpenAI, HTTP 429)
+RATE_LIMIT_MARKERS = ('429', 'rate limit', 'ratelimit', 'resource exhausted', 'resourceexhausted', 'quota')
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Похожа ли ошибка на ограничение частоты запросов со стороны провайдера LLM.
+    """
+    if getattr(error, 'status_code', None) == 429 or getattr(error, 'code', None) == 429:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Пауза, которую провайдер попросил выдержать (заголовок Retry-After), если она указана.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('retry-after') if hasattr(headers, 'get') else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    Ограничитель числа одновременных вызовов LLM с адаптацией к лимитам провайдера.
+
+    При ответе "слишком много запросов" допустимая параллельность уменьшается вдвое
+    и все новые вызовы выдерживают паузу; после серии успешных вызовов параллельность
+    снова растет на единицу, но не выше max_concurrency.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        increase_after: int = 10
+    ):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.increase_after = increase_after
+
+        self._active = 0
+        self._successes = 0
+        self._pause_until = 0.0
+        self._condition = asyncio.Condition()
+        self.rate_limited = 0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            while self._active >= self.limit:
+                await self._condition.wait()
+            self._active += 1
+            pause = self._pause_until - loop.time()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+    async def release(self):
+        async with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    async def on_success(self):
+        async with self._condition:
+            self._successes += 1
+            if self._successes >= self.increase_after and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify_all()
+
+    async def on_rate_limit(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Сокращает параллельность и назначает общую паузу. Возвращает длительность паузы.
+        """
+        delay = retry_after or min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        delay *= random.uniform(1.0, 1.5)
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            self.rate_limited += 1
+            self._successes = 0
+            # Пачка отказов на уже запущенные вызовы снижает параллельность только один раз
+            if loop.time() >= self._pause_until:
+                self.limit = max(1, self.limit // 2)
+            self._pause_until = max(self._pause_until, loop.time() + delay)
+        return delay
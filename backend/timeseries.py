@@ -0,0 +1,78 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+VALID_BUCKETS = ['day', 'week', 'month']
+
+# Агрегаты по корзине времени: имя -> SQL-выражение для столбца
+AGGREGATIONS = {
+    'mean': "AVG({column})",
+    'count': "COUNT({column})",
+    'std': "stddev_samp({column})",
+    'p50': "percentile_cont(0.5) WITHIN GROUP (ORDER BY {column})",
+    'p90': "percentile_cont(0.9) WITHIN GROUP (ORDER BY {column})",
+}
+
+
+def aggregation_key(characteristic: str, aggregation: str) -> str:
+    """
+    Имя столбца в ответе: среднее сохраняет имя характеристики,
+    чтобы клиенты, читающие data[characteristic], работали без изменений.
+    """
+    return characteristic if aggregation == 'mean' else f"{characteristic}_{aggregation}"
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: выбирает threshold точек ряда, сохраняя его форму.
+    Возвращает индексы выбранных точек (первая и последняя точки всегда сохраняются).
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    every = (n - 2) / (threshold - 2)
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        next_start = range_end
+        next_end = min(int((i + 2) * every) + 1, n)
+
+        next_y = y[next_start:next_end]
+        avg_x = x[next_start:next_end].mean()
+        avg_y = np.nanmean(next_y) if not np.isnan(next_y).all() else y[a]
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[range_start:range_end] - y[a])
+            - (x[a] - x[range_start:range_end]) * (avg_y - y[a])
+        )
+        # Точки с пропущенным значением (NULL) выбираются только если других нет
+        area = np.where(np.isnan(area), -1.0, area)
+        a = range_start + int(area.argmax())
+        indices[i + 1] = a
+
+    return indices
+
+
+def downsample(timeseries: Dict[str, List[Any]], value_key: str, max_points: Optional[int]) -> Dict[str, List[Any]]:
+    """
+    Прореживает ряд {test_datetime: [...], столбец: [...]} до max_points точек методом LTTB.
+    Форма выбирается по столбцу value_key, остальные столбцы берутся по тем же индексам.
+    """
+    datetimes = timeseries.get('test_datetime', [])
+    if not max_points or len(datetimes) <= max_points:
+        return timeseries
+
+    x = np.fromiter((dt.timestamp() for dt in datetimes), dtype=float, count=len(datetimes))
+    y = np.array([np.nan if value is None else value for value in timeseries[value_key]], dtype=float)
+    indices = lttb_indices(x, y, max_points)
+
+    return {key: [values[i] for i in indices] for key, values in timeseries.items()}
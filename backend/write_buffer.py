@@ -0,0 +1,350 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from histogram import Histogram
+
+# Границы корзин гистограммы длительности сброса, миллисекунды
+FLUSH_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class WriteBehindBuffer:
+    """
+    Буфер отложенной записи: записи копятся в памяти и сбрасываются функцией flush пачкой
+    (одной транзакцией), когда набралось max_records записей или прошло max_delay секунд.
+
+    - каждая запись до подтверждения добавляется в файл-сегмент в spill_dir (JSON-строка,
+      fsync при fsync=True), поэтому после аварийного завершения несохраненные записи
+      восстанавливаются при следующем запуске (start);
+    - сегмент удаляется только после успешного flush; если пачка не записалась, она делится
+      пополам до отдельных записей, и остальные записи сохраняются. Запись, которая не сохраняется
+      и по отдельности, когда другие записи этого сброса сохранились, считается отклоненной и
+      переносится в файл deadletter-*.jsonl в spill_dir. Если не сохранилось ничего (например,
+      БД недоступна), все записи возвращаются в буфер и повторяются при следующем сбросе;
+    - в буфере (вместе со сбрасываемой пачкой) не больше max_pending записей: add ждет,
+      пока сброс освободит место, и через add_timeout секунд выбрасывает TimeoutError;
+    - гарантия "хотя бы один раз": падение между фиксацией транзакции и удалением сегмента
+      приведет к повторной вставке этих записей;
+    - flush(records) возвращает None при ошибке и любое другое значение при успехе.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[Dict[str, Any]]], Any],
+        spill_dir: str,
+        max_records: int = 200,
+        max_delay: float = 0.5,
+        fsync: bool = True,
+        enabled: bool = True,
+        max_pending: int = 10000,
+        add_timeout: float = 10.0
+    ):
+        self.flush_func = flush
+        self.spill_dir = spill_dir
+        self.max_records = max_records
+        self.max_delay = max_delay
+        self.fsync = fsync
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self.add_timeout = add_timeout
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._space = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._inflight = 0
+        self._segments: List[str] = []
+        self._segment_path: Optional[str] = None
+        self._segment = None
+        self._first_added: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self._flush_ms = Histogram(FLUSH_BUCKETS_MS)
+        self._flushes = 0
+        self._flushed_records = 0
+        self._failures = 0
+        self._recovered = 0
+        self._max_depth = 0
+        self._dead_lettered = 0
+        self._backpressure_waits = 0
+
+    @classmethod
+    def from_env(cls, flush: Callable[[List[Dict[str, Any]]], Any]) -> "WriteBehindBuffer":
+        return cls(
+            flush,
+            spill_dir=os.getenv('WRITE_BUFFER_DIR', 'write_buffer'),
+            max_records=int(os.getenv('WRITE_BUFFER_MAX_RECORDS', 200)),
+            max_delay=float(os.getenv('WRITE_BUFFER_MAX_DELAY_MS', 500)) / 1000,
+            fsync=os.getenv('WRITE_BUFFER_FSYNC', '1') != '0',
+            enabled=os.getenv('WRITE_BUFFER', '0') == '1',
+            max_pending=int(os.getenv('WRITE_BUFFER_MAX_PENDING', 10000)),
+            add_timeout=float(os.getenv('WRITE_BUFFER_ADD_TIMEOUT_MS', 10000)) / 1000,
+        )
+
+    def _open_segment(self):
+        # Вызывается под блокировкой
+        self._segment_path = os.path.join(self.spill_dir, f"segment-{time.time_ns()}.jsonl")
+        self._segment = open(self._segment_path, 'a', encoding='utf-8')
+
+    def _close_segment(self) -> Optional[str]:
+        # Вызывается под блокировкой; пустой сегмент сразу удаляется
+        if self._segment is None:
+            return None
+        path = self._segment_path
+        empty = self._segment.tell() == 0
+        self._segment.close()
+        self._segment = None
+        self._segment_path = None
+        if empty:
+            os.remove(path)
+            return None
+        return path
+
+    def _write_file(self, prefix: str, records: List[Dict[str, Any]]) -> str:
+        path = os.path.join(self.spill_dir, f"{prefix}-{time.time_ns()}.jsonl")
+        with open(path, 'a', encoding='utf-8') as output:
+            for record in records:
+                output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            output.flush()
+            if self.fsync:
+                os.fsync(output.fileno())
+        return path
+
+    def start(self):
+        """
+        Восстанавливает записи из сегментов, оставшихся от прошлого запуска,
+        и запускает фоновый поток сброса.
+        """
+        if not self.enabled or self._thread is not None:
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with self._lock:
+            for path in sorted(glob.glob(os.path.join(self.spill_dir, 'segment-*.jsonl'))):
+                with open(path, encoding='utf-8') as segment:
+                    for line in segment:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            self._pending.append(json.loads(line))
+                            self._recovered += 1
+                        except json.JSONDecodeError:
+                            # Последняя строка могла быть дописана не полностью
+                            logging.warning(f"Пропущена поврежденная запись в {path}")
+                self._segments.append(path)
+            if self._pending:
+                self._first_added = time.monotonic()
+                logging.info(f"Восстановлено записей из буфера на диске: {self._recovered}")
+            self._open_segment()
+            self._stopping = False
+        self._thread = threading.Thread(target=self._loop, name='write-buffer', daemon=True)
+        self._thread.start()
+
+    def add(self, record: Dict[str, Any]):
+        """
+        Добавляет запись: сначала в сегмент на диске, затем в буфер в памяти.
+        Если буфер заполнен (max_pending), ждет сброса не дольше add_timeout секунд.
+        """
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._segment is not None and self._depth() >= self.max_pending:
+                self._backpressure_waits += 1
+                deadline = time.monotonic() + self.add_timeout
+                while self._segment is not None and self._depth() >= self.max_pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"Буфер записи заполнен: {self._depth()} записей ожидают сброса")
+                    self._wakeup.notify()
+                    self._space.wait(remaining)
+            buffered = self._segment is not None
+            if buffered:
+                self._segment.write(line)
+                self._segment.flush()
+                if self.fsync:
+                    os.fsync(self._segment.fileno())
+                self._pending.append(record)
+                self._max_depth = max(self._max_depth, len(self._pending))
+                if self._first_added is None:
+                    self._first_added = time.monotonic()
+                if len(self._pending) >= self.max_records:
+                    self._wakeup.notify()
+        if not buffered:
+            # Буфер не запущен или уже остановлен - запись сохраняется сразу
+            self.flush_func([record])
+
+    def is_full(self) -> bool:
+        """
+        Заполнен ли буфер: add будет ждать сброса (и может не дождаться за add_timeout).
+        """
+        with self._lock:
+            return self._segment is not None and self._depth() >= self.max_pending
+
+    def _depth(self) -> int:
+        # Вызывается под блокировкой
+        return len(self._pending) + self._inflight
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                while not self._stopping:
+                    if len(self._pending) >= self.max_records:
+                        break
+                    if self._first_added is not None:
+                        remaining = self._first_added + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._wakeup.wait(remaining)
+                    else:
+                        self._wakeup.wait()
+                if self._stopping:
+                    return
+            if not self.flush():
+                time.sleep(self.max_delay)
+
+    def _write(self, records: List[Dict[str, Any]]):
+        """
+        Записывает пачку, при ошибке делит ее пополам вплоть до отдельных записей.
+        Возвращает (число сохраненных, отклоненные записи, записи для повтора).
+        Деление прекращается, если подряд не удалось слишком много попыток (БД, скорее всего,
+        недоступна); тогда и записи, не сохранившиеся по отдельности, оставляются для повтора.
+        """
+        limit = 2 * len(records).bit_length() + 2
+        committed = 0
+        misses = 0
+        failed: List[Dict[str, Any]] = []
+        retry: List[Dict[str, Any]] = []
+
+        def attempt(part: List[Dict[str, Any]]):
+            nonlocal committed, misses
+            if misses > limit:
+                retry.extend(part)
+                return
+            try:
+                result = self.flush_func(part)
+            except Exception as e:
+                logging.error(f"Ошибка сброса буфера записи: {e}")
+                result = None
+            if result is not None:
+                committed += len(part)
+                misses = 0
+                return
+            misses += 1
+            if len(part) == 1:
+                failed.append(part[0])
+                return
+            middle = len(part) // 2
+            attempt(part[:middle])
+            attempt(part[middle:])
+
+        attempt(records)
+        if committed and misses <= limit:
+            return committed, failed, retry
+        # Не сохранившиеся по отдельности записи ставятся в конец, чтобы следующий сброс
+        # начинался с других записей
+        return committed, [], retry + failed
+
+    def flush(self) -> bool:
+        """
+        Сбрасывает накопленные записи одной пачкой. Возвращает False, если сохранены не все
+        записи (кроме отклоненных).
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                records = self._pending
+                segments = self._segments
+                closed = self._close_segment()
+                if closed:
+                    segments.append(closed)
+                self._pending = []
+                self._segments = []
+                self._inflight = len(records)
+                self._first_added = None
+                if not self._stopping:
+                    self._open_segment()
+
+            started = time.perf_counter()
+            committed, rejected, retry = self._write(records)
+            took_ms = (time.perf_counter() - started) * 1000
+
+            if committed:
+                # Оставшиеся записи переписываются в новый сегмент до удаления старых
+                if retry:
+                    retry_segments = [self._write_file('segment', retry)]
+                else:
+                    retry_segments = []
+                if rejected:
+                    path = self._write_file('deadletter', rejected)
+                    logging.error(f"Записей отклонено при сбросе буфера: {len(rejected)}, сохранены в {path}")
+                for path in segments:
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        logging.warning(f"Не удалось удалить сегмент буфера {path}: {e}")
+                segments = retry_segments
+
+            with self._lock:
+                self._flush_ms.observe(took_ms)
+                self._inflight = 0
+                self._space.notify_all()
+                if committed:
+                    self._flushes += 1
+                    self._flushed_records += committed
+                    self._dead_lettered += len(rejected)
+                if retry:
+                    # Записи и их сегменты возвращаются в начало буфера, повтор - через max_delay
+                    self._failures += 1
+                    self._pending = retry + self._pending
+                    self._segments = segments + self._segments
+                    self._first_added = time.monotonic()
+                    return False
+            return True
+
+    def close(self, timeout: float = 30.0):
+        """
+        Останавливает поток и сбрасывает оставшиеся записи. Если БД недоступна,
+        записи остаются в сегментах на диске и будут восстановлены при следующем запуске.
+        """
+        if self._thread is None:
+            return
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        self._thread.join(timeout)
+        self._thread = None
+        with self._lock:
+            self._space.notify_all()
+        deadline = time.monotonic() + timeout
+        while not self.flush() and time.monotonic() < deadline:
+            time.sleep(min(self.max_delay, 1.0))
+        with self._lock:
+            closed = self._close_segment()
+            if closed:
+                self._segments.append(closed)
+            self._space.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_records": self.max_records,
+                "max_delay_ms": self.max_delay * 1000,
+                "depth": len(self._pending),
+                "max_depth": self._max_depth,
+                "max_pending": self.max_pending,
+                "backpressure_waits": self._backpressure_waits,
+                "flushes": self._flushes,
+                "flushed_records": self._flushed_records,
+                "failures": self._failures,
+                "recovered": self._recovered,
+                "dead_lettered": self._dead_lettered,
+                "spill_segments": len(self._segments) + (1 if self._segment is not None else 0),
+                "flush_ms": self._flush_ms.snapshot(),
+            }
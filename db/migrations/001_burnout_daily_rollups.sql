@@ -0,0 +1,54 @@
+-- Ежедневные агрегаты тестов по отделу, городу, должности и возрастной группе.
+-- Для каждой метрики MBI хранятся количество, сумма и сумма квадратов значений,
+-- из которых получаются среднее, количество и стандартное отклонение за любой период.
+-- Таблица обновляется инкрементально в save_burnout_test_result.
+
+CREATE TABLE IF NOT EXISTS burnout_daily_rollups (
+    day DATE NOT NULL,
+    department VARCHAR(100) NOT NULL DEFAULT '',
+    city VARCHAR(100) NOT NULL DEFAULT '',
+    position VARCHAR(255) NOT NULL DEFAULT '',
+    age_band INT NOT NULL DEFAULT -1,           -- Нижняя граница 5-летней возрастной группы, -1 если возраст неизвестен
+    tests_count INT NOT NULL DEFAULT 0,
+    exhaustion_count INT NOT NULL DEFAULT 0,
+    exhaustion_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    exhaustion_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    depersonalization_count INT NOT NULL DEFAULT 0,
+    depersonalization_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    depersonalization_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    achievement_count INT NOT NULL DEFAULT 0,
+    achievement_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    achievement_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    burnout_score_count INT NOT NULL DEFAULT 0,
+    burnout_score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    burnout_score_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    mean_reaction_time_ms_count INT NOT NULL DEFAULT 0,
+    mean_reaction_time_ms_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    mean_reaction_time_ms_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, department, city, position, age_band)
+);
+
+-- Заполнение по уже накопленным тестам
+INSERT INTO burnout_daily_rollups (
+    day, department, city, position, age_band, tests_count,
+    exhaustion_count, exhaustion_sum, exhaustion_sumsq,
+    depersonalization_count, depersonalization_sum, depersonalization_sumsq,
+    achievement_count, achievement_sum, achievement_sumsq,
+    burnout_score_count, burnout_score_sum, burnout_score_sumsq,
+    mean_reaction_time_ms_count, mean_reaction_time_ms_sum, mean_reaction_time_ms_sumsq
+)
+SELECT
+    b.test_datetime::date,
+    COALESCE(e.department, ''),
+    COALESCE(e.city, ''),
+    COALESCE(e.position, ''),
+    COALESCE(e.age / 5 * 5, -1),
+    COUNT(*),
+    COUNT(b.exhaustion), COALESCE(SUM(b.exhaustion), 0), COALESCE(SUM(b.exhaustion::float * b.exhaustion), 0),
+    COUNT(b.depersonalization), COALESCE(SUM(b.depersonalization), 0), COALESCE(SUM(b.depersonalization::float * b.depersonalization), 0),
+    COUNT(b.achievement), COALESCE(SUM(b.achievement), 0), COALESCE(SUM(b.achievement::float * b.achievement), 0),
+    COUNT(b.burnout_score), COALESCE(SUM(b.burnout_score), 0), COALESCE(SUM(b.burnout_score::float * b.burnout_score), 0),
+    COUNT(b.mean_reaction_time_ms), COALESCE(SUM(b.mean_reaction_time_ms), 0), COALESCE(SUM(b.mean_reaction_time_ms::float * b.mean_reaction_time_ms), 0)
+FROM burnout_tests b JOIN employees e ON b.user_id = e.id
+GROUP BY 1, 2, 3, 4, 5
+ON CONFLICT (day, department, city, position, age_band) DO NOTHING;
@@ -0,0 +1,26 @@
+-- Индексы под горячие запросы backend/db_utils.py.
+-- Проверка планов: python -m benchmarks.check_query_plans (из каталога backend).
+
+-- Последние N тестов и средние по пользователю (get_user_burnout_stats, get_user_statistics),
+-- личный график (get_burnout_timeseries с user_id). INCLUDE позволяет читать метрики из индекса.
+CREATE INDEX IF NOT EXISTS idx_burnout_tests_user_datetime
+    ON burnout_tests (user_id, test_datetime DESC)
+    INCLUDE (exhaustion, depersonalization, achievement, burnout_score, mean_reaction_time_ms);
+
+-- Диапазон дат в get_burnout_timeseries
+CREATE INDEX IF NOT EXISTS idx_burnout_tests_datetime
+    ON burnout_tests (test_datetime)
+    INCLUDE (user_id, exhaustion, depersonalization, achievement, burnout_score, mean_reaction_time_ms);
+
+-- Фильтры дашборда и списки значений для выпадающих списков (SELECT DISTINCT)
+CREATE INDEX IF NOT EXISTS idx_employees_department ON employees (department) INCLUDE (id, age);
+CREATE INDEX IF NOT EXISTS idx_employees_city ON employees (city) INCLUDE (id, age);
+CREATE INDEX IF NOT EXISTS idx_employees_position ON employees (position) INCLUDE (id, age);
+
+-- Авторизация (login_user)
+CREATE INDEX IF NOT EXISTS idx_employees_email ON employees (email);
+
+-- Агрегаты дашборда с фильтром по отделу, городу или должности
+CREATE INDEX IF NOT EXISTS idx_rollups_department_day ON burnout_daily_rollups (department, day);
+CREATE INDEX IF NOT EXISTS idx_rollups_city_day ON burnout_daily_rollups (city, day);
+CREATE INDEX IF NOT EXISTS idx_rollups_position_day ON burnout_daily_rollups (position, day);
@@ -0,0 +1,24 @@
+-- Очередь писем анализатора. Граф только добавляет письмо в очередь,
+-- доставкой занимается отдельный обработчик (statistic_analyzer/outbox.py):
+-- он забирает письма пачками, повторяет неудачные попытки с нарастающей паузой
+-- и оставляет запись о результате доставки.
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INT,                                        -- Сотрудник, которому адресовано письмо
+    recipient VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',      -- pending, sending, sent, failed
+    attempts INT NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT now(),   -- Не отправлять раньше (пауза между повторами)
+    locked_at TIMESTAMP,                                -- Когда обработчик забрал письмо на отправку
+    sent_at TIMESTAMP
+);
+
+-- Выборка очередной пачки писем к отправке
+CREATE INDEX IF NOT EXISTS idx_email_outbox_pending
+    ON email_outbox (next_attempt_at, id)
+    WHERE status IN ('pending', 'sending');
@@ -0,0 +1,12 @@
+-- Контрольные точки массового анализа: для каждого сотрудника хранится,
+-- на каких данных был сделан последний анализ. Следующий прогон анализирует
+-- только сотрудников с изменившимися данными, а прерванный прогон продолжается
+-- с тех, для кого контрольной точки еще нет.
+
+CREATE TABLE IF NOT EXISTS analyzer_checkpoints (
+    user_id INT PRIMARY KEY,
+    last_test_id INT,                           -- Последний тест, учтенный в анализе
+    input_hash CHAR(64) NOT NULL,               -- SHA-256 входных данных анализа
+    necessity BOOLEAN,                          -- Вердикт LLM: нужно ли пройти тест
+    analyzed_at TIMESTAMP NOT NULL DEFAULT now()
+);
@@ -0,0 +1,10 @@
+-- Попытки теста на скорость реакции и метрики, посчитанные по ним на сервере (backend/reaction_analysis.py).
+-- reaction_trials - время каждой попытки, мс, упакованное float32 little-endian (4 байта на попытку).
+-- reaction_metrics_version - версия формул; устаревшие записи пересчитывает python reaction_analysis.py.
+ALTER TABLE burnout_tests
+    ADD COLUMN IF NOT EXISTS reaction_trials BYTEA,
+    ADD COLUMN IF NOT EXISTS reaction_trimmed_mean_ms REAL,
+    ADD COLUMN IF NOT EXISTS reaction_sd_ms REAL,
+    ADD COLUMN IF NOT EXISTS reaction_fatigue_slope_ms REAL,
+    ADD COLUMN IF NOT EXISTS reaction_lapses SMALLINT,
+    ADD COLUMN IF NOT EXISTS reaction_metrics_version SMALLINT;
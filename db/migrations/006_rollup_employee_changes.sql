@@ -0,0 +1,119 @@
+-- Агрегаты burnout_daily_rollups считаются по текущим атрибутам сотрудника (отдел, город, должность,
+-- возрастная группа), как и запросы по сырым тестам (JOIN employees). При изменении этих атрибутов
+-- вклад тестов сотрудника переносится из строк со старыми атрибутами в строки с новыми:
+-- количество, сумма и сумма квадратов аддитивны, поэтому перенос точный.
+
+CREATE OR REPLACE FUNCTION move_employee_rollups() RETURNS trigger AS $$
+BEGIN
+    -- Вклад тестов сотрудника по дням; таблица общая для всех строк одного UPDATE
+    IF to_regclass('pg_temp.employee_rollup_delta') IS NULL THEN
+        CREATE TEMP TABLE employee_rollup_delta (LIKE burnout_daily_rollups INCLUDING DEFAULTS) ON COMMIT DROP;
+    ELSE
+        TRUNCATE employee_rollup_delta;
+    END IF;
+
+    INSERT INTO employee_rollup_delta (
+        day, tests_count,
+        exhaustion_count, exhaustion_sum, exhaustion_sumsq,
+        depersonalization_count, depersonalization_sum, depersonalization_sumsq,
+        achievement_count, achievement_sum, achievement_sumsq,
+        burnout_score_count, burnout_score_sum, burnout_score_sumsq,
+        mean_reaction_time_ms_count, mean_reaction_time_ms_sum, mean_reaction_time_ms_sumsq
+    )
+    SELECT
+        b.test_datetime::date,
+        COUNT(*),
+        COUNT(b.exhaustion), COALESCE(SUM(b.exhaustion), 0), COALESCE(SUM(b.exhaustion::float * b.exhaustion), 0),
+        COUNT(b.depersonalization), COALESCE(SUM(b.depersonalization), 0), COALESCE(SUM(b.depersonalization::float * b.depersonalization), 0),
+        COUNT(b.achievement), COALESCE(SUM(b.achievement), 0), COALESCE(SUM(b.achievement::float * b.achievement), 0),
+        COUNT(b.burnout_score), COALESCE(SUM(b.burnout_score), 0), COALESCE(SUM(b.burnout_score::float * b.burnout_score), 0),
+        COUNT(b.mean_reaction_time_ms), COALESCE(SUM(b.mean_reaction_time_ms), 0), COALESCE(SUM(b.mean_reaction_time_ms::float * b.mean_reaction_time_ms), 0)
+    FROM burnout_tests b
+    WHERE b.user_id = NEW.id
+    GROUP BY 1;
+
+    -- Вычитание из строк со старыми атрибутами
+    UPDATE burnout_daily_rollups r SET
+        tests_count = r.tests_count - d.tests_count,
+        exhaustion_count = r.exhaustion_count - d.exhaustion_count,
+        exhaustion_sum = r.exhaustion_sum - d.exhaustion_sum,
+        exhaustion_sumsq = r.exhaustion_sumsq - d.exhaustion_sumsq,
+        depersonalization_count = r.depersonalization_count - d.depersonalization_count,
+        depersonalization_sum = r.depersonalization_sum - d.depersonalization_sum,
+        depersonalization_sumsq = r.depersonalization_sumsq - d.depersonalization_sumsq,
+        achievement_count = r.achievement_count - d.achievement_count,
+        achievement_sum = r.achievement_sum - d.achievement_sum,
+        achievement_sumsq = r.achievement_sumsq - d.achievement_sumsq,
+        burnout_score_count = r.burnout_score_count - d.burnout_score_count,
+        burnout_score_sum = r.burnout_score_sum - d.burnout_score_sum,
+        burnout_score_sumsq = r.burnout_score_sumsq - d.burnout_score_sumsq,
+        mean_reaction_time_ms_count = r.mean_reaction_time_ms_count - d.mean_reaction_time_ms_count,
+        mean_reaction_time_ms_sum = r.mean_reaction_time_ms_sum - d.mean_reaction_time_ms_sum,
+        mean_reaction_time_ms_sumsq = r.mean_reaction_time_ms_sumsq - d.mean_reaction_time_ms_sumsq
+    FROM employee_rollup_delta d
+    WHERE r.day = d.day
+      AND r.department = COALESCE(OLD.department, '')
+      AND r.city = COALESCE(OLD.city, '')
+      AND r.position = COALESCE(OLD.position, '')
+      AND r.age_band = COALESCE(OLD.age / 5 * 5, -1);
+
+    DELETE FROM burnout_daily_rollups r
+    USING employee_rollup_delta d
+    WHERE r.day = d.day
+      AND r.department = COALESCE(OLD.department, '')
+      AND r.city = COALESCE(OLD.city, '')
+      AND r.position = COALESCE(OLD.position, '')
+      AND r.age_band = COALESCE(OLD.age / 5 * 5, -1)
+      AND r.tests_count <= 0;
+
+    -- Добавление в строки с новыми атрибутами
+    INSERT INTO burnout_daily_rollups (
+        day, department, city, position, age_band, tests_count,
+        exhaustion_count, exhaustion_sum, exhaustion_sumsq,
+        depersonalization_count, depersonalization_sum, depersonalization_sumsq,
+        achievement_count, achievement_sum, achievement_sumsq,
+        burnout_score_count, burnout_score_sum, burnout_score_sumsq,
+        mean_reaction_time_ms_count, mean_reaction_time_ms_sum, mean_reaction_time_ms_sumsq
+    )
+    SELECT
+        d.day, COALESCE(NEW.department, ''), COALESCE(NEW.city, ''), COALESCE(NEW.position, ''),
+        COALESCE(NEW.age / 5 * 5, -1), d.tests_count,
+        d.exhaustion_count, d.exhaustion_sum, d.exhaustion_sumsq,
+        d.depersonalization_count, d.depersonalization_sum, d.depersonalization_sumsq,
+        d.achievement_count, d.achievement_sum, d.achievement_sumsq,
+        d.burnout_score_count, d.burnout_score_sum, d.burnout_score_sumsq,
+        d.mean_reaction_time_ms_count, d.mean_reaction_time_ms_sum, d.mean_reaction_time_ms_sumsq
+    FROM employee_rollup_delta d
+    ON CONFLICT (day, department, city, position, age_band) DO UPDATE SET
+        tests_count = burnout_daily_rollups.tests_count + EXCLUDED.tests_count,
+        exhaustion_count = burnout_daily_rollups.exhaustion_count + EXCLUDED.exhaustion_count,
+        exhaustion_sum = burnout_daily_rollups.exhaustion_sum + EXCLUDED.exhaustion_sum,
+        exhaustion_sumsq = burnout_daily_rollups.exhaustion_sumsq + EXCLUDED.exhaustion_sumsq,
+        depersonalization_count = burnout_daily_rollups.depersonalization_count + EXCLUDED.depersonalization_count,
+        depersonalization_sum = burnout_daily_rollups.depersonalization_sum + EXCLUDED.depersonalization_sum,
+        depersonalization_sumsq = burnout_daily_rollups.depersonalization_sumsq + EXCLUDED.depersonalization_sumsq,
+        achievement_count = burnout_daily_rollups.achievement_count + EXCLUDED.achievement_count,
+        achievement_sum = burnout_daily_rollups.achievement_sum + EXCLUDED.achievement_sum,
+        achievement_sumsq = burnout_daily_rollups.achievement_sumsq + EXCLUDED.achievement_sumsq,
+        burnout_score_count = burnout_daily_rollups.burnout_score_count + EXCLUDED.burnout_score_count,
+        burnout_score_sum = burnout_daily_rollups.burnout_score_sum + EXCLUDED.burnout_score_sum,
+        burnout_score_sumsq = burnout_daily_rollups.burnout_score_sumsq + EXCLUDED.burnout_score_sumsq,
+        mean_reaction_time_ms_count = burnout_daily_rollups.mean_reaction_time_ms_count + EXCLUDED.mean_reaction_time_ms_count,
+        mean_reaction_time_ms_sum = burnout_daily_rollups.mean_reaction_time_ms_sum + EXCLUDED.mean_reaction_time_ms_sum,
+        mean_reaction_time_ms_sumsq = burnout_daily_rollups.mean_reaction_time_ms_sumsq + EXCLUDED.mean_reaction_time_ms_sumsq;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS employees_move_rollups ON employees;
+CREATE TRIGGER employees_move_rollups
+    AFTER UPDATE OF department, city, position, age ON employees
+    FOR EACH ROW
+    WHEN (
+        OLD.department IS DISTINCT FROM NEW.department
+        OR OLD.city IS DISTINCT FROM NEW.city
+        OR OLD.position IS DISTINCT FROM NEW.position
+        OR (OLD.age / 5) IS DISTINCT FROM (NEW.age / 5)
+    )
+    EXECUTE FUNCTION move_employee_rollups();
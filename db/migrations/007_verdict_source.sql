@@ -0,0 +1,9 @@
+-- Источник вердикта в llm_burnout_verdict: 'rule' - триаж по правилам (backend/graph/triage.py),
+-- 'llm' - ответ модели. Оценка порогов триажа (benchmarks/eval_triage.py) сравнивает правила
+-- только с вердиктами модели, иначе согласованность завышается сравнением правил с самими собой.
+ALTER TABLE burnout_tests
+    ADD COLUMN IF NOT EXISTS verdict_source VARCHAR(10) CHECK (verdict_source IN ('rule', 'llm'));
+
+-- Вердикты, сохраненные до появления столбца, считаются ответами модели
+UPDATE burnout_tests SET verdict_source = 'llm'
+WHERE llm_burnout_verdict IS NOT NULL AND verdict_source IS NULL;
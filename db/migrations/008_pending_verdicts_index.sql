@@ -0,0 +1,5 @@
+-- Тесты без вердикта для периодической повторной обработки (get_tests_without_verdict):
+-- частичный индекс остается маленьким, потому что почти у всех тестов вердикт есть.
+CREATE INDEX IF NOT EXISTS idx_burnout_tests_pending_verdict
+    ON burnout_tests (id)
+    WHERE llm_burnout_verdict IS NULL;
@@ -0,0 +1,4 @@
+-- idx_employees_id_filters (employees(id) INCLUDE city, position, department, age) дублировал
+-- первичный ключ: employees мала, и соединение с burnout_tests идет по employees_pkey или
+-- последовательным сканом employees с хеш-соединением. Индекс удаляется из БД, где 002 уже применена.
+DROP INDEX IF EXISTS idx_employees_id_filters;
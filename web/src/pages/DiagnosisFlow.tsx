@@ -24,6 +24,70 @@ const getBurnoutLevelTag = (level: number) => {
   return { value: 'Высокий', severity: 'danger' as const };
 };
 
+const API_URL = 'http://localhost:8000';
+
+// Ждет завершения фонового задания: сначала через SSE, при ошибке соединения - опросом статуса
+const waitForJob = (jobId: string): Promise<any> => new Promise((resolve, reject) => {
+  const poll = async () => {
+    try {
+      const response = await fetch(`${API_URL}/api/jobs/${jobId}`);
+      if (!response.ok) {
+        throw new Error(`Ошибка ${response.status}: ${await response.text()}`);
+      }
+      const job = await response.json();
+      if (job.status === 'done' || job.status === 'failed') {
+        resolve(job);
+      } else {
+        setTimeout(poll, 2000);
+      }
+    } catch (error) {
+      reject(error);
+    }
+  };
+
+  if (typeof EventSource === 'undefined') {
+    poll();
+    return;
+  }
+
+  const events = new EventSource(`${API_URL}/api/jobs/${jobId}/events`);
+  events.addEventListener('result', (event) => {
+    events.close();
+    resolve(JSON.parse((event as MessageEvent).data));
+  });
+  events.onerror = () => {
+    events.close();
+    poll();
+  };
+});
+
+// Читает ответ /api/submit_results/stream (Server-Sent Events) и вызывает onEvent для каждого события
+const readEventStream = async (response: Response, onEvent: (event: string, data: any) => void) => {
+  const reader = response.body!.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let separator;
+    while ((separator = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, separator);
+      buffer = buffer.slice(separator + 2);
+
+      let event = 'message';
+      let data = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+};
+
 export function DiagnosisFlow({ userId, onComplete }: DiagnosisFlowProps) {
   const [step, setStep] = useState<'maslach' | 'reaction' | 'results'>('maslach');
   const toast = useRef<Toast>(null);
@@ -94,7 +158,7 @@ export function DiagnosisFlow({ userId, onComplete }: DiagnosisFlowProps) {
             user_id: userId
           };
 
-          const response = await fetch('http://localhost:8000/api/submit_results', {
+          const response = await fetch(`${API_URL}/api/submit_results/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(payload),
@@ -105,7 +169,33 @@ export function DiagnosisFlow({ userId, onComplete }: DiagnosisFlowProps) {
             throw new Error(`Ошибка ${response.status}: ${errorText}`);
           }
 
-          const responseData = await response.json();
+          // Рекомендация показывается по мере генерации; если поток оборвался,
+          // итог задания дочитывается через /api/jobs
+          let jobId = null as string | null;
+          let streamed = '';
+          let responseData: any = null;
+          try {
+            await readEventStream(response, (event, data) => {
+              if (event === 'job') {
+                jobId = data.job_id;
+              } else if (event === 'token') {
+                streamed += data.text;
+                setRecommendation(streamed);
+              } else if (event === 'done') {
+                responseData = data;
+              }
+            });
+          } catch (streamError) {
+            if (!jobId) throw streamError;
+            console.warn("Поток рекомендаций прерван, ожидаем завершения задания", streamError);
+          }
+          if (!responseData) {
+            if (!jobId) throw new Error('Сервер не вернул идентификатор задания');
+            responseData = await waitForJob(jobId);
+          }
+          if (responseData.status === 'failed') {
+            throw new Error(responseData.detail || 'Задание завершилось с ошибкой');
+          }
 
           // 1. Показываем простой тост об успехе
           toast.current?.show({
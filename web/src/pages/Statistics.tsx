@@ -46,6 +46,9 @@ interface Position {
     name: string;
 }
 
+// Бюджет точек графика: сервер прореживает ряд под ширину экрана
+const getPointBudget = () => Math.max(100, Math.round(window.innerWidth / 2));
+
 const characteristicOptions = [
     { label: 'Уровень выгорания', value: 'burnout_score' },
     { label: 'Эмоциональное истощение', value: 'exhaustion' },
@@ -142,6 +145,7 @@ export const Statistics: React.FC<StatisticsProps> = ({ user }) => {
                 user_id: user.id,
                 start_date: personalStartDate.toISOString().split('T')[0],
                 end_date: personalEndDate.toISOString().split('T')[0],
+                max_points: getPointBudget(),
             };
 
             const response = await fetch('http://localhost:8000/api/get_timeseries', {
@@ -200,7 +204,9 @@ export const Statistics: React.FC<StatisticsProps> = ({ user }) => {
                 end_date: generalEndDate.toISOString().split('T')[0],
                 cities: selectedCities.length > 0 ? selectedCities : undefined,
                 departments: selectedDepartments.length > 0 ? selectedDepartments : undefined,
-                positions: selectedPositions.length > 0 ? selectedPositions : undefined
+                positions: selectedPositions.length > 0 ? selectedPositions : undefined,
+                bucket: 'day',
+                max_points: getPointBudget()
             };
 
             const response = await fetch('http://localhost:8000/api/get_timeseries', {